@@ -5,72 +5,70 @@ Created on Thu Jun 26 14:57:04 2025
 @author: Sri.Sakthivel
 """
 import can
-from datetime import datetime
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
+import step_result
 
 # Battery SOC and Pack Voltage CAN ID (in hex)
 BATTERY_SOC_CAN_ID = 0x775
+STATE_OF_CHARGE = can_signals.message("BMS_StateOfCharge")
+
+# Listened for in the shared passive window (see frame_fanout); the SOC is the
+# mean of up to SAMPLE_COUNT frames caught within the window
+RX_CAN_IDS = [BATTERY_SOC_CAN_ID]
+PASSIVE_WINDOW = 1
+SAMPLE_COUNT = 10
+PASSIVE_UNTIL = frame_fanout.samples(SAMPLE_COUNT)
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
 def parse_battery_soc(data):
-    try:
-        # BMS_SOC: Byte [7] (1 byte, scaled by 0.4%)
-        SOC = data[3] * 1
-        return SOC
-    except IndexError:
-        return None, None
+    # None for a frame too short to carry the SOC byte
+    return STATE_OF_CHARGE.decode_signal(data, "SOC")
+
+def measure_battery_soc(messages):
+    buffer, lengths = can_signals.sample_buffer(messages)
+    return can_signals.Measurement(STATE_OF_CHARGE.decode_samples("SOC", buffer, lengths))
 
-def Battery_SOC():
-    bus = setup_can_bus()
-    if not bus:
-        return False
+@step_result.test_step(inputs=("bus",), check=step_result.CHECK_LIMITS)
+def Battery_SOC(bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed(None)
     
     SOC = None
-    received_data_hex = "None"
-    received_data_dec = "None"
-    can_id = "None"
+    frame = can_frames.NO_FRAME
+    measurement = None
+    samples = []
     data_detected = False
 
     try:
-        start_time = datetime.now()
-        while (datetime.now() - start_time).seconds < 1:
-            msg = bus.recv(timeout=0.1)
-            if msg and msg.arbitration_id == BATTERY_SOC_CAN_ID:
-                can_id = hex(msg.arbitration_id)
-                received_data_hex = ' '.join(f"{byte:02X}" for byte in msg.data)
-                received_data_dec = ' '.join(str(byte) for byte in msg.data)
-                SOC = parse_battery_soc(msg.data)
-                if SOC is not None:
-                    data_detected = True
-                break
+        samples = frame_fanout.collect_samples("Battery_SOC", bus, RX_CAN_IDS, PASSIVE_WINDOW, PASSIVE_UNTIL)
+        if samples:
+            frame = can_frames.FrameRecord.from_message(samples[0])
+            measurement = measure_battery_soc(samples)
+            if measurement.count:
+                SOC = round(measurement.mean, 1)
+                data_detected = True
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
     finally:
-        bus.shutdown()
         status = "Passed" if data_detected else "Failed"
         print("Test_Sequence: Battery SOC")
-        print(f"Tx_Can_id: {can_id}")
-        print(f"Rx Hex_ID: {received_data_hex}")
-        print(f"Rx Dec_ID: {received_data_dec}")
+        print(f"Tx_Can_id: {frame:id}")
+        print(f"Rx Hex_ID: {frame:hex}")
+        print(f"Rx Dec_ID: {frame:dec}")
         print(f"BMS SOC: {SOC if SOC is not None else 'Not detected'} %")
+        if data_detected:
+            print(f"Samples: {measurement.count}")
+            print(f"BMS SOC Min/Max/Std: {measurement.min:g} / {measurement.max:g} / {measurement.std:.2f} %")
         print(f"Status: {status}")
-        return data_detected, SOC
+        return step_result.StepResult(data_detected, SOC, frames=map(can_frames.FrameRecord.from_message, samples))
 
 if __name__ == "__main__":
     result = Battery_SOC()
\ No newline at end of file
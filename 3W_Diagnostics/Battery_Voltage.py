@@ -4,82 +4,70 @@ Created on Wed Jul 02 12:04:00 2025
 @author: Sri.Sakthivel
 """
 import can
-from datetime import datetime
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
+import step_result
 
 # CAN ID (example from previous context)
 CAN_ID = 0x22
+PACK_VOLTAGE = can_signals.message("BMS_PackVoltage")
+
+# Listened for in the shared passive window (see frame_fanout); the voltage is
+# the mean of up to SAMPLE_COUNT frames caught within the window
+RX_CAN_IDS = [CAN_ID]
+PASSIVE_WINDOW = 1
+SAMPLE_COUNT = 10
+PASSIVE_UNTIL = frame_fanout.samples(SAMPLE_COUNT)
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
 def parse_battery_voltage(data):
-        # Convert hex to binary strings
-        Convert_2_byte = format(data[2], '08b')  # 4E (byte 3)
-        Convert_3_byte = format(data[3], '08b')  # 0C (byte 4)
-
-        # Extract last two bits of 4E
-        consider_last_2_bits = Convert_2_byte[-2:]  # e.g., '10' from '01001110'
-
-        # Combine last two bits of 4E with 0C to form 10 bits
-        combined_bits = consider_last_2_bits + Convert_3_byte  # e.g., '10' + '00001100' = '1000001100'
-        #print(f"Combined 10-bit Binary: {combined_bits}")
+    # Low 2 bits of byte 2 and all of byte 3, 0.1 V per bit (see signals.dbc)
+    return PACK_VOLTAGE.decode_signal(data, "PackVoltage")
 
-        # Convert 10-bit binary to decimal
-        result_dec = int(combined_bits, 2)
-        pack_voltage = result_dec * 0.1
-        return pack_voltage
+def measure_battery_voltage(messages):
+    buffer, lengths = can_signals.sample_buffer(messages)
+    return can_signals.Measurement(PACK_VOLTAGE.decode_samples("PackVoltage", buffer, lengths))
 
-def Battery_Voltage():
-    bus = setup_can_bus()
-    if not bus:
-        return False, None
+@step_result.test_step(inputs=("bus",), check=step_result.CHECK_LIMITS)
+def Battery_Voltage(bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed(None)
 
-    value = None
-    received_data_hex = "None"
-    received_data_dec = "None"
-    can_id = "None"
+    battery_pack_voltage = None
+    frame = can_frames.NO_FRAME
+    measurement = None
+    samples = []
     data_detected = False
 
     try:
-        start_time = datetime.now()
-        while (datetime.now() - start_time).seconds < 1:
-            msg = bus.recv(timeout=0.1)
-            if msg and msg.arbitration_id == CAN_ID:
-                can_id = hex(msg.arbitration_id)
-                received_data_hex = ' '.join(f"{byte:02X}" for byte in msg.data)
-                received_data_dec = ' '.join(str(byte) for byte in msg.data)
-                value = parse_battery_voltage(msg.data)
-                battery_pack_voltage=round(float(value),1)
-                if battery_pack_voltage is not None:
-                    data_detected = True
-                break
+        samples = frame_fanout.collect_samples("Battery_Voltage", bus, RX_CAN_IDS, PASSIVE_WINDOW, PASSIVE_UNTIL)
+        if samples:
+            frame = can_frames.FrameRecord.from_message(samples[0])
+            measurement = measure_battery_voltage(samples)
+            if measurement.count:
+                battery_pack_voltage = round(measurement.mean, 1)
+                data_detected = True
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
     finally:
-        bus.shutdown()
         status = "Passed" if data_detected else "Failed"
         print("Test_Sequence: Battery_Voltage")
-        print(f"Tx_Can_id: {can_id}")
-        print(f"Rx Hex_ID: {received_data_hex}")
-        print(f"Rx Dec_ID: {received_data_dec}")
+        print(f"Tx_Can_id: {frame:id}")
+        print(f"Rx Hex_ID: {frame:hex}")
+        print(f"Rx Dec_ID: {frame:dec}")
         print(f"Battery Pack Voltage: {battery_pack_voltage if battery_pack_voltage is not None else 'Not detected'} V")
+        if data_detected:
+            print(f"Samples: {measurement.count}")
+            print(f"Battery Pack Voltage Min/Max/Std: {measurement.min:g} / {measurement.max:g} / {measurement.std:.2f} V")
         print(f"Status: {status}")
-        return data_detected, battery_pack_voltage
+        return step_result.StepResult(data_detected, battery_pack_voltage, frames=map(can_frames.FrameRecord.from_message, samples))
 
 if __name__ == "__Battery_Voltage__":
     result = Battery_Voltage()
\ No newline at end of file
@@ -6,71 +6,59 @@ Created on Fri May 30 14:48:00 2025
 """
 
 import can
-import time
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
+import step_result
 
 # Cluster Firmware Version CAN ID (in hex)
 CLUSTER_FW_ID = 0x77C
+FIRMWARE_VERSION = can_signals.message("Cluster_FirmwareVersion")
+
+# Listened for in the shared passive window (see frame_fanout)
+RX_CAN_IDS = [CLUSTER_FW_ID]
+PASSIVE_WINDOW = 5
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
 def parse_version(data):
-    try:
-        dec_data = [str(byte) for byte in data[3:6]]
-        return f"{'.'.join(dec_data)}"
-    except IndexError:
+    version = FIRMWARE_VERSION.decode(data)
+    if None in version.values():
         return "Invalid data length"
+    return f"{version['Major']}.{version['Minor']}.{version['Patch']}"
 
-def Cluster_Version():
-    bus = setup_can_bus()
-    if not bus:
-        return False, None
+@step_result.test_step(inputs=("bus",), check=step_result.CHECK_VALUE)
+def Cluster_Version(bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed()
     
     version = None
-    received_data_hex = "None"
-    received_data_dec = "None"
-    can_id = "None"
+    frame = can_frames.NO_FRAME
     version_detected = False
 
     try:
-        start_time = time.time()
-        while (time.time() - start_time) < 5:
-            response = bus.recv(timeout=0.5)
-            if response and response.arbitration_id == CLUSTER_FW_ID:
-                can_id = hex(response.arbitration_id)
-                received_data_hex = ' '.join(f"{byte:02X}" for byte in response.data)
-                received_data_dec = ' '.join(str(byte) for byte in response.data)
-                version = parse_version(response.data)
-                if version != "Invalid data length":
-                    version_detected = True
-                break
+        response = frame_fanout.collect("Cluster_Version", bus, RX_CAN_IDS, PASSIVE_WINDOW).get(CLUSTER_FW_ID)
+        if response is not None:
+            frame = can_frames.FrameRecord.from_message(response)
+            version = parse_version(response.data)
+            if version != "Invalid data length":
+                version_detected = True
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
     finally:
-        bus.shutdown()
         status = "Passed" if version_detected else "Failed"
         print(f"Test Sequence: Cluster_Version")
-        print(f"Tx_Can_id: {can_id}")
-        print(f"Rx Hex: {received_data_hex}")
-        print(f"Rx Dec: {received_data_dec}")
+        print(f"Tx_Can_id: {frame:id}")
+        print(f"Rx Hex: {frame:hex}")
+        print(f"Rx Dec: {frame:dec}")
         print(f"Version: {version}")
         print(f"Status: {status}")
-        return version_detected, version
+        return step_result.StepResult(version_detected, version, frames=[frame] if frame.data is not None else ())
 
 if __name__ == "__Cluster_Version__":
-    success, version = Cluster_Version()
+    result = Cluster_Version()
@@ -3,32 +3,30 @@
 Created on Mon Jun  9 11:54:00 2025
 @author: Sri.Sakthivel
 """
+import asyncio
 import can
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
 import requests
-from datetime import datetime
+import step_result
 
 PHASE_OFFSET_ANGLE_CAN_ID = 0xAB
+PHASE_OFFSET = can_signals.message("MCU_PhaseOffset")
+RX_CAN_IDS = [PHASE_OFFSET_ANGLE_CAN_ID]
+# Longest wait for the reply; a cycle budget may cut it short
+STEP_WINDOW = 1
+# Poke the ECU answers on RX_CAN_IDS; batched with the plan's other pokes (see frame_fanout)
+POKE_ID = PHASE_OFFSET_ANGLE_CAN_ID
+POKE_DATA = [0xAA]
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
-def fetch_api_data(vin_number):
-    url = f"http://10.121.2.107:3000/vehicles/flashFile/ejo/{vin_number}"
+def fetch_api_data(vin_number, api_url=None):
+    url = api_url or f"http://10.121.2.107:3000/vehicles/flashFile/ejo/{vin_number}"
     try:
         response = requests.get(url, timeout=5)
         response.raise_for_status()
@@ -45,54 +43,74 @@ def fetch_api_data(vin_number):
         return None, None, False
 
 def parse_phase_offset_angle(data):
-    try:
-        combined = (data[0] << 8) | data[1]
-        if combined & 0x8000:
-            combined = combined - 0x10000
-        return round(float(combined) / 100, 2)  # Convert to float with 2 decimals
-    except Exception:
-        return None
+    # Signed 16-bit big-endian, 0.01 deg per bit (see signals.dbc)
+    return PHASE_OFFSET.decode_signal(data, "PhaseOffsetAngle")
+
+def report_phase_offset(response, api_phase_offset):
+    if response is None:
+        print("No valid CAN response received.")
+        return step_result.StepResult(False, "Error", expected=api_phase_offset, failure=step_result.NO_FRAME)
+
+    vehicle_offset = parse_phase_offset_angle(response.data)
+    frame = can_frames.FrameRecord.from_message(response)
+    # A frame too short for the signal decodes to None and cannot match
+    match = False
+    if vehicle_offset is not None:
+        # Convert to string without decimal places for comparison
+        vehicle_offset_str = int(vehicle_offset)
+        api_phase_offset_str = int(api_phase_offset)
+        match = (vehicle_offset_str == api_phase_offset_str)
+    
+    print("Test Sequence: MCU_Phase_Offset")
+    print(f"Tx_Can_id: {hex(response.arbitration_id)}")
+    print(f"Rx Hex: {frame:hex}")
+    print(f"Vehicle Phase Offset Angle: {vehicle_offset}")
+    print(f"API Phase Offset Angle: {api_phase_offset}")
+    print(f"Status: {'Passed' if match else 'Failed'}")
+    
+    return step_result.StepResult(
+        match, vehicle_offset, expected=api_phase_offset, frames=[frame], failure=None if match else step_result.MISMATCH
+    )
 
-def MCU_Phase_Offset(vin_number="MD6EVM1D7S4F00373"):
-    bus = setup_can_bus()
-    if not bus:
-        return False
+@step_result.test_step(inputs=("vin", "api_url", "bus"))
+def MCU_Phase_Offset(vin_number="MD6EVM1D7S4F00373", api_url=None, bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed()
 
-    api_response, api_phase_offset, success = fetch_api_data(vin_number)
+    api_response, api_phase_offset, success = fetch_api_data(vin_number, api_url)
     if not success:
-        bus.shutdown()
-        return False
+        return step_result.failed(failure=step_result.API_ERROR)
 
+    response = None
     try:
-        msg = can.Message(arbitration_id=PHASE_OFFSET_ANGLE_CAN_ID, data=[0xAA], is_extended_id=False)
-        bus.send(msg)
-        
-        start_time = datetime.now()
-        while (datetime.now() - start_time).seconds < 1:
-            response = bus.recv(timeout=0.5)
-            if response and response.arbitration_id == PHASE_OFFSET_ANGLE_CAN_ID:
-                vehicle_offset = parse_phase_offset_angle(response.data)
-                rx_hex = ' '.join(f"{byte:02X}" for byte in response.data)
-                # Convert to string without decimal places for comparison
-                vehicle_offset_str = int(vehicle_offset)
-                api_phase_offset_str = int(api_phase_offset)
-                match = (vehicle_offset_str == api_phase_offset_str)
-                
-                print("Test Sequence: MCU_Phase_Offset")
-                print(f"Tx_Can_id: {hex(response.arbitration_id)}")
-                print(f"Rx Hex: {rx_hex}")
-                print(f"Vehicle Phase Offset Angle: {vehicle_offset}")
-                print(f"API Phase Offset Angle: {api_phase_offset}")
-                print(f"Status: {'Passed' if match else 'Failed'}")
-                
-                return match, api_phase_offset, vehicle_offset
+        msg = can.Message(arbitration_id=POKE_ID, data=POKE_DATA, is_extended_id=False)
+        response = frame_fanout.transact("MCU_Phase_Offset", bus, msg, RX_CAN_IDS, STEP_WINDOW)
     except Exception as e:
         print(f"CAN read error: {e}")
-    finally:
-        bus.shutdown()
 
-    print("No valid CAN response received.")
-    return False
+    return report_phase_offset(response, api_phase_offset)
+
+@step_result.test_step(inputs=("vin", "api_url"))
+async def MCU_Phase_Offset_async(vin_number="MD6EVM1D7S4F00373", api_url=None, dispatcher=None):
+    dispatcher = dispatcher or can_session.get_session().get_dispatcher()
+    if dispatcher is None:
+        return step_result.failed()
+
+    # The API lookup runs on a worker thread while the ECU answers the poke
+    api_task = asyncio.ensure_future(asyncio.to_thread(fetch_api_data, vin_number, api_url))
+    response = None
+    try:
+        msg = can.Message(arbitration_id=POKE_ID, data=POKE_DATA, is_extended_id=False)
+        response = await frame_fanout.transact_async("MCU_Phase_Offset", dispatcher, msg, RX_CAN_IDS, STEP_WINDOW)
+    except Exception as e:
+        print(f"CAN read error: {e}")
+
+    api_response, api_phase_offset, success = await api_task
+    if not success:
+        return step_result.failed(failure=step_result.API_ERROR)
+    return report_phase_offset(response, api_phase_offset)
 
 if __name__ == "__main__":
     MCU_Phase_Offset()
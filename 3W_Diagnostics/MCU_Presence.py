@@ -1,59 +1,48 @@
 import can
-from datetime import datetime
+import can_frames
+import can_session
+import frame_fanout
+import step_result
 
 # MCU Presence CAN IDs (in hex)
 MCU_CAN_IDS = [0xA0, 0xC8, 0x15, 0xB0, 0xAF, 0xAB, 0xB7, 0xCA, 0x668, 0xCB, 0xC7]
 
+# Listened for in the shared passive window (see frame_fanout)
+RX_CAN_IDS = MCU_CAN_IDS
+PASSIVE_WINDOW = 1
+
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
-def MCU_Presence():
-    bus = setup_can_bus()
-    if not bus:
-        return False
+@step_result.test_step(inputs=("bus",))
+def MCU_Presence(bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.StepResult(False, False)
     
     detected_ids = {}
     presence_detected = False
 
     try:
-        start_time = datetime.now()
-
-        while (datetime.now() - start_time).seconds < 1:
-            msg = bus.recv(timeout=0.1)
-            if msg and msg.arbitration_id in MCU_CAN_IDS:
-                can_id = msg.arbitration_id
-                presence_detected = True
-                if can_id not in detected_ids:
-                    detected_ids[can_id] = ' '.join(f"{byte:02X}" for byte in msg.data)
+        frames = frame_fanout.collect("MCU_Presence", bus, RX_CAN_IDS, PASSIVE_WINDOW)
+        for can_id, msg in frames.items():
+            presence_detected = True
+            detected_ids[can_id] = can_frames.FrameRecord.from_message(msg)
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
     finally:
-        bus.shutdown()
         status = "Passed" if presence_detected else "Failed"
         print(f"Test Sequence: MCU_Presence")
         if presence_detected:
             for can_id, received_data in detected_ids.items():
                 print(f"Tx_Can_id: {hex(can_id)}")
-                print(f"Rx: {received_data}")
+                print(f"Rx: {received_data:hex}")
         else:
             print("Status: MCU not presented")
         print(f"Status: {status}")
-        return presence_detected
+        return step_result.StepResult(presence_detected, presence_detected, frames=detected_ids.values())
 
 if __name__ == "__MCU_Presence__":
     result = MCU_Presence()
\ No newline at end of file
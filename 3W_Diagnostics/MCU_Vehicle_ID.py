@@ -4,33 +4,31 @@ Created on Wed May 28 17:32:50 2025
 
 @author: Sri.Sakthivel
 """
+import asyncio
 import can
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
 import requests
-from datetime import datetime
+import step_result
 
 # MCU Vehicle ID CAN ID (in hex)
 VEHICLE_ID_CAN_ID = 0xCB
+VEHICLE_ID = can_signals.message("MCU_VehicleId")
+RX_CAN_IDS = [VEHICLE_ID_CAN_ID]
+# Longest wait for the reply; a cycle budget may cut it short
+STEP_WINDOW = 1
+# Poke the ECU answers on RX_CAN_IDS; batched with the plan's other pokes (see frame_fanout)
+POKE_ID = VEHICLE_ID_CAN_ID
+POKE_DATA = [0xAA]
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
-def fetch_api_data(vin_number):
-    url = f"http://10.121.2.107:3000/vehicles/flashFile/ejo/{vin_number}"
+def fetch_api_data(vin_number, api_url=None):
+    url = api_url or f"http://10.121.2.107:3000/vehicles/flashFile/ejo/{vin_number}"
     try:
         response = requests.get(url, timeout=5)
         response.raise_for_status()
@@ -55,58 +53,77 @@ def fetch_api_data(vin_number):
         return None, None, False
 
 def parse_vehicle_id(data):
-    try:
-        # Combine first two bytes [0,1] into a 16-bit unsigned integer (big-endian)
-        combined = (data[0] << 8) | data[1]
-        return combined  # Decimal value
-    except IndexError:
-        return None
+    # 16-bit big-endian in bytes 0-1; None for a shorter frame
+    return VEHICLE_ID.decode_signal(data, "VehicleId")
+
+def report_vehicle_id(response, api_vehicle_id):
+    match = False
+    failure = None
+    vehicle_id = None
+    frame = can_frames.NO_FRAME
+    if response is not None:
+        frame = can_frames.FrameRecord.from_message(response)
+        vehicle_id = parse_vehicle_id(response.data)
+        if vehicle_id is not None and api_vehicle_id is not None:
+            # Convert API value to int for comparison (assuming it's a string)
+            try:
+                match = (vehicle_id == int(api_vehicle_id))
+            except (TypeError, ValueError):
+                print(f"API Vehicle ID is not a number: {api_vehicle_id!r}")
+                failure = step_result.API_ERROR
+
+    status = "Passed" if match else "Failed"
+    if not match and failure is None:
+        failure = step_result.NO_FRAME if response is None else step_result.MISMATCH
+    print("Test Sequence: MCU_Vehicle_ID")
+    print(f"Tx_Can_id: {frame:id}")
+    print(f"Rx Hex: {frame:hex}")
+    print(f"Rx Dec: {frame:dec}")
+    print(f"Vehicle ID: {vehicle_id}")
+    print(f"API Vehicle ID: {api_vehicle_id}")
+    print(f"Status: {status}")
+    return step_result.StepResult(match, vehicle_id, expected=api_vehicle_id, frames=[frame] if frame.data is not None else (), failure=failure)
 
-def MCU_Vehicle_ID(vin_number="MD6EVM1D7S4E01133"):
-    bus = setup_can_bus()
-    if not bus:
-        return False
+@step_result.test_step(inputs=("vin", "api_url", "bus"))
+def MCU_Vehicle_ID(vin_number="MD6EVM1D7S4E01133", api_url=None, bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed()
     
-    # Fetch API data and ensure bus shutdown if API fails
-    api_response, api_vehicle_id, success = fetch_api_data(vin_number)
+    # Fetch API data before poking the ECU
+    api_response, api_vehicle_id, success = fetch_api_data(vin_number, api_url)
     if not success:
-        bus.shutdown()
-        return False
+        return step_result.failed(failure=step_result.API_ERROR)
     
-    vehicle_id = None
-    received_data_hex = "None"
-    received_data_dec = "None"
-    can_id = "None"
+    response = None
+    try:
+        msg = can.Message(arbitration_id=POKE_ID, data=POKE_DATA, is_extended_id=False)
+        response = frame_fanout.transact("MCU_Vehicle_ID", bus, msg, RX_CAN_IDS, STEP_WINDOW)
+    except Exception as e:
+        print(f"Error while reading CAN messages: {e}")
+
+    return report_vehicle_id(response, api_vehicle_id)
 
+@step_result.test_step(inputs=("vin", "api_url"))
+async def MCU_Vehicle_ID_async(vin_number="MD6EVM1D7S4E01133", api_url=None, dispatcher=None):
+    dispatcher = dispatcher or can_session.get_session().get_dispatcher()
+    if dispatcher is None:
+        return step_result.failed()
+
+    # The API lookup runs on a worker thread while the ECU answers the poke
+    api_task = asyncio.ensure_future(asyncio.to_thread(fetch_api_data, vin_number, api_url))
+    response = None
     try:
-        msg = can.Message(arbitration_id=VEHICLE_ID_CAN_ID, data=[0xAA], is_extended_id=False)
-        bus.send(msg)
-        
-        start_time = datetime.now()
-        while (datetime.now() - start_time).seconds < 1:
-            response = bus.recv(timeout=0.5)
-            if response and response.arbitration_id == VEHICLE_ID_CAN_ID:
-                can_id = hex(response.arbitration_id)
-                received_data_hex = ' '.join(f"{byte:02X}" for byte in response.data)
-                received_data_dec = ' '.join(str(byte) for byte in response.data)
-                vehicle_id = parse_vehicle_id(response.data)
-                if vehicle_id is not None and api_vehicle_id is not None:
-                    # Convert API value to int for comparison (assuming it's a string)
-                    match = (vehicle_id == int(api_vehicle_id))
-                break
+        msg = can.Message(arbitration_id=POKE_ID, data=POKE_DATA, is_extended_id=False)
+        response = await frame_fanout.transact_async("MCU_Vehicle_ID", dispatcher, msg, RX_CAN_IDS, STEP_WINDOW)
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
-    finally:
-        bus.shutdown()
-        status = "Passed" if match else "Failed"
-        print("Test Sequence: MCU_Vehicle_ID")
-        print(f"Tx_Can_id: {can_id}")
-        print(f"Rx Hex: {received_data_hex}")
-        print(f"Rx Dec: {received_data_dec}")
-        print(f"Vehicle ID: {vehicle_id}")
-        print(f"API Vehicle ID: {api_vehicle_id}")
-        print(f"Status: {status}")
-        return match, api_vehicle_id, vehicle_id
+
+    api_response, api_vehicle_id, success = await api_task
+    if not success:
+        return step_result.failed(failure=step_result.API_ERROR)
+    return report_vehicle_id(response, api_vehicle_id)
 
 if __name__ == "__main__":
     result = MCU_Vehicle_ID()
@@ -1,71 +1,56 @@
 import can
-from datetime import datetime
+import can_frames
+import can_session
+import can_signals
+import frame_fanout
+import step_result
 
 # MCU Software Version CAN ID (in hex)
 MCU_SW_ID = 0xC7
+SOFTWARE_VERSION = can_signals.message("MCU_SoftwareVersion")
+
+# Listened for in the shared passive window (see frame_fanout)
+RX_CAN_IDS = [MCU_SW_ID]
+PASSIVE_WINDOW = 5
 
 def setup_can_bus():
-    try:
-        # Try PCAN first
-        bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"PCAN setup failed: {e}")
-        
-    try:
-        # Try SocketCAN (for Linux)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; never shut down here
+    return can_session.get_bus()
 
 def parse_version(data):
-    try:
-        major = data[0]
-        minor = data[1]
-        patch = data[2]
-        return f"{major}.{minor}.{patch}"
-    except IndexError:
+    version = SOFTWARE_VERSION.decode(data)
+    if None in version.values():
         return "Invalid data length"
+    return f"{version['Major']}.{version['Minor']}.{version['Patch']}"
 
-def MCU_Version():
-    bus = setup_can_bus()
-    if not bus:
-        return False
+@step_result.test_step(inputs=("bus",), check=step_result.CHECK_VALUE)
+def MCU_Version(bus=None):
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.failed()
     
     version_detected = False
     version = "Not detected"
-    received_data_hex = "None"
-    received_data_dec = "None"
-    can_id = "None"
+    frame = can_frames.NO_FRAME
 
     try:
-        start_time = datetime.now()
-
-        while (datetime.now() - start_time).seconds < 5:
-            msg = bus.recv(timeout=0.5)
-            if msg and msg.arbitration_id == MCU_SW_ID:
-                version_detected = True
-                can_id = hex(msg.arbitration_id)
-                received_data_hex = ' '.join(f"{byte:02X}" for byte in msg.data)
-                received_data_dec = ' '.join(str(byte) for byte in msg.data)
-                version = parse_version(msg.data)
-                break
+        msg = frame_fanout.collect("MCU_Version", bus, RX_CAN_IDS, PASSIVE_WINDOW).get(MCU_SW_ID)
+        if msg is not None:
+            version_detected = True
+            frame = can_frames.FrameRecord.from_message(msg)
+            version = parse_version(msg.data)
     except Exception as e:
         print(f"Error while reading CAN messages: {e}")
     finally:
-        bus.shutdown()
         status = "Passed" if version_detected else "Failed"
         print(f"Test Sequence: MCU_Version")
-        print(f"Tx_Can_id: {can_id}")
-        print(f"Rx Hex:{received_data_hex}")
-        print(f"Rx Dec:{received_data_dec}")
+        print(f"Tx_Can_id: {frame:id}")
+        print(f"Rx Hex:{frame:hex}")
+        print(f"Rx Dec:{frame:dec}")
         print(f"Version: {version}")
         print(f"Status: {status}")
-        return version_detected, version
+        return step_result.StepResult(version_detected, version, frames=[frame] if frame.data is not None else ())
 
 if __name__ == "__MCU_Version__":
     result = MCU_Version()
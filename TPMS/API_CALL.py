@@ -7,9 +7,12 @@ Created on Wed Apr 23 12:07:52 2025
 import requests
 import json
 
+import step_result
+
 # Global dictionary to store MAC IDs
 mac_ids = {}
 
+@step_result.test_step(inputs=("vin", "api_url"))
 def API_CALL(vin_number, api_url):
     """Fetch front and rear TPMS MAC IDs via API call."""
     print("Test_Sequence: API_CALL")
@@ -18,7 +21,7 @@ def API_CALL(vin_number, api_url):
     if not api_url or not api_url.startswith("http"):
         print("Status: Failed")
         print("Error: Invalid or empty API URL")
-        return (False, "Error")
+        return step_result.failed(failure=step_result.API_ERROR)
 
     try:
         response = requests.get(api_url, timeout=5)
@@ -45,16 +48,17 @@ def API_CALL(vin_number, api_url):
             print(f"Front_MAC_ID: {Front_Mac_ID}")
             print(f"Rear_MAC_ID: {Rear_Mac_ID}")
             print("Status: Passed")
-            return True, Front_Mac_ID, Rear_Mac_ID
+            # Handed to the MAC write steps through their mac_ids input
+            return step_result.StepResult(True, "TRUE", outputs={"Front_Mac_ID": Front_Mac_ID, "Rear_Mac_ID": Rear_Mac_ID})
         else:
             print("Status: Failed")
             print("Error: Required TX bytes not found in IPC module")
-            return (False, "Error")
+            return step_result.failed(failure=step_result.API_ERROR)
 
     except (requests.RequestException, ValueError, KeyError) as e:
         print(f"Status: Failed")
         print(f"Error: API call failed: {e}")
-        return (False, "Error")
+        return step_result.failed(failure=step_result.API_ERROR)
 
 if __name__ == "__main__":
     # For standalone testing
@@ -6,34 +6,37 @@ Created on Tue Aug 19 16:43:32 2025
 """
 
 import can
+import can_frames
+import can_session
+import frame_fanout
+import step_result
 from can.message import Message
-import os
+
+# Cluster acknowledgement for a TPMS MAC write
+RX_CAN_IDS = [0x7F1]
+# Longest wait for the acknowledgement; a cycle budget may cut it short
+STEP_WINDOW = 2
+# The MAC IDs to write come from API_CALL
+DEPENDS_ON = ["API_CALL"]
 
 def log_message(direction, msg):
-    formatted_data = ' '.join(f'{byte:02X}' for byte in msg.data)
-    print(f"{direction} ID: {msg.arbitration_id:03X}, DLC: {msg.dlc}, Data: {formatted_data}")
+    print(f"{direction} ID: {msg.arbitration_id:03X}, DLC: {msg.dlc}, Data: {can_frames.FrameRecord.from_message(msg):hex}")
     
-def can_config(interface="can0",bitrate=500000):
-    os.system(f"sudo ip link set {interface} down")
-    os.system(f"sudo ip link set {interface} up type can bitrate {bitrate} ")
-
 def setup_can_bus():
-    try:
-        can_config(interface="can0",bitrate=500000)
-        bus = can.interface.Bus(interface='socketcan', channel='can0', bitrate=500000)
-        #bus = can.interface.Bus(interface='pcan', channel='PCAN_USBBUS1', bitrate=500000, fd=False)
-        return bus
-    except Exception as e:
-        print(f"SocketCAN setup failed: {e}")
-        
-    print("No CAN interface found.")
-    return None
+    # Shared bus owned by the process-wide session; can0 link setup happens there once
+    return can_session.get_bus()
 
-def WRITE_TPMS_FRONT(front_mac_id):
+@step_result.test_step(inputs=("mac_ids", "bus"))
+def WRITE_TPMS_FRONT(mac_ids, bus=None):
     print("Test_Sequence: WRITE_TPMS_FRONT")
-    bus = setup_can_bus()
-    if not bus:
-        return False
+    front_mac_id = mac_ids.get("Front_Mac_ID")
+    if not front_mac_id:
+        print("No Front MAC ID from API_CALL.")
+        return step_result.StepResult(False, "N/A", failure=step_result.API_ERROR)
+    if bus is None:
+        bus = setup_can_bus()
+    if bus is None:
+        return step_result.StepResult(False, front_mac_id)
 
     try:
         # Format MAC: 'C06380910000' ➝ [0xC0, 0x63, 0x80, 0x91, 0x00, 0x00]
@@ -44,24 +47,19 @@ def WRITE_TPMS_FRONT(front_mac_id):
         log_message("Tx", message)
         bus.send(message)
 
-        bus.set_filters([{"can_id": 0x7F1, "can_mask": 0x7FF, "extended": False}])
-        response = bus.recv(timeout=2)
+        response = frame_fanout.listen(bus, RX_CAN_IDS, STEP_WINDOW, frame_fanout.any_of(RX_CAN_IDS)).frames.get(0x7F1)
 
-        if response:
+        if response is not None:
             log_message("Rx", response)
             print("Front MAC Write: PASSED")
-            return True
+            return step_result.StepResult(True, front_mac_id, frames=[can_frames.FrameRecord.from_message(response)])
         else:
             print("No response received for Front MAC Write.")
-            return False
+            return step_result.StepResult(False, front_mac_id, failure=step_result.NO_FRAME)
 
     except can.CanError as e:
         print("CAN Error:", e)
-        return False
-
-    finally:
-        bus.shutdown()
-        print("CAN bus shutdown.")
+        return step_result.StepResult(False, front_mac_id, failure=step_result.BUS_ERROR)
 
 if __name__ == "__main__":
-    WRITE_TPMS_FRONT('C06380910000')  # Example MAC ID
+    WRITE_TPMS_FRONT({'Front_Mac_ID': 'C06380910000'})  # Example MAC ID
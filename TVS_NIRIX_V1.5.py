@@ -28,6 +28,18 @@ import json
 import serial
 import usb.core
 import usb.util
+import bus_supervisor
+import can_async
+import can_filters
+import can_metrics
+import can_session
+import can_trace
+import cycle_budget
+import cycle_report
+import frame_fanout
+import retry_policy
+import sequencer
+import test_plan
 
 def resource_path(relative_path):
     """ Get absolute path to resource (for bundled executable) """
@@ -134,6 +146,52 @@ class SerialReaderThread(QThread):
         self.quit()
         self.wait()
 
+class SequencerThread(QThread, sequencer.Listener):
+    """Runs a cycle's steps off the GUI thread; progress comes back as signals."""
+    passive_captured = pyqtSignal(int, int, float)
+    step_running = pyqtSignal(int, str, int)
+    attempt_judged = pyqtSignal(int, str, int, bool, object, object, object)
+    attempt_failed = pyqtSignal(int, str, int, str)
+    step_done = pyqtSignal(int, str, bool, object, int, bool)
+    budget_exceeded = pyqtSignal(int, str)
+    cycle_done = pyqtSignal(str)
+
+    def __init__(self, sequence, subscriptions):
+        super().__init__()
+        self.sequence = sequence
+        self.sequence.listener = self
+        self.subscriptions = subscriptions
+
+    def run(self):
+        try:
+            final_status = self.sequence.run(self.subscriptions)
+        except Exception as e:
+            print(f"Test sequence failed: {e}")
+            final_status = "NOK"
+        self.cycle_done.emit(final_status)
+
+    def passive_done(self, resolved, total, duration):
+        self.passive_captured.emit(resolved, total, duration)
+
+    def step_started(self, index, step, attempt):
+        self.step_running.emit(index, step, attempt)
+
+    def attempt_result(self, index, step, attempt, passed, actual_value, api_expected, note):
+        self.attempt_judged.emit(index, step, attempt, bool(passed), actual_value, api_expected, note)
+
+    def attempt_error(self, index, step, attempt, error):
+        self.attempt_failed.emit(index, step, attempt, str(error))
+
+    def step_finished(self, index, step, passed, actual_value, attempts, error):
+        self.step_done.emit(index, step, bool(passed), actual_value, attempts, error is not None)
+
+    def over_budget(self, index, step):
+        self.budget_exceeded.emit(index, step)
+
+    def stop(self):
+        self.sequence.stop()
+        self.wait()
+
 class TestRow(QWidget):
     def __init__(self, test_data, active_library):
         super().__init__()
@@ -174,6 +232,20 @@ def load_scanner_config(config_file=resource_path(r"D:\Python\TVS_NIRIX_V1.4\sca
     baudrate = config.getint('ScannerConfig', 'baudrate', fallback=9600)
     return mode, ports, baudrate
 
+def load_cycle_budget(sku):
+    """Target cycle time in seconds for a SKU from [CYCLE_BUDGET] in station.ini, or None."""
+    config = configparser.ConfigParser()
+    try:
+        config.read(resource_path(r"D:\Python\TVS_NIRIX_V1.4\station.ini"))
+        if "CYCLE_BUDGET" not in config:
+            return None
+        section = config["CYCLE_BUDGET"]
+        value = section.get(sku, section.get("default"))
+        return float(value) if value else None
+    except Exception as e:
+        print(f"Error reading cycle budget from station.ini: {e}")
+        return None
+
 def load_station_config():
     config = configparser.ConfigParser()
     config_data = {}
@@ -558,6 +630,33 @@ class MainWindow(QWidget):
         self.test_boxes = []
         self.sku_fetched.connect(self.on_sku_fetched)
 
+        # One CAN bus for every test; scope "cycle" reopens it per VIN, "process" keeps it open
+        self.can_session = can_session.CanBusSession(
+            scope=load_station_config().get("can_session_scope", "process"),
+            ini_path=resource_path(r"D:\Python\TVS_NIRIX_V1.4\station.ini"),
+        )
+        can_session.set_session(self.can_session)
+        # Every frame of a cycle is kept in a fixed-size ring and saved next to the VIN log
+        self.can_trace = can_trace.TraceRecorder(int(load_station_config().get("can_trace_frames", can_trace.DEFAULT_CAPACITY)))
+        self.can_session.add_tap(self.can_trace)
+        # Frame rates, periods, jitter and request latencies per cycle, plus a rolling file of recent cycles
+        self.can_metrics = can_metrics.BusMetrics().attach(self.can_session)
+        # Restarts the controller on bus-off and tells which steps a bus error hit
+        self.bus_supervisor = bus_supervisor.BusSupervisor().attach(self.can_session)
+        # Probe the CAN backends once up front; the winner is pinned in station_pin.ini
+        self.can_session.open()
+        self.can_subscriptions = {}
+        self.can_filters = None
+        self.cycle_budget = None
+        self.sequencer_thread = None
+        self.test_plan = None
+        # {row: expected value the step took from the API}, shown once the row is reported
+        self.api_expected = {}
+        self.import_costs = None
+        self.retry_log = None
+        # print() from the step modules goes to the step log of the sequencer thread
+        can_async.route_output()
+
         log_folder = resource_path(r"D:\Python\TVS_NIRIX_V1.4\test_results")
         try:
             log_cleanup_module = importlib.import_module("log_cleanup")
@@ -931,12 +1030,8 @@ class MainWindow(QWidget):
         self.json_response = None
         self.test_failed = False
         self.test_table.verticalScrollBar().setValue(0)
+        # Step modules stay imported; module_registry reloads one only when its file changes
         importlib.invalidate_caches()
-        active_library = self.active_library_selector.get_selected_library()
-        for module_name in list(sys.modules.keys()):
-            if module_name.startswith(active_library):
-                del sys.modules[module_name]
-                #print(f"Cleared module: {module_name}")
         if self.serial_reader_thread:
             print("reset_for_next_cycle: Stopping serial reader thread")
             self.serial_reader_thread.stop()
@@ -944,17 +1039,16 @@ class MainWindow(QWidget):
         if self.hid_thread:
             print("reset_for_next_cycle: Stopping HID reader thread")
             self.hid_thread = None
-        try:
-            import can
-            can.rc['interface'] = 'pcan'
-            can.rc['channel'] = 'PCAN_USBBUS1'
-            bus = can.interface.Bus()
-            bus.shutdown()
-            print("CAN bus successfully shut down")
-        except Exception as e:
-            print(f"Failed to shut down CAN bus: {e}")
+        self.can_session.end_cycle()
         self.prepare_for_next_cycle()
 
+    def closeEvent(self, event):
+        if self.sequencer_thread is not None:
+            self.sequencer_thread.stop()
+        self.bus_supervisor.stop()
+        self.can_session.shutdown()
+        super().closeEvent(event)
+
     def update_test_result_row(self, row_index, actual_value, result):
         active_library = self.active_library_selector.get_selected_library()
         actual_value_col = 6 if active_library == "3W_Diagnostics" else 3
@@ -977,8 +1071,7 @@ class MainWindow(QWidget):
 
     def load_tests_from_sku(self, sku_number, active_library):
         #print(f"Loading tests for SKU: {sku_number}, Library: {active_library}")
-        test_file_name = f"{sku_number} - details.xlsx"
-        full_path = resource_path(os.path.join("sku_files", test_file_name))
+        full_path = test_plan.sku_path(resource_path("sku_files"), sku_number)
 
         if not os.path.isfile(full_path):
            # print(f"[ERROR] Test file not found: {full_path}")
@@ -987,9 +1080,11 @@ class MainWindow(QWidget):
             return
 
         try:
-            df = pd.read_excel(full_path, engine="openpyxl", keep_default_na=False)
+            # Compiled once per SKU; the table and the sequencer both read this plan
+            self.test_plan = test_plan.load(full_path, active_library)
         except Exception as e:
             #print(f"Failed to read test file: {e}")
+            self.test_plan = None
             self.instruction_box.append(f"Failed to read test file: {e}")
             self.test_table.setRowCount(0)
             return
@@ -1020,11 +1115,19 @@ class MainWindow(QWidget):
             self.test_table.setColumnWidth(3, 250)
             self.test_table.setColumnWidth(4, 200)
 
-        for idx, row in df.iterrows():
+        columns = 6 if active_library == "3W_Diagnostics" else 3
+        for idx, plan_step in enumerate(self.test_plan.steps):
             self.test_table.insertRow(idx)
-            columns = ["S.No", "Test Sequence", "Parameter", "Value", "LSL", "USL"] if active_library == "3W_Diagnostics" else ["S.No", "Test Sequence", "Parameter"]
-            for col_idx, key in enumerate(columns):
-                self.test_table.setItem(idx, col_idx, QTableWidgetItem(str(row.get(key, ''))))
+            for col_idx, text in enumerate(plan_step.cells[:columns]):
+                self.test_table.setItem(idx, col_idx, QTableWidgetItem(text))
+
+        # CAN IDs each step listens for, compiled into driver-level acceptance filters
+        test_names = self.test_plan.names
+        self.can_subscriptions = can_filters.plan_subscriptions(active_library, test_names)
+        self.can_filters = can_filters.plan_filters(self.can_subscriptions)
+        for name, ids in self.can_subscriptions.items():
+            print(f"{name} subscribes to: {can_filters.describe_ids(ids)}")
+        print(f"CAN filters for SKU {sku_number}: {can_filters.describe_filters(self.can_filters)}")
 
     def fetch_sku_from_api(self, vin, base_url):
         def api_task():
@@ -1128,19 +1231,15 @@ class MainWindow(QWidget):
 
     def parse_test_file(self, file_path):
         try:
-            df = pd.read_excel(file_path, engine="openpyxl", keep_default_na=False)
-            if "Test Sequence" not in df.columns:
-                self.instruction_box.append("No test sequence")
-                #print("[ERROR] 'Test Sequence' column missing in Excel.")
-                return []
-            test_cases = []
-            for test_name in df["Test Sequence"].dropna():
-                clean_name = str(test_name).strip().replace(" ", "_")
-                test_cases.append((clean_name, clean_name))
-            return test_cases
+            # Already compiled by load_tests_from_sku unless the file changed since
+            self.test_plan = test_plan.load(file_path, self.active_library)
         except Exception as e:
             #print(f"[ERROR] Failed to parse test file '{file_path}': {e}")
+            self.test_plan = None
             return []
+        if not self.test_plan.steps:
+            self.instruction_box.append("No test sequence")
+        return [(name, name) for name in self.test_plan.names]
 
     def on_sku_fetched(self, sku):
         active_library = self.active_library_selector.get_selected_library()
@@ -1149,7 +1248,7 @@ class MainWindow(QWidget):
         self.mac_ids = {}
         print(f"[DEBUG] SKU fetched: {sku} | Library: {active_library}")
         self.sku = sku
-        test_file = resource_path(os.path.join("sku_files", f"{sku} - details.xlsx"))
+        test_file = test_plan.sku_path(resource_path("sku_files"), sku)
         print(f"Test file path: {test_file}")
         if not os.path.exists(test_file):
             self.instruction_box.append(f"Test file for SKU '{sku}' not found.")
@@ -1181,9 +1280,42 @@ class MainWindow(QWidget):
         self.cumulative_time = 0.0
         self.start_time = time.time()
         self.final_status = "OK"
-        self.run_next_test()
+        test_names = [name for _, name in self.test_cases]
+        # Broadcast-only tests share one listen window instead of one each
+        subscriptions = frame_fanout.plan_subscriptions(active_library, test_names)
+        if len(subscriptions) < 2:
+            subscriptions = []
+        self.cycle_budget = None
+        target = load_cycle_budget(sku)
+        if target:
+            self.cycle_budget = cycle_budget.for_plan(target, active_library, test_names, subscriptions)
+            self.cycle_budget.start()
+        self.can_session.begin_cycle(self.cycle_budget)
+        self.can_trace.clear()
+        self.can_metrics.clear()
+        self.bus_supervisor.clear()
+        self.can_session.set_filters(self.can_filters)
+        # Steps run off the GUI thread, independent ones side by side; the table still fills in sheet order
+        sequence = sequencer.Sequencer(
+            self.test_plan, self.vin_input.text().strip(), self.url,
+            self.can_session, self.cycle_budget, mac_ids=self.mac_ids,
+            workers=int(load_station_config().get("step_workers", sequencer.MAX_WORKERS)),
+            policies=retry_policy.load(resource_path(r"D:\Python\TVS_NIRIX_V1.4\station.ini"))
+        )
+        self.api_expected = {}
+        self.sequencer_thread = SequencerThread(sequence, subscriptions)
+        self.sequencer_thread.passive_captured.connect(self.on_passive_captured)
+        self.sequencer_thread.step_running.connect(self.on_step_running)
+        self.sequencer_thread.attempt_judged.connect(self.on_attempt_judged)
+        self.sequencer_thread.attempt_failed.connect(self.on_attempt_failed)
+        self.sequencer_thread.step_done.connect(self.on_step_done)
+        self.sequencer_thread.budget_exceeded.connect(self.on_budget_exceeded)
+        self.sequencer_thread.cycle_done.connect(self.on_cycle_done)
+        self.sequencer_thread.start()
 
     def start_test_cases(self):
+        if self.sequencer_thread is not None and self.sequencer_thread.isRunning():
+            return
         vin_number = self.vin_input.text().strip()
         self.instruction_box.setText('')
         if not (vin_number.startswith("MD6") and len(vin_number) == 17):
@@ -1198,246 +1330,72 @@ class MainWindow(QWidget):
         self.cycle_time_box.start_timer()
         self.fetch_sku_from_api(vin_number, api_url)
 
-    def run_test(self, library_name, function_name, vin_number, api_url):
-        log_capture = io.StringIO()
-        sys.stdout = log_capture
-        sys.stderr = log_capture
-        output = None
-        try:
-            module_name = f"{library_name}.{function_name}"
-            if module_name in sys.modules:
-                importlib.reload(sys.modules[module_name])
-            else:
-                module = importlib.import_module(module_name)
-            test_function = getattr(sys.modules[module_name], function_name)
-            if library_name == "TPMS":
-                if function_name == "API_CALL":
-                    output = test_function(vin_number, api_url)
-                    if isinstance(output, tuple) and len(output) >= 3 and output[0]:
-                        self.mac_ids['Front_Mac_ID'] = output[1]
-                        self.mac_ids['Rear_Mac_ID'] = output[2]
-                elif function_name == "WRITE_TPMS_FRONT":
-                    output = test_function(self.mac_ids.get('Front_Mac_ID'))
-                elif function_name == "WRITE_TPMS_REAR":
-                    output = test_function(self.mac_ids.get('Rear_Mac_ID'))
-                else:
-                    output = test_function()
-            else:
-                if function_name in ["MCU_Phase_Offset", "MCU_Vehicle_ID", "API_CALL"]:
-                    output = test_function(vin_number, api_url)
-                else:
-                    output = test_function()
-        except Exception as e:
-            print(f"Error in {library_name}.{function_name}: {e}")
-            output = False
-        finally:
-            sys.stdout = sys.__stdout__
-            sys.stderr = sys.__stderr__
-            log_output = log_capture.getvalue()
-            log_capture.close()
-        self.test_results.append(log_output.strip())
-        return output
-
-    def run_next_test(self):
-        if self.current_test_index < len(self.test_cases):
-            test_label, function_name = self.test_cases[self.current_test_index]
-            row = self.current_test_index
-            max_retries = 3
-            retry_count = 0
-            timeout_seconds = 5
-            global_retry_count = 0
-            max_global_retries = 3
-
-            while global_retry_count < max_global_retries:
-                retry_count = 0
-                while retry_count < max_retries:
-                    try:
-                        self.instruction_box.clear()
-                        self.instruction_box.append(f"Running {function_name}...")
-                        active_library = self.active_library_selector.get_selected_library()
-                        vin_number = self.vin_input.text().strip()
-                        api_url = self.url
-
-                        start_time = time.time()
-                        result = self.run_test(active_library, function_name, vin_number, api_url)
-                        test_duration = time.time() - start_time
-
-                        if test_duration > timeout_seconds:
-                            raise TimeoutError(f"Test {function_name} exceeded {timeout_seconds} seconds")
-
-                        self.cumulative_time += test_duration
-                        self.test_times.append((function_name, self.cumulative_time))
-
-                        test_name = self.test_table.item(row, 1).text()
-                        passed = False
-                        actual_value = ""
-
-                        if active_library == "3W_Diagnostics":
-                            expected_value = self.test_table.item(row, 3).text() if self.test_table.item(row, 3) else ""
-                            lsl = self.test_table.item(row, 4).text() if self.test_table.item(row, 4) else ""
-                            usl = self.test_table.item(row, 5).text() if self.test_table.item(row, 5) else ""
-
-                            if test_name in ["Battery_Version", "MCU_Version", "VCU_Version", "Cluster_Version", "Telematics_Version"]:
-                                if isinstance(result, tuple) and len(result) == 2:
-                                    success, version = result
-                                    actual_value = version
-                                    passed = success and (version == expected_value)
-                                else:
-                                    actual_value = "Error"
-                                    passed = False
-                            elif test_name in ["Battery_SOC", "Battery_Voltage"]:
-                                if isinstance(result, tuple) and len(result) == 2:
-                                    passed, actual_value = result
-                                    try:
-                                        actual_value_float = float(actual_value)
-                                        lsl_float = float(lsl) if lsl and lsl != "N/A" else float('-inf')
-                                        usl_float = float(usl) if usl and usl != "N/A" else float('inf')
-                                        passed = passed and (lsl_float <= actual_value_float <= usl_float)
-                                        if not passed and test_name == "Battery_SOC":
-                                            self.instruction_box.clear()
-                                            self.instruction_box.append(
-                                                f"Battery_SOC failed: Actual value {actual_value} is outside limits (LSL: {lsl}, USL: {usl})"
-                                            )
-                                    except ValueError:
-                                        actual_value = "Error"
-                                        passed = False
-                                        if test_name == "Battery_SOC":
-                                            self.instruction_box.clear()
-                                            self.instruction_box.append(
-                                                f"Battery_SOC failed: Invalid value format (Actual: {actual_value}, LSL: {lsl}, USL: {usl})"
-                                            )
-                                else:
-                                    actual_value = "Error"
-                                    passed = False
-                                    if test_name == "Battery_SOC":
-                                        self.instruction_box.clear()
-                                        self.instruction_box.append(f"Battery_SOC failed: Invalid result format")
-                            elif test_name in ["MCU_Vehicle_ID", "MCU_Phase_Offset"]:
-                                if isinstance(result, tuple) and len(result) == 3:
-                                    passed, api_value, actual_value = result
-                                    new_expected_value = str(api_value)
-                                    self.test_table.setItem(row, 3, QTableWidgetItem(new_expected_value))
-                                else:
-                                    actual_value = "Error"
-                                    passed = False
-                            elif isinstance(result, bool):
-                                actual_value = "True" if result else "False"
-                                passed = result
-                            elif isinstance(result, tuple):
-                                success = result[0]
-                                actual_value = str(result[1]) if len(result) > 1 else ""
-                                passed = success and actual_value == expected_value
-                            else:
-                                actual_value = str(result)
-                                passed = bool(result)
-                        else:#TPMS
-                            if test_name == "API_CALL":
-                                if isinstance(result, tuple) and len(result) >= 3:
-                                    passed, front_mac, rear_mac = result[:3]
-                                    actual_value = f"TRUE"
-                                else:
-                                    actual_value = "Error"
-                                    passed = False
-                            elif test_name == "WRITE_TPMS_FRONT":
-                                actual_value = self.mac_ids.get('Front_Mac_ID', 'N/A')
-                                passed = bool(result)
-                            elif test_name == "WRITE_TPMS_REAR":
-                                actual_value = self.mac_ids.get('Rear_Mac_ID', 'N/A')
-                                passed = bool(result)
-                            else:
-                                if isinstance(result, tuple) and len(result) == 2:
-                                    passed, actual_value = result
-                                elif isinstance(result, bool):
-                                    actual_value = "True" if result else "False"
-                                    passed = result
-                                else:
-                                    actual_value = str(result)
-                                    passed = bool(result)
-
-                        status = "PASSED" if passed else "FAILED"
-                        color = "#008000" if passed else "red"
-                        #print(f"[DEBUG] {test_name} result: {status}, Actual: {actual_value}")
-
-                        self.update_test_result_row(row, actual_value, status)
-                        self.test_table.scrollToItem(self.test_table.item(row, 0), QAbstractItemView.PositionAtCenter)
-                        progress_percent = int(((self.current_test_index + 1) / len(self.test_cases)) * 100)
-                        self.progress_bar.setValue(progress_percent)
-
-                        self.result_box.setText(
-                            f'<span style="color:{color}; font-weight:bold; font-size:24px;">{function_name} - {status}</span>')
-
-                        self.instruction_box.clear()
-                        if passed:
-                            self.instruction_box.append(f"{function_name} passed on attempt {retry_count + 1}")
-                            break
-                        else:
-                            if test_name != "Battery_SOC":
-                                self.instruction_box.append(f"{function_name} failed on attempt {retry_count + 1}")
-                            retry_count += 1
-                            if retry_count < max_retries:
-                                time.sleep(2)
-                                continue
-                            self.test_failed = True
-                            self.final_status = "NOK"
-                            self.progress_bar.setValue(100)
-                            self.instruction_box.clear()
-                            self.instruction_box.append(f"{function_name} failed after {max_retries} attempts. Process stopped.")
-                            self.test_cycle_completed = True
-                            print("Stopping cycle timer due to test failure")
-                            self.cycle_time_box.stop_timer()
-                            QTimer.singleShot(500, self.save_results_to_log)
-                            self.send_api_status()
-                            QTimer.singleShot(15000, lambda: self.reset_for_next_cycle())
-                            return
-
-                    except (Exception, TimeoutError) as e:
-                        retry_count += 1
-                        test_duration = time.time() - start_time
-                        self.cumulative_time += test_duration
-                        self.test_times.append((function_name, self.cumulative_time))
-                        self.instruction_box.clear()
-                        self.instruction_box.append(f"{function_name} failed on attempt {retry_count} due to: {e}")
-                        print(f"Test {function_name} failed (Attempt {retry_count}/{max_retries}): {e}")
-                        if retry_count < max_retries:
-                            time.sleep(2)
-                            continue
-                        self.test_failed = True
-                        self.final_status = "NOK"
-                        self.update_test_result_row(row, "Timeout/Error", "FAILED")
-                        self.progress_bar.setValue(100)
-                        self.instruction_box.clear()
-                        self.instruction_box.append(f"{function_name} failed after {max_retries} retries. Process stopped.")
-                        self.test_cycle_completed = True
-                        self.cycle_time_box.stop_timer()
-                        QTimer.singleShot(500, self.save_results_to_log)
-                        self.send_api_status()
-                        QTimer.singleShot(15000, lambda: self.reset_for_next_cycle())
-                        return
-
-                if not passed and active_library == "TPMS":
-                    global_retry_count += 1
-                    if global_retry_count < max_global_retries:
-                       # print(f"Global retry {global_retry_count + 1}/{max_global_retries} for TPMS test sequence")
-                        self.current_test_index = 0
-                        self.test_results = []
-                        self.test_times = []
-                        self.cumulative_time = 0.0
-                        self.test_failed = False
-                        self.final_status = "OK"
-                        self.test_table.setRowCount(0)
-                        self.load_tests_from_sku(self.sku, active_library)
-                        continue
-                    else:
-                        print("Max global retries reached for TPMS test sequence")
-                        break
+    def on_passive_captured(self, resolved, total, duration):
+        self.instruction_box.append(f"Passive capture: {resolved}/{total} tests resolved in {duration:.2f} sec")
 
-                break
+    def on_step_running(self, row, function_name, attempt):
+        self.instruction_box.clear()
+        self.instruction_box.append(f"Running {function_name}...")
 
-            QTimer.singleShot(1000, lambda: self._proceed_to_next_test())
-        else:
+    def on_attempt_judged(self, row, function_name, attempt, passed, actual_value, api_expected, note):
+        # The row itself is painted by on_step_done, once the step is reported: a step
+        # still running past a failed row is abandoned and must not show a result
+        self.api_expected[row] = api_expected
+        self.instruction_box.clear()
+        if note:
+            self.instruction_box.append(note)
+        if passed:
+            self.instruction_box.append(f"{function_name} passed on attempt {attempt}")
+        elif not note:
+            self.instruction_box.append(f"{function_name} failed on attempt {attempt}")
+
+    def on_attempt_failed(self, row, function_name, attempt, error):
+        self.instruction_box.clear()
+        self.instruction_box.append(f"{function_name} failed on attempt {attempt} due to: {error}")
+        print(f"Test {function_name} failed (Attempt {attempt}): {error}")
+
+    def on_step_done(self, row, function_name, passed, actual_value, attempts, errored):
+        if self.api_expected.get(row) is not None:
+            self.test_table.setItem(row, 3, QTableWidgetItem(self.api_expected[row]))
+        status = "PASSED" if passed else "FAILED"
+        color = "#008000" if passed else "red"
+        self.update_test_result_row(row, actual_value, status)
+        self.test_table.scrollToItem(self.test_table.item(row, 0), QAbstractItemView.PositionAtCenter)
+        progress_percent = int(((row + 1) / len(self.test_cases)) * 100)
+        self.progress_bar.setValue(max(progress_percent, self.progress_bar.value()))
+        self.result_box.setText(
+            f'<span style="color:{color}; font-weight:bold; font-size:24px;">{function_name} - {status}</span>')
+        if passed:
+            return
+        self.test_failed = True
+        self.final_status = "NOK"
+        self.progress_bar.setValue(100)
+        self.instruction_box.clear()
+        what = "retries" if errored else "attempts"
+        self.instruction_box.append(f"{function_name} failed after {attempts} {what}. Process stopped.")
+
+    def on_budget_exceeded(self, row, function_name):
+        self.test_failed = True
+        self.final_status = "NOK"
+        self.update_test_result_row(row, "Cycle budget exceeded", "FAILED")
+        self.progress_bar.setValue(100)
+        self.result_box.setText(
+            f'<span style="color:red; font-weight:bold; font-size:24px;">{function_name} - FAILED</span>')
+        self.instruction_box.clear()
+        self.instruction_box.append(
+            f"Cycle time budget of {self.cycle_budget.target:.1f} sec used up before {function_name}. Process stopped.")
+
+    def on_cycle_done(self, final_status):
+        sequence = self.sequencer_thread.sequence
+        self.test_results = sequence.test_results
+        self.test_times = sequence.test_times
+        self.import_costs = sequence.import_costs
+        self.retry_log = sequence.retry_log
+        self.cumulative_time = sequence.cumulative_time
+        self.final_status = final_status
+        self.test_cycle_completed = True
+        if final_status == "OK":
             self.progress_bar.setValue(100)
-            QTimer.singleShot(1000, lambda: print("1 second passed"))
-            self.test_cycle_completed = True
             print("Stopping cycle timer due to all tests completed")
             self.cycle_time_box.stop_timer()
             self.result_box.setText(
@@ -1445,87 +1403,58 @@ class MainWindow(QWidget):
             )
             self.instruction_box.clear()
             self.instruction_box.setText("System ready for next VIN number.")
-            QTimer.singleShot(500, self.save_results_to_log)
-            self.send_api_status()
-            QTimer.singleShot(10000, lambda: self.reset_for_next_cycle())
-
-    def _proceed_to_next_test(self):
-        try:
-            if hasattr(self, 'test_failed') and self.test_failed:
-                return
-            self.current_test_index += 1
-            self.run_next_test()
-        except Exception as e:
-           # print(f"[Error] Proceed to next test failed: {e}")
-            self.instruction_box.append(f'<span style="color:red;">Exception in _proceed_to_next_test: {e}</span>')
+        else:
+            print("Stopping cycle timer due to test failure")
+            self.cycle_time_box.stop_timer()
+        QTimer.singleShot(500, self.save_results_to_log)
+        self.send_api_status()
+        QTimer.singleShot(10000 if final_status == "OK" else 15000, lambda: self.reset_for_next_cycle())
 
     def send_api_status(self):
         vin_number = self.vin_input.text().strip()
         active_library = self.active_library_selector.get_selected_library()
-        self.API_URL = "http://10.121.2.107:3000/vehicles/processParams/updateProcessParams"
+        self.API_URL = cycle_report.RESULT_URL
 
         if not vin_number:
             #print("VIN number is empty. Cannot send API status.")
             return
 
-        headers = {'Content-Type': 'application/json'}
-        payload = {
-            "VIN": vin_number,
-            "paramId": "CZ14106" if active_library == "3W_Diagnostics" else "CZ14104",
-            "opnNo": "0024" if active_library == "3W_Diagnostics" else "0022",
-            "identifier": vin_number,
-            "result": self.final_status
-        }
-
-        try:
-            print("Sending final result to API...")
-            print("Request URL:", self.API_URL)
-            print("Payload:", json.dumps(payload, indent=4))
-            response = requests.post(self.API_URL, headers=headers, data=json.dumps(payload))
-            print(f"API Response [{response.status_code}]: {response.text}")
-        except Exception as e:
-            print(f"Failed to send final result to API: {e}")
+        cycle_report.send_result(vin_number, active_library, self.final_status, self.API_URL)
 
     def save_results_to_log(self):
         vin_number = self.vin_input.text().strip()
-        timestamp_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         start_cycle_time = getattr(self, 'cycle_start_time', 'N/A').strftime("%Y-%m-%d %H:%M:%S") if hasattr(self, 'cycle_start_time') else 'N/A'
-        total_cycle_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         url = getattr(self, 'url', 'No request sent')
         json_response = getattr(self, 'json_response', 'No response available')
 
         log_folder = r"D:\Python\TVS_NIRIX_V1.4\test_results"
-        os.makedirs(log_folder, exist_ok=True)
-
-        txt_filename = f"{vin_number}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.txt"
-        txt_path = os.path.join(log_folder, txt_filename)
+        txt_path = cycle_report.log_path(log_folder, vin_number)
 
         try:
-            with open(txt_path, 'a', encoding='utf-8') as file:
-                file.write(f"VIN NUMBER      : {vin_number}\n")
-                file.write(f"TEST STATUS     : {self.final_status}\n")
-                file.write(f"DATE            : {timestamp_now}\n")
-                file.write("API Request:\n")
-                file.write(f"{url}\n")
-                file.write("API Response:\n")
-                file.write('\n')
-                if isinstance(json_response, dict):
-                    file.write(json.dumps(json_response, indent=4))
-                else:
-                    file.write(str(json_response))
-                for idx, raw_log in enumerate(self.test_results):
-                    for line in raw_log.strip().split('\n'):
-                        file.write(f"{line}\n")
-                    file.write(f"Cycle Time: {self.test_times[idx][1]:.2f} sec\n")
-                    file.write('\n')
-                file.write(f"START CYCLE TIME: {start_cycle_time}\n")
-                file.write(f"TOTAL CYCLE TIME: {total_cycle_time}\n")
+            cycle_report.write_log(
+                txt_path, vin_number, self.final_status, url, json_response, self.test_results, self.test_times,
+                start_cycle_time, self.can_session, self.can_filters, self.cycle_budget, self.can_metrics.snapshot(),
+                self.bus_supervisor, self.import_costs, self.retry_log
+            )
             print(f"Results appended to: {txt_path}")
         except Exception as e:
             print(f"Error saving log file: {e}")
             self.instruction_box.append(str(e))
 
+        try:
+            trace_path = os.path.splitext(txt_path)[0] + ".trace"
+            frame_count = self.can_trace.flush(trace_path)
+            print(f"CAN trace saved: {frame_count} frames to {trace_path}")
+        except Exception as e:
+            print(f"Error saving CAN trace: {e}")
+
+        try:
+            self.can_metrics.end_cycle()
+            self.can_metrics.write_rolling(os.path.join(log_folder, "can_metrics.json"))
+        except Exception as e:
+            print(f"Error saving CAN metrics: {e}")
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     light_palette = QPalette()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Error and bus-off supervision of the shared bus.
+
+Error frames arrive through a dispatcher tap; a watch thread polls the bus
+state every POLL_INTERVAL and restarts the controller in place on bus-off
+(see CanBusSession.restart_controller), or reopens the session when the
+dispatcher stopped on a read error. Every incident is timestamped so a
+failed step can tell whether one fell inside its own window: only then is
+it retried, and at once, without the retry delay.
+"""
+
+import collections
+import threading
+import time
+
+# Watch thread poll period; a bus-off error frame wakes it immediately
+POLL_INTERVAL = 0.01
+
+# SocketCAN error classes in the error frame's ID (linux/can/error.h)
+CAN_ERR_CRTL = 0x004
+CAN_ERR_BUSOFF = 0x040
+CAN_ERR_RESTARTED = 0x100
+CAN_ERR_CNT = 0x200
+
+MAX_INCIDENTS = 1000
+
+
+class BusSupervisor:
+    """Tap for the frame dispatcher plus the watch thread that restarts the bus."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.session = None
+        self.incidents = collections.deque(maxlen=MAX_INCIDENTS)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._bus_off = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.clear()
+
+    def attach(self, session):
+        self.session = session
+        session.supervisor = self
+        session.add_tap(self)
+        self._thread = threading.Thread(target=self._watch, name="bus-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def clear(self):
+        with self._lock:
+            self.error_frames = 0
+            self.bus_offs = 0
+            self.restart_times = []
+            self.tx_errors = None
+            self.rx_errors = None
+
+    def record(self, kind):
+        with self._lock:
+            self.incidents.append((time.time(), kind))
+
+    def __call__(self, msg):
+        # Called on the dispatcher thread; restarts are left to the watch thread
+        if not msg.is_error_frame:
+            return
+        with self._lock:
+            self.error_frames += 1
+            if msg.arbitration_id & CAN_ERR_CNT and len(msg.data) >= 8:
+                self.tx_errors, self.rx_errors = msg.data[6], msg.data[7]
+        if msg.arbitration_id & CAN_ERR_BUSOFF:
+            # SocketCAN only tells us through the error frame
+            self._bus_off = True
+            self._wake.set()
+        elif not msg.arbitration_id & CAN_ERR_RESTARTED:
+            self.record("error frame")
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            session = self.session
+            if session is None or session.bus is None:
+                continue
+            try:
+                if session.dispatcher is not None and session.dispatcher.failed:
+                    self.record("read error")
+                    session.get_dispatcher()
+                elif self._bus_off or session.is_bus_off():
+                    self._bus_off = False
+                    self.restart()
+            except Exception as e:
+                print(f"CAN bus supervision failed: {e}")
+
+    def restart(self):
+        start = time.perf_counter()
+        with self._lock:
+            self.bus_offs += 1
+        self.record("bus-off")
+        if self.session.restart_controller() is not None:
+            with self._lock:
+                self.restart_times.append((time.perf_counter() - start) * 1000)
+
+    def incidents_since(self, start):
+        """Incidents (time, kind) at or after start (a time.time() value)."""
+        with self._lock:
+            return [incident for incident in self.incidents if incident[0] >= start]
+
+    def describe(self):
+        with self._lock:
+            text = f"{self.error_frames} error frames, {self.bus_offs} bus-off"
+            if self.restart_times:
+                text += f" (restarted in {max(self.restart_times):.1f} ms max)"
+            if self.tx_errors is not None:
+                text += f", TEC {self.tx_errors} REC {self.rx_errors}"
+            return text
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def describe_incidents(incidents):
+    counts = collections.Counter(kind for _, kind in incidents)
+    return ", ".join(f"{count} {kind}" for kind, count in counts.items())
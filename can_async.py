@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio test contract and single-thread runner on top of the shared frame dispatcher.
+
+An async test is a coroutine function taking a ``dispatcher`` keyword and
+returning a step_result.StepResult like the blocking modules. Blocking test
+functions still run unchanged through the executor adapter, reading from
+their own FrameReader.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import io
+import sys
+import time
+
+import can_session
+import step_result
+
+_task_output = contextvars.ContextVar("task_output", default=None)
+
+
+class _TaskStdout:
+    """Routes print() from each concurrently running test into its own buffer."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        buffer = _task_output.get()
+        return (buffer or self.fallback).write(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+class TestRun:
+    __slots__ = ("name", "output", "log", "duration")
+
+    def __init__(self, name, output, log, duration):
+        self.name = name
+        self.output = output
+        self.log = log
+        self.duration = duration
+
+
+def route_output():
+    """Send print() from now on to the buffer of whatever test or cycle is printing.
+
+    Needed once per process when several threads capture output at the same time.
+    """
+    if not isinstance(sys.stdout, _TaskStdout):
+        sys.stdout = _TaskStdout(sys.stdout)
+
+
+@contextlib.contextmanager
+def captured_output(buffer):
+    """Collect print() from this thread (and the tasks it starts) in buffer."""
+    token = _task_output.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _task_output.reset(token)
+
+
+def is_async_test(test):
+    return inspect.iscoroutinefunction(test)
+
+
+async def _run_blocking(test, dispatcher, args, kwargs):
+    # Adapter: run a blocking module on the default executor with its own reader
+    if "bus" in inspect.signature(test).parameters and "bus" not in kwargs:
+        kwargs = dict(kwargs, bus=dispatcher.open_reader())
+    # to_thread carries the task context along, so prints land in the task's log
+    return await asyncio.to_thread(test, *args, **kwargs)
+
+
+async def _run_one(name, test, args, kwargs, dispatcher):
+    buffer = io.StringIO()
+    _task_output.set(buffer)
+    start = time.perf_counter()
+    try:
+        if is_async_test(test):
+            output = await test(*args, dispatcher=dispatcher, **kwargs)
+        else:
+            output = await _run_blocking(test, dispatcher, args, kwargs)
+    except Exception as e:
+        print(f"Error in {name}: {e}")
+        output = step_result.failed(failure=step_result.ERROR)
+    return TestRun(name, output, buffer.getvalue(), time.perf_counter() - start)
+
+
+def run_tests(tests, session=None):
+    """Run (name, test, args, kwargs) entries concurrently on one event loop.
+
+    Returns one TestRun per entry, in the order given.
+    """
+    session = session or can_session.get_session()
+    dispatcher = session.get_dispatcher()
+
+    async def main():
+        return await asyncio.gather(*(_run_one(name, test, args, kwargs, dispatcher) for name, test, args, kwargs in tests))
+
+    stdout = sys.stdout
+    if isinstance(stdout, _TaskStdout):
+        # Already routed for the whole process (several fixtures running)
+        return asyncio.run(main())
+    sys.stdout = _TaskStdout(stdout)
+    try:
+        return asyncio.run(main())
+    finally:
+        sys.stdout = stdout
+
+
+def run_test(test, *args, session=None, **kwargs):
+    """Run a single async or blocking test to completion and return its output."""
+    run = run_tests([(test.__name__, test, args, kwargs)], session)[0]
+    print(run.log, end="")
+    return run.output
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Notifier-backed fan-out of received CAN frames to every reader on the shared bus.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import weakref
+
+import can
+
+# Notifier recv() timeout; bounds how long stopping the dispatcher can take
+NOTIFIER_TIMEOUT = 0.1
+
+
+def matches_filters(msg, filters):
+    """python-can filter semantics, for readers that filter in software."""
+    if not filters:
+        return True
+    for f in filters:
+        if "extended" in f and f["extended"] != msg.is_extended_id:
+            continue
+        if msg.arbitration_id & f["can_mask"] == f["can_id"] & f["can_mask"]:
+            return True
+    return False
+
+
+class FrameReader:
+    """Bus-like view of the dispatched frames for blocking test modules.
+
+    Each reader has its own queue, starting empty, so a test never sees frames
+    that arrived before it took the bus and never steals frames from another.
+    """
+
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+        self._queue = queue.SimpleQueue()
+        self._filters = None
+
+    def _put(self, msg):
+        self._queue.put(msg)
+
+    def recv(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                msg = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if matches_filters(msg, self._filters):
+                return msg
+
+    def send(self, msg, timeout=None):
+        self._dispatcher.send(msg, timeout)
+
+    def set_filters(self, filters=None):
+        # Narrows this reader only; the shared bus keeps the plan's filters
+        self._filters = filters or None
+
+    @property
+    def state(self):
+        return self._dispatcher.bus.state
+
+    @property
+    def channel_info(self):
+        return self._dispatcher.bus.channel_info
+
+    def shutdown(self):
+        self._dispatcher.close_reader(self)
+
+
+class AsyncFrameReader:
+    """Frames for the given IDs, delivered into an asyncio queue on one event loop."""
+
+    def __init__(self, dispatcher, ids, loop):
+        self._dispatcher = dispatcher
+        self.ids = frozenset(ids) if ids else None
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def _put(self, msg):
+        if self.ids is not None and msg.arbitration_id not in self.ids:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, msg)
+        except RuntimeError:
+            # Event loop already closed; the reader is abandoned
+            self._dispatcher.close_reader(self)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._dispatcher.close_reader(self)
+
+
+class FrameDispatcher(can.Listener):
+    """Reads the bus on one Notifier thread and hands every frame to all readers."""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._readers = weakref.WeakSet()
+        self._taps = []
+        self._send_taps = []
+        self._lock = threading.Lock()
+        self.notifier = can.Notifier(bus, [self], timeout=NOTIFIER_TIMEOUT)
+
+    @property
+    def failed(self):
+        # The Notifier thread stops on the first bus exception
+        return self.notifier.exception is not None
+
+    def on_message_received(self, msg):
+        with self._lock:
+            readers = list(self._readers)
+            taps = list(self._taps)
+        for tap in taps:
+            tap(msg)
+        for reader in readers:
+            reader._put(msg)
+
+    def add_tap(self, tap):
+        # Taps see every frame and are held strongly, unlike readers
+        with self._lock:
+            self._taps.append(tap)
+
+    def remove_tap(self, tap):
+        with self._lock:
+            if tap in self._taps:
+                self._taps.remove(tap)
+
+    def add_send_tap(self, tap):
+        # Called with every frame sent through the dispatcher, once the bus took it
+        with self._lock:
+            self._send_taps.append(tap)
+
+    def open_reader(self):
+        reader = FrameReader(self)
+        with self._lock:
+            self._readers.add(reader)
+        return reader
+
+    def open_async_reader(self, ids=None):
+        reader = AsyncFrameReader(self, ids, asyncio.get_running_loop())
+        with self._lock:
+            self._readers.add(reader)
+        return reader
+
+    def close_reader(self, reader):
+        with self._lock:
+            self._readers.discard(reader)
+
+    def send(self, msg, timeout=None):
+        self.bus.send(msg, timeout)
+        for tap in self._send_taps:
+            tap(msg)
+
+    async def wait_for(self, ids, timeout):
+        """First frame with one of the IDs, or None once timeout expires."""
+        reader = self.open_async_reader(ids)
+        try:
+            return await reader.get(timeout)
+        finally:
+            reader.close()
+
+    async def request(self, msg, ids, timeout):
+        """Send msg and await the first reply on one of the IDs.
+
+        The reader is registered before sending so a fast reply is not missed.
+        """
+        reader = self.open_async_reader(ids)
+        try:
+            self.send(msg)
+            return await reader.get(timeout)
+        finally:
+            reader.close()
+
+    def close(self):
+        self.notifier.stop(timeout=NOTIFIER_TIMEOUT * 5)
+        with self._lock:
+            self._readers = weakref.WeakSet()
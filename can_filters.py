@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Acceptance filters compiled from the CAN IDs a test plan listens for.
+"""
+
+import inspect
+
+import module_registry
+
+STANDARD_ID_BITS = 11
+EXTENDED_ID_BITS = 29
+
+
+def compile_filters(can_ids, extended=False):
+    """Fewest ID/mask filters that accept exactly the given IDs and nothing else."""
+    width = EXTENDED_ID_BITS if extended else STANDARD_ID_BITS
+    full_mask = (1 << width) - 1
+    ids = sorted(set(can_ids))
+    if not ids:
+        return []
+
+    # Quine-McCluskey: keep merging pairs that differ in a single cared-for bit
+    level = {(can_id, full_mask) for can_id in ids}
+    primes = set()
+    while level:
+        by_mask = {}
+        for value, mask in level:
+            by_mask.setdefault(mask, set()).add(value)
+        merged = set()
+        used = set()
+        for mask, values in by_mask.items():
+            for value in values:
+                for bit in range(width):
+                    flag = 1 << bit
+                    if mask & flag and not value & flag and (value | flag) in values:
+                        merged.add((value, mask & ~flag))
+                        used.add((value, mask))
+                        used.add((value | flag, mask))
+        primes |= level - used
+        level = merged
+
+    # Greedy cover of the IDs by prime implicants, widest first
+    uncovered = set(ids)
+    chosen = []
+    candidates = sorted(primes, key=lambda p: (bin(p[1]).count("1"), p[0]))
+    while uncovered:
+        best = max(candidates, key=lambda p: sum(1 for can_id in uncovered if can_id & p[1] == p[0]))
+        uncovered -= {can_id for can_id in uncovered if can_id & best[1] == best[0]}
+        chosen.append(best)
+    return [{"can_id": value, "can_mask": mask, "extended": extended} for value, mask in sorted(chosen)]
+
+
+def plan_subscriptions(library_name, test_names):
+    """CAN IDs each step listens for.
+
+    A step that takes a bus but does not declare RX_CAN_IDS maps to None,
+    which means the plan cannot be filtered safely.
+    """
+    subscriptions = {}
+    for name in test_names:
+        try:
+            module = module_registry.load(f"{library_name}.{name}")
+        except Exception as e:
+            print(f"Cannot inspect {library_name}.{name} for CAN IDs: {e}")
+            subscriptions[name] = []
+            continue
+        ids = getattr(module, "RX_CAN_IDS", None)
+        if ids is not None:
+            subscriptions[name] = list(ids)
+            continue
+        function = getattr(module, name, None)
+        uses_bus = callable(function) and "bus" in inspect.signature(function).parameters
+        subscriptions[name] = None if uses_bus else []
+    return subscriptions
+
+
+def plan_filters(subscriptions):
+    """Filters for a whole plan, or None when every frame must be accepted."""
+    if any(ids is None for ids in subscriptions.values()):
+        return None
+    all_ids = set()
+    for ids in subscriptions.values():
+        all_ids.update(ids)
+    if not all_ids:
+        return None
+    return compile_filters(all_ids)
+
+
+def describe_ids(ids):
+    if ids is None:
+        return "all frames"
+    return ", ".join(hex(can_id) for can_id in ids) if ids else "none"
+
+
+def describe_filters(filters):
+    if not filters:
+        return "none (all frames accepted)"
+    return ", ".join(f"{f['can_id']:#05x}/{f['can_mask']:#05x}" for f in filters)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Received frames as the test modules log them.
+
+A FrameRecord keeps the raw ID and bytes; the hex and decimal text is only
+built when the record is formatted for the log, e.g. f"Rx Hex: {frame:hex}".
+"""
+
+
+class FrameRecord:
+    __slots__ = ("can_id", "data", "timestamp")
+
+    def __init__(self, can_id, data, timestamp=None):
+        self.can_id = can_id
+        self.data = data
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_message(cls, msg):
+        return cls(msg.arbitration_id, msg.data, msg.timestamp)
+
+    @property
+    def hex(self):
+        return ' '.join(f"{byte:02X}" for byte in self.data)
+
+    @property
+    def dec(self):
+        return ' '.join(str(byte) for byte in self.data)
+
+    def __format__(self, spec):
+        # "id": 0x-prefixed CAN ID, "hex"/"dec": data bytes; anything else formats the hex text
+        if self.data is None:
+            return "None"
+        if spec == "id":
+            return hex(self.can_id)
+        if spec == "dec":
+            return self.dec
+        if spec == "hex":
+            return self.hex
+        return format(self.hex, spec)
+
+    def __str__(self):
+        return format(self, "")
+
+
+# Stands in for a frame that never arrived; every text form reads "None"
+NO_FRAME = FrameRecord(None, None)
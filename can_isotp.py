@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+ISO 15765-2 (ISO-TP) segmentation over classic CAN on the shared bus.
+
+Normal addressing only: one request ID, one response ID, 8-byte frames.
+"""
+
+import time
+
+import can
+
+SINGLE_FRAME = 0x0
+FIRST_FRAME = 0x1
+CONSECUTIVE_FRAME = 0x2
+FLOW_CONTROL = 0x3
+
+FC_CONTINUE = 0x0
+FC_WAIT = 0x1
+FC_OVERFLOW = 0x2
+
+MAX_PAYLOAD = 0xFFF
+# Flow-control waits accepted before giving up (N_WFTmax)
+MAX_WAIT_FRAMES = 10
+
+
+class IsoTpError(Exception):
+    pass
+
+
+def encode_st_min(seconds):
+    """STmin byte for a separation time: 0-127 ms, or 100-900 us steps."""
+    if seconds <= 0:
+        return 0x00
+    if seconds < 0.001:
+        return 0xF0 + max(1, min(9, round(seconds * 10000)))
+    return min(0x7F, round(seconds * 1000))
+
+
+def decode_st_min(value):
+    if value <= 0x7F:
+        return value / 1000
+    if 0xF1 <= value <= 0xF9:
+        return (value - 0xF0) / 10000
+    # Reserved values mean the longest separation
+    return 0.127
+
+
+class IsoTpChannel:
+    """Segmented transfers between tx_id (ours) and rx_id (the ECU's).
+
+    block_size and st_min are what we ask of the sender in our flow control;
+    when we send, the receiver's flow control decides the pacing.
+    """
+
+    def __init__(self, bus, tx_id, rx_id, block_size=0, st_min=0.0, timeout=1.0, padding=0xAA, extended_id=False):
+        self.bus = bus
+        self.tx_id = tx_id
+        self.rx_id = rx_id
+        self.block_size = block_size
+        self.st_min = st_min
+        self.timeout = timeout
+        self.padding = padding
+        self.extended_id = extended_id
+
+    def _send_frame(self, data):
+        data = bytes(data)
+        if self.padding is not None:
+            data = data + bytes([self.padding]) * (8 - len(data))
+        self.bus.send(can.Message(arbitration_id=self.tx_id, data=data, is_extended_id=self.extended_id))
+
+    def _recv_frame(self, deadline):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            msg = self.bus.recv(timeout=remaining)
+            if msg is not None and msg.arbitration_id == self.rx_id and msg.data:
+                return msg.data
+
+    def _send_flow_control(self, status=FC_CONTINUE):
+        self._send_frame([(FLOW_CONTROL << 4) | status, self.block_size, encode_st_min(self.st_min)])
+
+    def _await_flow_control(self):
+        waits = 0
+        while True:
+            data = self._recv_frame(time.monotonic() + self.timeout)
+            if data is None:
+                raise IsoTpError(f"No flow control from {self.rx_id:#x}")
+            if data[0] >> 4 != FLOW_CONTROL:
+                continue
+            status = data[0] & 0x0F
+            if status == FC_CONTINUE:
+                return data[1], decode_st_min(data[2])
+            if status == FC_OVERFLOW:
+                raise IsoTpError(f"{self.rx_id:#x} cannot take the message (overflow)")
+            waits += 1
+            if waits > MAX_WAIT_FRAMES:
+                raise IsoTpError(f"{self.rx_id:#x} kept asking us to wait")
+
+    def send(self, payload):
+        payload = bytes(payload)
+        if len(payload) <= 7:
+            self._send_frame([(SINGLE_FRAME << 4) | len(payload)] + list(payload))
+            return
+        if len(payload) > MAX_PAYLOAD:
+            raise IsoTpError(f"Payload of {len(payload)} bytes is too long for ISO-TP")
+        self._send_frame([(FIRST_FRAME << 4) | (len(payload) >> 8), len(payload) & 0xFF] + list(payload[:6]))
+        block_size, separation = self._await_flow_control()
+        sent_in_block = 0
+        sequence = 1
+        for offset in range(6, len(payload), 7):
+            if separation:
+                time.sleep(separation)
+            self._send_frame([(CONSECUTIVE_FRAME << 4) | sequence] + list(payload[offset:offset + 7]))
+            sequence = (sequence + 1) & 0x0F
+            sent_in_block += 1
+            if block_size and sent_in_block == block_size and offset + 7 < len(payload):
+                block_size, separation = self._await_flow_control()
+                sent_in_block = 0
+
+    def recv(self, timeout=None):
+        """Next complete payload from rx_id, or None if none starts within timeout."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            data = self._recv_frame(deadline)
+            if data is None:
+                return None
+            kind = data[0] >> 4
+            if kind == SINGLE_FRAME:
+                length = data[0] & 0x0F
+                return bytes(data[1:1 + length])
+            if kind == FIRST_FRAME:
+                return self._receive_segmented(data)
+
+    def _receive_segmented(self, first):
+        length = ((first[0] & 0x0F) << 8) | first[1]
+        payload = bytearray(first[2:8])
+        self._send_flow_control()
+        sequence = 1
+        in_block = 0
+        while len(payload) < length:
+            data = self._recv_frame(time.monotonic() + self.timeout)
+            if data is None:
+                raise IsoTpError(f"Consecutive frame from {self.rx_id:#x} timed out at {len(payload)}/{length} bytes")
+            if data[0] >> 4 != CONSECUTIVE_FRAME:
+                continue
+            if data[0] & 0x0F != sequence:
+                raise IsoTpError(f"Consecutive frame out of sequence from {self.rx_id:#x}")
+            payload.extend(data[1:8])
+            sequence = (sequence + 1) & 0x0F
+            in_block += 1
+            if self.block_size and in_block == self.block_size and len(payload) < length:
+                self._send_flow_control()
+                in_block = 0
+        return bytes(payload[:length])
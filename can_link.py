@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+SocketCAN link configuration, done at most once per process and only when needed.
+
+Link state is read over netlink when pyroute2 is installed, otherwise from
+``ip -details -json link show`` (no sudo needed to read). The link is only
+taken down and reconfigured when it is down or at the wrong bitrate.
+
+pyroute2 is an optional dependency (``pip install pyroute2``); without it
+every call falls back to the ``ip`` command.
+"""
+
+import json
+import subprocess
+import sys
+import threading
+
+try:
+    from pyroute2 import IPRoute
+except ImportError:
+    IPRoute = None
+
+IFF_UP = 0x1
+
+_configured = {}
+_lock = threading.Lock()
+
+
+def _netlink_state(interface):
+    with IPRoute() as ipr:
+        links = ipr.get_links(ifname=interface)
+        if not links:
+            return None
+        link = links[0]
+        bitrate = None
+        info = link.get_attr("IFLA_LINKINFO")
+        data = info.get_attr("IFLA_INFO_DATA") if info is not None else None
+        timing = data.get_attr("IFLA_CAN_BITTIMING") if data is not None else None
+        if timing is not None:
+            bitrate = timing.get("bitrate")
+        return bool(link["flags"] & IFF_UP), bitrate
+
+
+def _ip_state(interface):
+    result = subprocess.run(["ip", "-details", "-json", "link", "show", interface], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    link = json.loads(result.stdout)[0]
+    timing = link.get("linkinfo", {}).get("info_data", {}).get("bittiming", {})
+    return "UP" in link.get("flags", []), timing.get("bitrate")
+
+
+def link_state(interface):
+    """(is_up, bitrate) of a CAN link, or None when it does not exist or cannot be read."""
+    try:
+        if IPRoute is not None:
+            return _netlink_state(interface)
+        return _ip_state(interface)
+    except Exception as e:
+        print(f"Cannot read {interface} link state: {e}")
+        return None
+
+
+def _netlink_configure(interface, bitrate):
+    with IPRoute() as ipr:
+        index = ipr.link_lookup(ifname=interface)[0]
+        ipr.link("set", index=index, state="down")
+        ipr.link("set", index=index, kind="can", can_bittiming={"bitrate": bitrate})
+        ipr.link("set", index=index, state="up")
+
+
+def _ip_configure(interface, bitrate):
+    subprocess.run(["sudo", "ip", "link", "set", interface, "down"], check=True)
+    subprocess.run(["sudo", "ip", "link", "set", interface, "up", "type", "can", "bitrate", str(bitrate)], check=True)
+
+
+def configure_link(interface, bitrate):
+    if IPRoute is not None:
+        try:
+            _netlink_configure(interface, bitrate)
+            return
+        except Exception as e:
+            # Usually missing CAP_NET_ADMIN; sudo may still be allowed
+            print(f"Netlink configure of {interface} failed ({e}), using sudo ip")
+    _ip_configure(interface, bitrate)
+
+
+def _netlink_restart(interface):
+    with IPRoute() as ipr:
+        index = ipr.link_lookup(ifname=interface)[0]
+        ipr.link("set", index=index, kind="can", can_restart=1)
+
+
+def _ip_restart(interface):
+    subprocess.run(["sudo", "ip", "link", "set", interface, "type", "can", "restart"], check=True)
+
+
+def restart_link(interface):
+    """Restart a link left in bus-off; the socket stays open. Returns True once issued."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        if IPRoute is not None:
+            try:
+                _netlink_restart(interface)
+                return True
+            except Exception as e:
+                print(f"Netlink restart of {interface} failed ({e}), using sudo ip")
+        _ip_restart(interface)
+        return True
+    except Exception as e:
+        print(f"Failed to restart {interface}: {e}")
+        return False
+
+
+def ensure_link(interface="can0", bitrate=500000):
+    """Bring the link up at the bitrate unless it already is. Returns True when it is usable."""
+    if not sys.platform.startswith("linux"):
+        return True
+    with _lock:
+        if _configured.get(interface) == bitrate:
+            return True
+        state = link_state(interface)
+        if state is None:
+            print(f"CAN link {interface} not found")
+            return False
+        is_up, current = state
+        if is_up and current == bitrate:
+            _configured[interface] = bitrate
+            return True
+        print(f"Configuring {interface}: up={is_up} bitrate={current} -> {bitrate}")
+        try:
+            configure_link(interface, bitrate)
+        except Exception as e:
+            print(f"Failed to configure {interface}: {e}")
+            return False
+        _configured[interface] = bitrate
+        return True
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Bus load and response-latency metrics of the shared bus.
+
+Per arbitration ID: frame count, inter-arrival period and jitter (change of
+period from one frame to the next) histograms. Bus-wide: error frames.
+Per request ID: latency from our request to the ECU's reply, for the 0xAA
+pokes and the TPMS MAC writes. Collected per cycle for the VIN log; the last
+ROLLING_CYCLES cycles are merged into a rolling snapshot for tuning windows.
+"""
+
+import bisect
+import collections
+import json
+import statistics
+import threading
+import time
+
+# Our request ID -> ID the ECU replies on
+REQUEST_REPLIES = {0xCB: 0xCB, 0xAB: 0xAB, 0x7F3: 0x7F1}
+
+# Histogram bin edges in ms; the last bin is open-ended
+PERIOD_EDGES_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+JITTER_EDGES_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100]
+
+ROLLING_CYCLES = 50
+
+
+def percentile(hist, edges, fraction):
+    """Upper edge (ms) of the bin holding the given fraction of the samples."""
+    total = sum(hist)
+    if not total:
+        return None
+    seen = 0
+    for i, count in enumerate(hist):
+        seen += count
+        if seen >= fraction * total:
+            return edges[i] if i < len(edges) else float("inf")
+    return float("inf")
+
+
+class _IdStats:
+    __slots__ = ("frames", "last", "last_period", "period_sum", "period_min", "period_max", "period_hist", "jitter_hist")
+
+    def __init__(self):
+        self.frames = 0
+        self.last = None
+        self.last_period = None
+        self.period_sum = 0.0
+        self.period_min = None
+        self.period_max = None
+        self.period_hist = [0] * (len(PERIOD_EDGES_MS) + 1)
+        self.jitter_hist = [0] * (len(JITTER_EDGES_MS) + 1)
+
+
+class BusMetrics:
+    """Tap for the frame dispatcher; on_send is its counterpart for sent frames."""
+
+    def __init__(self, rolling_cycles=ROLLING_CYCLES):
+        self._lock = threading.Lock()
+        self.history = collections.deque(maxlen=rolling_cycles)
+        self.clear()
+
+    def attach(self, session):
+        session.add_tap(self)
+        session.add_send_tap(self.on_send)
+        return self
+
+    def clear(self):
+        with self._lock:
+            self.ids = {}
+            self.error_frames = 0
+            self.latencies = {}
+            self.unanswered = {}
+            self.pending = {}
+            self.start_time = time.perf_counter()
+
+    def __call__(self, msg):
+        # Called on the dispatcher thread for every received frame
+        now = time.perf_counter()
+        with self._lock:
+            if msg.is_error_frame:
+                self.error_frames += 1
+                return
+            stats = self.ids.get(msg.arbitration_id)
+            if stats is None:
+                stats = self.ids[msg.arbitration_id] = _IdStats()
+            stats.frames += 1
+            if stats.last is not None:
+                period = (msg.timestamp - stats.last) * 1000
+                stats.period_sum += period
+                if stats.period_min is None or period < stats.period_min:
+                    stats.period_min = period
+                if stats.period_max is None or period > stats.period_max:
+                    stats.period_max = period
+                stats.period_hist[bisect.bisect_right(PERIOD_EDGES_MS, period)] += 1
+                if stats.last_period is not None:
+                    stats.jitter_hist[bisect.bisect_right(JITTER_EDGES_MS, abs(period - stats.last_period))] += 1
+                stats.last_period = period
+            stats.last = msg.timestamp
+            request = self.pending.pop(msg.arbitration_id, None)
+            if request is not None:
+                request_id, sent = request
+                self.latencies.setdefault(request_id, []).append((now - sent) * 1000)
+
+    def on_send(self, msg):
+        reply_id = REQUEST_REPLIES.get(msg.arbitration_id)
+        if reply_id is None:
+            return
+        with self._lock:
+            previous = self.pending.get(reply_id)
+            if previous is not None:
+                self.unanswered[previous[0]] = self.unanswered.get(previous[0], 0) + 1
+            self.pending[reply_id] = (msg.arbitration_id, time.perf_counter())
+
+    def snapshot(self):
+        """Metrics since the last clear(), as plain data (JSON-ready)."""
+        with self._lock:
+            unanswered = dict(self.unanswered)
+            for request_id, _ in self.pending.values():
+                unanswered[request_id] = unanswered.get(request_id, 0) + 1
+            ids = {}
+            for can_id, stats in sorted(self.ids.items()):
+                ids[f"0x{can_id:03X}"] = {
+                    "frames": stats.frames,
+                    "period_sum_ms": stats.period_sum,
+                    "period_min_ms": stats.period_min,
+                    "period_max_ms": stats.period_max,
+                    "period_hist": list(stats.period_hist),
+                    "jitter_hist": list(stats.jitter_hist),
+                }
+            latency = {}
+            for request_id in sorted(set(self.latencies) | set(unanswered)):
+                latency[f"0x{request_id:03X}->0x{REQUEST_REPLIES[request_id]:03X}"] = {
+                    "samples_ms": list(self.latencies.get(request_id, [])),
+                    "unanswered": unanswered.get(request_id, 0),
+                }
+            return {
+                "duration": time.perf_counter() - self.start_time,
+                "error_frames": self.error_frames,
+                "ids": ids,
+                "latency": latency,
+            }
+
+    def end_cycle(self):
+        """Close the cycle: its snapshot joins the rolling history. Returns it."""
+        snapshot = self.snapshot()
+        self.history.append(snapshot)
+        self.clear()
+        return snapshot
+
+    def rolling(self):
+        """Snapshots of the recent cycles (and the running one) merged into one."""
+        return merge(list(self.history) + [self.snapshot()])
+
+    def write_rolling(self, path):
+        rolling = self.rolling()
+        rolling["cycles"] = len(self.history)
+        rolling["period_edges_ms"] = PERIOD_EDGES_MS
+        rolling["jitter_edges_ms"] = JITTER_EDGES_MS
+        with open(path, "w") as f:
+            json.dump(rolling, f, indent=2)
+
+
+def merge(snapshots):
+    merged = {"duration": 0.0, "error_frames": 0, "ids": {}, "latency": {}}
+    for snapshot in snapshots:
+        merged["duration"] += snapshot["duration"]
+        merged["error_frames"] += snapshot["error_frames"]
+        for name, stats in snapshot["ids"].items():
+            total = merged["ids"].get(name)
+            if total is None:
+                merged["ids"][name] = dict(stats, period_hist=list(stats["period_hist"]), jitter_hist=list(stats["jitter_hist"]))
+                continue
+            total["frames"] += stats["frames"]
+            total["period_sum_ms"] += stats["period_sum_ms"]
+            for key, pick in (("period_min_ms", min), ("period_max_ms", max)):
+                values = [v for v in (total[key], stats[key]) if v is not None]
+                total[key] = pick(values) if values else None
+            for key in ("period_hist", "jitter_hist"):
+                total[key] = [a + b for a, b in zip(total[key], stats[key])]
+        for name, stats in snapshot["latency"].items():
+            total = merged["latency"].setdefault(name, {"samples_ms": [], "unanswered": 0})
+            total["samples_ms"].extend(stats["samples_ms"])
+            total["unanswered"] += stats["unanswered"]
+    return merged
+
+
+def describe(snapshot):
+    """Log lines for a snapshot: one per ID, one per request type."""
+    lines = [f"CAN ERROR FRAMES: {snapshot['error_frames']}"]
+    duration = snapshot["duration"] or 1.0
+    for name, stats in snapshot["ids"].items():
+        line = f"CAN ID {name}: {stats['frames']} frames ({stats['frames'] / duration:.1f}/sec)"
+        periods = sum(stats["period_hist"])
+        if periods:
+            jitter = percentile(stats["jitter_hist"], JITTER_EDGES_MS, 0.95)
+            line += (f", period {stats['period_sum_ms'] / periods:.1f} ms"
+                     f" (min {stats['period_min_ms']:.1f}, max {stats['period_max_ms']:.1f})")
+            if jitter is not None:
+                line += f", jitter p95 <= {jitter} ms"
+        lines.append(line)
+    for name, stats in snapshot["latency"].items():
+        samples = stats["samples_ms"]
+        line = f"CAN LATENCY {name}: {len(samples)} replies"
+        if samples:
+            line += f", min/median/max {min(samples):.1f}/{statistics.median(samples):.1f}/{max(samples):.1f} ms"
+        line += f", {stats['unanswered']} unanswered"
+        lines.append(line)
+    return lines
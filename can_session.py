@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+CAN bus session shared by all test modules.
+
+One session per process, or one per fixture when several vehicles are tested
+side by side: a thread running a fixture's cycle selects its session with
+use_session() and every get_session()/get_bus() in that cycle resolves to it.
+"""
+
+import configparser
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+import can
+
+import can_dispatch
+import can_link
+
+# Bus-off bit of the PCANBasic status word
+PCAN_ERROR_BUSOFF = 0x00010
+
+# Candidate backends, tried in order until one opens
+DEFAULT_BACKENDS = [
+    {"interface": "pcan", "channel": "PCAN_USBBUS1", "bitrate": 500000, "fd": False},
+    {"interface": "socketcan", "channel": "can0", "bitrate": 500000},
+]
+
+
+def pin_path(ini_path):
+    # station.ini is edited by hand and never rewritten; the pin lives next to it in station_pin.ini
+    root, ext = os.path.splitext(ini_path)
+    return f"{root}_pin{ext or '.ini'}"
+
+
+def load_pinned_backend(ini_path, section="SETTINGS"):
+    """(interface, channel) the last successful probe pinned, if any.
+
+    Read from station_pin.ini; a can_interface/can_channel set by hand in
+    station.ini is used when nothing has been pinned yet.
+    """
+    config = configparser.ConfigParser()
+    try:
+        config.read([ini_path, pin_path(ini_path)])
+        interface = config.get(section, "can_interface", fallback=None)
+        channel = config.get(section, "can_channel", fallback=None)
+    except Exception as e:
+        print(f"Error reading pinned CAN backend: {e}")
+        return None
+    if interface and channel:
+        return interface, channel
+    return None
+
+
+def save_pinned_backend(ini_path, interface, channel, section="SETTINGS"):
+    path = pin_path(ini_path)
+    config = configparser.ConfigParser()
+    try:
+        config.read(path)
+        if section not in config:
+            config[section] = {}
+        config[section]["can_interface"] = interface
+        config[section]["can_channel"] = channel
+        with open(path, 'w') as configfile:
+            config.write(configfile)
+    except Exception as e:
+        print(f"Failed to save pinned CAN backend to {path}: {e}")
+
+
+class CanBusSession:
+    """Owns one open CAN bus; every test reads it through the frame dispatcher."""
+
+    def __init__(self, backends=None, scope="process", ini_path=None, ini_section="SETTINGS"):
+        self.backends = backends or DEFAULT_BACKENDS
+        self.scope = scope if scope in ("process", "cycle") else "process"
+        self.ini_path = ini_path
+        self.ini_section = ini_section
+        self.pinned = load_pinned_backend(ini_path, ini_section) if ini_path else None
+        self.probe_times = {}
+        self.bus = None
+        self.dispatcher = None
+        self.interface = None
+        self.channel = None
+        self.open_time = None
+        self.cycle_open_time = 0.0
+        self.open_count = 0
+        self.recovery_count = 0
+        self.restart_count = 0
+        self.prefetched = {}
+        self.filters = None
+        self.taps = []
+        self.send_taps = []
+        self.supervisor = None
+        self.budget = None
+        self._lock = threading.RLock()
+
+    def open(self):
+        with self._lock:
+            if self.bus is not None:
+                return self.bus
+            start = time.perf_counter()
+            pinned = self.pinned_backend()
+            if pinned is not None:
+                bus = self.probe(pinned)
+                if bus is not None:
+                    return self.opened(bus, pinned, start)
+                print(f"Pinned CAN backend {pinned['interface']}/{pinned['channel']} failed, probing all backends")
+            # Full probe: only at first start or after the pinned backend failed
+            for config in self.backends:
+                if config is pinned:
+                    continue
+                bus = self.probe(config)
+                if bus is not None:
+                    self.pin(config)
+                    return self.opened(bus, config, start)
+            self.cycle_open_time += time.perf_counter() - start
+            print("No CAN interface found.")
+            return None
+
+    def probe(self, config):
+        start = time.perf_counter()
+        try:
+            if config["interface"] == "socketcan" and not can_link.ensure_link(config["channel"], config["bitrate"]):
+                raise OSError(f"link {config['channel']} could not be brought up at {config['bitrate']} bit/s")
+            bus = can.interface.Bus(**config)
+        except Exception as e:
+            print(f"{config['interface']} setup failed: {e}")
+            bus = None
+        self.probe_times[f"{config['interface']}/{config['channel']}"] = (time.perf_counter() - start, bus is not None)
+        return bus
+
+    def opened(self, bus, config, start):
+        self.bus = bus
+        self.apply_filters()
+        self.dispatcher = can_dispatch.FrameDispatcher(bus)
+        for tap in self.taps:
+            self.dispatcher.add_tap(tap)
+        for tap in self.send_taps:
+            self.dispatcher.add_send_tap(tap)
+        self.interface = config["interface"]
+        self.channel = config["channel"]
+        self.open_time = time.perf_counter() - start
+        self.cycle_open_time += self.open_time
+        self.open_count += 1
+        print(f"CAN bus opened on {self.interface}/{self.channel} in {self.open_time:.3f} sec")
+        return bus
+
+    def pinned_backend(self):
+        if self.pinned is None:
+            return None
+        for config in self.backends:
+            if (config["interface"], config["channel"]) == self.pinned:
+                return config
+        return None
+
+    def pin(self, config):
+        """Remember the backend that opened so later opens try it alone first."""
+        self.pinned = (config["interface"], config["channel"])
+        if self.ini_path:
+            save_pinned_backend(self.ini_path, *self.pinned, self.ini_section)
+
+    def describe_probe_times(self):
+        if not self.probe_times:
+            return "none"
+        return ", ".join(f"{name} {seconds:.3f} sec{'' if ok else ' (failed)'}" for name, (seconds, ok) in self.probe_times.items())
+
+    def get_dispatcher(self):
+        """Return the dispatcher on the shared bus, opening or recovering it when needed."""
+        with self._lock:
+            if self.bus is not None and self.dispatcher.failed:
+                self.recover()
+            elif self.bus is not None and self.is_bus_off():
+                self.restart_controller()
+            if self.bus is None:
+                self.open()
+            return self.dispatcher
+
+    def get_bus(self):
+        """Return a fresh reader on the shared bus.
+
+        The reader only queues frames received from now on, so a test never
+        reads data left over from the previous one.
+        """
+        dispatcher = self.get_dispatcher()
+        if dispatcher is None:
+            return None
+        return dispatcher.open_reader()
+
+    def is_bus_off(self):
+        try:
+            if self.interface == "pcan":
+                # PCAN reports bus-off in its status word, not in state
+                return bool(self.bus.status() & PCAN_ERROR_BUSOFF)
+            return self.bus.state == can.BusState.ERROR
+        except Exception:
+            # Backend does not report its state
+            return False
+
+    def recover(self):
+        with self._lock:
+            print(f"CAN bus-off detected on {self.interface}/{self.channel}, reopening")
+            self.recovery_count += 1
+            self.close()
+            return self.open()
+
+    def restart_controller(self):
+        """Bring the controller back from bus-off without closing the session.
+
+        PCAN is reset in the driver and SocketCAN links are restarted; other
+        backends, or a restart that did not take, fall back to recover().
+        """
+        with self._lock:
+            if self.bus is None:
+                return None
+            start = time.perf_counter()
+            restarted = False
+            try:
+                if self.interface == "pcan":
+                    restarted = self.bus.reset()
+                elif self.interface == "socketcan":
+                    restarted = can_link.restart_link(self.channel)
+            except Exception as e:
+                print(f"CAN controller restart failed: {e}")
+            if not restarted or self.dispatcher.failed:
+                return self.recover()
+            self.restart_count += 1
+            print(f"CAN bus-off on {self.interface}/{self.channel}, controller restarted in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return self.bus
+
+    def add_tap(self, tap):
+        """Call tap(msg) for every received frame, across reopens of the bus."""
+        with self._lock:
+            self.taps.append(tap)
+            if self.dispatcher is not None:
+                self.dispatcher.add_tap(tap)
+
+    def add_send_tap(self, tap):
+        """Call tap(msg) for every frame sent on the shared bus."""
+        with self._lock:
+            self.send_taps.append(tap)
+            if self.dispatcher is not None:
+                self.dispatcher.add_send_tap(tap)
+
+    def set_filters(self, filters):
+        """Install acceptance filters so the driver drops frames no step listens for."""
+        self.filters = filters or None
+        if self.bus is not None:
+            self.apply_filters()
+
+    def apply_filters(self):
+        try:
+            self.bus.set_filters(self.filters)
+        except Exception as e:
+            print(f"Failed to apply CAN filters: {e}")
+
+    def window(self, nominal):
+        """Listen window for the running step, shortened to fit the cycle budget if one is set."""
+        if self.budget is None:
+            return nominal
+        return self.budget.window(nominal)
+
+    def store_prefetched(self, name, subscription):
+        # What the shared passive window caught for a step (a frame_fanout.Subscription)
+        self.prefetched[name] = subscription
+
+    def has_prefetched(self, name):
+        return name in self.prefetched
+
+    def take_prefetched(self, name):
+        # Frames are handed out once; a retry listens live again
+        return self.prefetched.pop(name, None)
+
+    def begin_cycle(self, budget=None):
+        self.cycle_open_time = 0.0
+        self.prefetched = {}
+        self.budget = budget
+
+    def end_cycle(self):
+        self.prefetched = {}
+        self.budget = None
+        if self.scope == "cycle":
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self.bus is None:
+                return
+            try:
+                self.dispatcher.close()
+            except Exception as e:
+                print(f"Failed to stop CAN dispatcher: {e}")
+            self.dispatcher = None
+            try:
+                self.bus.shutdown()
+            except Exception as e:
+                print(f"Failed to shut down CAN bus: {e}")
+            self.bus = None
+
+    def shutdown(self):
+        self.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+# Session of the fixture whose cycle the current thread (or task) is running
+_current_session = contextvars.ContextVar("can_session", default=None)
+
+
+def get_session():
+    global _session
+    session = _current_session.get()
+    if session is not None:
+        return session
+    with _session_lock:
+        if _session is None:
+            _session = CanBusSession()
+        return _session
+
+
+def set_session(session):
+    global _session
+    with _session_lock:
+        _session = session
+
+
+@contextlib.contextmanager
+def use_session(session):
+    """Make session the one get_session() returns in this thread, and in the
+    tasks and executor calls it starts, until the block ends."""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+
+def get_bus():
+    return get_session().get_bus()
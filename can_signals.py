@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Signal database of the test modules, read from signals.dbc.
+
+Only the DBC subset the station needs is understood: BO_ messages and their
+SG_ signals (Intel @1 and Motorola @0 byte order, signed or unsigned, scale
+and offset). Each message compiles once into shift/mask decoders, so a frame
+is decoded with one int.from_bytes and a few integer operations per signal,
+and a buffer of many frames in one vectorized pass. New signals are added to
+signals.dbc; no code changes are needed.
+"""
+
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+DATABASE = "signals.dbc"
+
+_MESSAGE = re.compile(r"^BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)")
+_SIGNAL = re.compile(
+    r"^SG_\s+(\w+)\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*\(([^,]+),([^)]+)\)"
+)
+
+
+def database_path(name=DATABASE):
+    # Next to this file, or in the PyInstaller bundle like the station's other resources
+    base_path = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, name)
+
+
+class Signal:
+    __slots__ = ("name", "little_endian", "shift", "mask", "sign_bit", "scale", "offset", "digits", "min_length")
+
+    def __init__(self, name, start, length, little_endian, signed, scale, offset):
+        self.name = name
+        self.little_endian = little_endian
+        self.mask = (1 << length) - 1
+        self.sign_bit = 1 << (length - 1) if signed else 0
+        if little_endian:
+            # Intel: start is the LSB; shift the little-endian payload integer
+            self.shift = start
+            last_bit = start + length - 1
+        else:
+            # Motorola: start is the MSB in DBC sawtooth numbering; shift the
+            # payload read big-endian and padded to 8 bytes
+            msb = (start // 8) * 8 + (7 - start % 8)
+            last_bit = msb + length - 1
+            self.shift = 63 - last_bit
+        self.min_length = last_bit // 8 + 1
+        self.scale = scale
+        self.offset = offset
+        # Integer signals stay int; scaled ones are rounded to the scale's resolution
+        if float(scale).is_integer() and float(offset).is_integer():
+            self.scale, self.offset, self.digits = int(scale), int(offset), None
+        else:
+            self.digits = max(len(repr(float(value)).split(".")[1]) for value in (scale, offset))
+
+
+class MessageDecoder:
+    def __init__(self, frame_id, name, length):
+        self.frame_id = frame_id
+        self.name = name
+        self.length = length
+        self.signals = []
+
+    def decode(self, data):
+        """{signal: physical value}; None for signals beyond a short frame."""
+        data = bytes(data)
+        little = int.from_bytes(data, "little")
+        big = int.from_bytes(data[:8].ljust(8, b"\0"), "big")
+        values = {}
+        for signal in self.signals:
+            if len(data) < signal.min_length:
+                values[signal.name] = None
+                continue
+            raw = ((little if signal.little_endian else big) >> signal.shift) & signal.mask
+            if raw & signal.sign_bit:
+                raw -= signal.sign_bit << 1
+            value = raw * signal.scale + signal.offset
+            values[signal.name] = value if signal.digits is None else round(value, signal.digits)
+        return values
+
+    def decode_signal(self, data, name):
+        return self.decode(data)[name]
+
+    def encode(self, values):
+        """Payload of self.length bytes carrying {signal: physical value}; other bits 0."""
+        little = big = 0
+        for signal in self.signals:
+            if signal.name not in values:
+                continue
+            raw = round((values[signal.name] - signal.offset) / signal.scale) & signal.mask
+            if signal.little_endian:
+                little |= raw << signal.shift
+            else:
+                big |= raw << signal.shift
+        data = bytes(a | b for a, b in zip(little.to_bytes(8, "little"), big.to_bytes(8, "big")))
+        return data[:self.length]
+
+    def decode_samples(self, name, buffer, lengths):
+        """Values of one signal for every row of a (frames, 8) uint8 buffer.
+
+        lengths holds each frame's data length; frames too short for the
+        signal are left out.
+        """
+        signal = next(s for s in self.signals if s.name == name)
+        raw = np.ascontiguousarray(buffer, dtype=np.uint8).view("<u8" if signal.little_endian else ">u8").ravel()
+        raw = ((raw >> np.uint64(signal.shift)) & np.uint64(signal.mask))[lengths >= signal.min_length].astype(np.int64)
+        if signal.sign_bit:
+            raw = np.where(raw & signal.sign_bit, raw - (signal.sign_bit << 1), raw)
+        values = raw * signal.scale + signal.offset
+        return values if signal.digits is None else np.round(values, signal.digits)
+
+
+class Measurement:
+    """Summary of a signal sampled over a window."""
+
+    __slots__ = ("count", "mean", "min", "max", "std")
+
+    def __init__(self, values):
+        self.count = len(values)
+        self.mean = float(np.mean(values)) if self.count else None
+        self.min = float(np.min(values)) if self.count else None
+        self.max = float(np.max(values)) if self.count else None
+        self.std = float(np.std(values)) if self.count else None
+
+
+def sample_buffer(messages):
+    """(frames, 8) uint8 buffer of the messages' data, zero padded, and their lengths."""
+    buffer = np.zeros((len(messages), 8), dtype=np.uint8)
+    lengths = np.zeros(len(messages), dtype=np.int64)
+    for i, msg in enumerate(messages):
+        n = min(len(msg.data), 8)
+        buffer[i, :n] = msg.data[:n]
+        lengths[i] = n
+    return buffer, lengths
+
+
+def parse_dbc(text):
+    """{message name: MessageDecoder} from DBC text."""
+    messages = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        match = _MESSAGE.match(line)
+        if match:
+            frame_id, name, length = match.groups()
+            # Bit 31 marks an extended ID in DBC files
+            current = MessageDecoder(int(frame_id) & 0x1FFFFFFF, name, int(length))
+            messages[name] = current
+            continue
+        match = _SIGNAL.match(line)
+        if match and current is not None:
+            name, start, length, order, sign, scale, offset = match.groups()
+            current.signals.append(Signal(
+                name, int(start), int(length), order == "1", sign == "-", float(scale), float(offset)
+            ))
+    return messages
+
+
+_messages = None
+_lock = threading.Lock()
+
+
+def load(path=None):
+    global _messages
+    with _lock:
+        if _messages is None or path is not None:
+            with open(path or database_path(), encoding="utf-8") as f:
+                _messages = parse_dbc(f.read())
+        return _messages
+
+
+def message(name):
+    """Compiled decoder of a message in signals.dbc, by name."""
+    messages = load()
+    if name not in messages:
+        raise KeyError(f"Message {name} is not in {DATABASE}")
+    return messages[name]
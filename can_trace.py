@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded per-cycle CAN trace: every dispatched frame goes into preallocated
+numpy columns and is written out as one compact binary file per VIN.
+
+File layout: MAGIC, a HEADER_DTYPE record, then `count` FRAME_DTYPE records
+in arrival order.
+"""
+
+import threading
+
+import numpy as np
+
+MAGIC = b"NXTRACE1"
+HEADER_DTYPE = np.dtype([("count", "<u4"), ("overwritten", "<u8"), ("capacity", "<u4")])
+FRAME_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("can_id", "<u4"),
+    ("dlc", "u1"),
+    ("flags", "u1"),
+    ("data", "u1", (8,)),
+])
+
+FLAG_EXTENDED = 0x1
+FLAG_REMOTE = 0x2
+FLAG_ERROR = 0x4
+
+# 2^18 frames * 22 bytes: about 5.5 MB, a few minutes of a fully loaded 500k bus
+DEFAULT_CAPACITY = 1 << 18
+
+
+class TraceRecorder:
+    """Ring buffer of the most recent frames; memory is fixed at construction."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.timestamp = np.zeros(capacity, dtype="<f8")
+        self.can_id = np.zeros(capacity, dtype="<u4")
+        self.dlc = np.zeros(capacity, dtype="u1")
+        self.flags = np.zeros(capacity, dtype="u1")
+        self.data = np.zeros((capacity, 8), dtype="u1")
+        self.index = 0
+        self.count = 0
+        self.overwritten = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, msg):
+        # Called on the dispatcher thread for every received frame
+        with self._lock:
+            i = self.index
+            self.timestamp[i] = msg.timestamp
+            self.can_id[i] = msg.arbitration_id
+            n = min(len(msg.data), 8)
+            self.dlc[i] = n
+            self.flags[i] = (FLAG_EXTENDED if msg.is_extended_id else 0) | (FLAG_REMOTE if msg.is_remote_frame else 0) | (FLAG_ERROR if msg.is_error_frame else 0)
+            row = self.data[i]
+            row[:n] = msg.data[:n]
+            row[n:] = 0
+            self.index = i + 1 if i + 1 < self.capacity else 0
+            if self.count < self.capacity:
+                self.count += 1
+            else:
+                self.overwritten += 1
+
+    def clear(self):
+        with self._lock:
+            self.index = 0
+            self.count = 0
+            self.overwritten = 0
+
+    def snapshot(self):
+        """Recorded frames, oldest first, as a FRAME_DTYPE array."""
+        with self._lock:
+            start = (self.index - self.count) % self.capacity
+            order = (np.arange(self.count) + start) % self.capacity
+            frames = np.empty(self.count, dtype=FRAME_DTYPE)
+            frames["timestamp"] = self.timestamp[order]
+            frames["can_id"] = self.can_id[order]
+            frames["dlc"] = self.dlc[order]
+            frames["flags"] = self.flags[order]
+            frames["data"] = self.data[order]
+            overwritten = self.overwritten
+        return frames, overwritten
+
+    def flush(self, path):
+        """Write the cycle's frames to path and start a new cycle. Returns the frame count."""
+        frames, overwritten = self.snapshot()
+        header = np.array([(len(frames), overwritten, self.capacity)], dtype=HEADER_DTYPE)
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(header.tobytes())
+            f.write(frames.tobytes())
+        self.clear()
+        return len(frames)
+
+
+def load_trace(path):
+    """(frames, overwritten) from a file written by TraceRecorder.flush."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a CAN trace file")
+        header = np.frombuffer(f.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)[0]
+        frames = np.frombuffer(f.read(), dtype=FRAME_DTYPE, count=int(header["count"]))
+    return frames, int(header["overwritten"])
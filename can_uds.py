@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal UDS (ISO 14229) client over ISO-TP on the shared bus.
+"""
+
+import can_isotp
+import can_session
+
+DIAGNOSTIC_SESSION_CONTROL = 0x10
+READ_DATA_BY_IDENTIFIER = 0x22
+WRITE_DATA_BY_IDENTIFIER = 0x2E
+NEGATIVE_RESPONSE = 0x7F
+RESPONSE_PENDING = 0x78
+
+DEFAULT_SESSION = 0x01
+EXTENDED_SESSION = 0x03
+
+# Server response times (P2 and P2* of ISO 14229-2)
+P2_TIMEOUT = 0.15
+P2_EXTENDED_TIMEOUT = 5.0
+
+
+class UdsError(Exception):
+    def __init__(self, message, nrc=None):
+        super().__init__(message)
+        self.nrc = nrc
+
+
+class UdsClient:
+    def __init__(self, channel, p2=P2_TIMEOUT, p2_extended=P2_EXTENDED_TIMEOUT):
+        self.channel = channel
+        self.p2 = p2
+        self.p2_extended = p2_extended
+
+    def request(self, payload):
+        """Send one request and return the positive response payload."""
+        try:
+            return self._request(payload)
+        except can_isotp.IsoTpError as e:
+            raise UdsError(str(e))
+
+    def _request(self, payload):
+        service = payload[0]
+        self.channel.send(payload)
+        timeout = self.p2
+        while True:
+            response = self.channel.recv(timeout)
+            if response is None:
+                raise UdsError(f"No response to service {service:#04x}")
+            if response[0] == NEGATIVE_RESPONSE and len(response) >= 3 and response[1] == service:
+                if response[2] == RESPONSE_PENDING:
+                    timeout = self.p2_extended
+                    continue
+                raise UdsError(f"Service {service:#04x} rejected with NRC {response[2]:#04x}", response[2])
+            if response[0] == service + 0x40:
+                return response
+
+    def diagnostic_session(self, session_type=EXTENDED_SESSION):
+        return self.request(bytes([DIAGNOSTIC_SESSION_CONTROL, session_type]))
+
+    def read_dids(self, dids, lengths=None, max_per_request=None):
+        """ReadDataByIdentifier for several DIDs, as few round trips as possible.
+
+        lengths maps DID -> data length; it is needed to split a response that
+        carries more than one DID. DIDs without a known length are read alone.
+        Returns {did: bytes}.
+        """
+        lengths = lengths or {}
+        known = [did for did in dids if did in lengths]
+        unknown = [did for did in dids if did not in lengths]
+        batch_size = max_per_request or len(known) or 1
+        batches = [known[i:i + batch_size] for i in range(0, len(known), batch_size)]
+        batches += [[did] for did in unknown]
+
+        values = {}
+        for batch in batches:
+            request = bytearray([READ_DATA_BY_IDENTIFIER])
+            for did in batch:
+                request += did.to_bytes(2, "big")
+            response = self.request(bytes(request))
+            values.update(self._split_dids(response[1:], batch, lengths))
+        return values
+
+    @staticmethod
+    def _split_dids(data, batch, lengths):
+        values = {}
+        offset = 0
+        for did in batch:
+            if data[offset:offset + 2] != did.to_bytes(2, "big"):
+                raise UdsError(f"Response to DID {did:#06x} is out of order")
+            offset += 2
+            size = lengths.get(did, len(data) - offset)
+            values[did] = bytes(data[offset:offset + size])
+            offset += size
+        return values
+
+    def read_did(self, did):
+        return self.read_dids([did])[did]
+
+    def write_did(self, did, data):
+        """WriteDataByIdentifier; raises UdsError unless the ECU confirms."""
+        response = self.request(bytes([WRITE_DATA_BY_IDENTIFIER]) + did.to_bytes(2, "big") + bytes(data))
+        if response[1:3] != did.to_bytes(2, "big"):
+            raise UdsError(f"Write of DID {did:#06x} confirmed for another DID")
+
+
+def open_client(tx_id, rx_id, bus=None, **isotp_options):
+    """UDS client on its own reader of the shared bus (or the given bus)."""
+    if bus is None:
+        bus = can_session.get_bus()
+    if bus is None:
+        return None
+    return UdsClient(can_isotp.IsoTpChannel(bus, tx_id, rx_id, **isotp_options))
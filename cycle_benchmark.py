@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the test cycle of every SKU in sku_files/ against the ECU simulator.
+
+Runs each SKU's plan through the station's Sequencer (shared session, plan
+filters, passive capture, steps side by side with their retries) and prints
+per-step and total times. The GUI's fixed delays between steps are not included.
+
+    python cycle_benchmark.py --repeat 3 --save baseline.json
+    python cycle_benchmark.py --compare baseline.json --tolerance 0.2
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import can_async
+import can_filters
+import can_session
+import cycle_budget
+import ecu_simulator
+import frame_fanout
+import sequencer
+import test_plan
+
+VIN_NUMBER = "MD6EVM1D7S4E01133"
+
+
+class TimingListener(sequencer.Listener):
+    """Times each reported step from its first attempt to the end of its last, retry waits included."""
+
+    def __init__(self):
+        self.passive_time = 0.0
+        self.started = {}
+        self.ended = {}
+        self.results = []
+
+    def passive_done(self, resolved, total, duration):
+        self.passive_time = duration
+
+    def step_started(self, index, step, attempt):
+        self.started.setdefault(index, time.perf_counter())
+
+    def attempt_result(self, index, step, attempt, passed, actual_value, api_expected, note):
+        self.ended[index] = time.perf_counter()
+
+    def attempt_error(self, index, step, attempt, error):
+        self.ended[index] = time.perf_counter()
+
+    def step_finished(self, index, step, passed, actual_value, attempts, error):
+        self.results.append((step, self.ended[index] - self.started[index], passed))
+
+    def over_budget(self, index, step):
+        self.results.append((step, 0.0, False))
+
+
+def run_cycle(plan, session, api_url, target=None):
+    """One cycle; returns (passive seconds, cycle seconds, [(step, seconds, passed)]).
+
+    As on the station, steps after the first failure are not run or reported.
+    """
+    library, steps = plan.library, plan.names
+    subscriptions = can_filters.plan_subscriptions(library, steps)
+    passive = frame_fanout.plan_subscriptions(library, steps)
+    if len(passive) < 2:
+        passive = []
+    budget = None
+    if target:
+        budget = cycle_budget.for_plan(target, library, steps, passive)
+        budget.start()
+    session.begin_cycle(budget)
+    session.set_filters(can_filters.plan_filters(subscriptions))
+
+    listener = TimingListener()
+    start = time.perf_counter()
+    sequencer.Sequencer(plan, VIN_NUMBER, api_url, session, budget, listener).run(passive)
+    total = time.perf_counter() - start
+    session.end_cycle()
+    return listener.passive_time, total, listener.results
+
+
+def benchmark(sku_files, repeat, simulator_options, target=None):
+    report = {}
+    with ecu_simulator.EcuSimulator(**simulator_options) as simulator:
+        api = ecu_simulator.ApiStub().start()
+        session = can_session.CanBusSession(
+            backends=[{"interface": "virtual", "channel": simulator.channel, "bitrate": 500000}]
+        )
+        can_session.set_session(session)
+        try:
+            for path in sku_files:
+                sku = os.path.basename(path).split(" - ")[0]
+                plan = test_plan.load(path)
+                steps, library = plan.names, plan.library
+                if library is None:
+                    print(f"{sku}: no library has step {steps[:1]}, skipped")
+                    continue
+                # A passing vehicle of this SKU
+                simulator.frames = ecu_simulator.plan_frames(plan)
+                api.sku = sku
+                totals = []
+                passive_times = []
+                step_times = {name: [] for name in steps}
+                failures = set()
+                for _ in range(repeat):
+                    passive_time, total, results = run_cycle(plan, session, api.url(VIN_NUMBER), target)
+                    passive_times.append(passive_time)
+                    totals.append(total)
+                    for name, seconds, ok in results:
+                        step_times[name].append(seconds)
+                        if not ok:
+                            failures.add(name)
+                report[sku] = {
+                    "library": library,
+                    "total": statistics.median(totals),
+                    "passive": statistics.median(passive_times),
+                    # Steps never reached (after a failure) show 0
+                    "steps": {name: statistics.median(times) if times else 0.0 for name, times in step_times.items()},
+                    "failed": sorted(failures),
+                }
+        finally:
+            session.shutdown()
+            api.stop()
+    return report
+
+
+def print_report(report, baseline=None, tolerance=0.2):
+    regressions = []
+    for sku, result in report.items():
+        print(f"\n{sku} ({result['library']}): {result['total']:.3f} sec")
+        print(f"  {'passive capture':<22}{result['passive']:8.3f} sec")
+        for name, seconds in result["steps"].items():
+            flag = " FAILED" if name in result["failed"] else ""
+            print(f"  {name:<22}{seconds:8.3f} sec{flag}")
+        if baseline and sku in baseline:
+            before = baseline[sku]["total"]
+            if result["total"] > before * (1 + tolerance):
+                regressions.append(f"{sku}: {before:.3f} -> {result['total']:.3f} sec")
+    if regressions:
+        print("\nTiming regressions:")
+        for line in regressions:
+            print(f"  {line}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sku", action="append", help="SKU to run (default: every file in sku_files/)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--period", type=float, default=0.1, help="broadcast period in sec")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- period jitter in sec")
+    parser.add_argument("--dropout", type=float, default=0.0, help="chance each broadcast frame is dropped")
+    parser.add_argument("--latency", type=float, default=0.005, help="request reply latency in sec")
+    parser.add_argument("--offline", action="append", default=[], help="ECU to leave silent, e.g. VCU")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--budget", type=float, help="cycle time budget in sec, as [CYCLE_BUDGET] sets it")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to check for timing regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline")
+    args = parser.parse_args()
+
+    if args.sku:
+        sku_files = [os.path.join("sku_files", f"{sku} - details.xlsx") for sku in args.sku]
+    else:
+        sku_files = sorted(glob.glob(os.path.join("sku_files", "* - details.xlsx")))
+    simulator_options = {
+        "period": args.period, "jitter": args.jitter, "dropout": args.dropout,
+        "latency": args.latency, "offline": args.offline, "seed": args.seed,
+    }
+    # Step output goes to each step's log, as on the station, not to the console
+    can_async.route_output()
+    report = benchmark(sku_files, args.repeat, simulator_options, args.budget)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = print_report(report, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
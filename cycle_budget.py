@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Shared time budget for one test cycle.
+
+Every step has a nominal window (how long it may listen when time is
+plentiful). When a step starts it is allotted its share of what is left of
+the cycle target, in proportion to its nominal window among the steps still
+to run, so time saved by fast steps flows to the later ones. Listen windows
+are clamped to the current step's deadline; steps running side by side each
+keep their own deadline, on their own thread.
+"""
+
+import threading
+import time
+
+import module_registry
+
+# Nominal window for steps that declare neither STEP_WINDOW nor PASSIVE_WINDOW
+DEFAULT_STEP_WINDOW = 1.0
+
+# Budget entry of the shared passive window (see frame_fanout.run_passive_block)
+PASSIVE_STEP = "passive capture"
+
+
+def nominal_window(library_name, step):
+    try:
+        module = module_registry.load(f"{library_name}.{step}")
+    except Exception:
+        return DEFAULT_STEP_WINDOW
+    return getattr(module, "STEP_WINDOW", getattr(module, "PASSIVE_WINDOW", DEFAULT_STEP_WINDOW))
+
+
+def for_plan(target, library_name, steps, passive_subscriptions=()):
+    """Budget for a plan. The shared passive window is budgeted at its longest
+    subscription. The steps it serves keep their own window as their share (what
+    a retry listening live needs), so the window is allotted its part of the
+    cycle rather than all of it, and an ECU that stays silent costs that part."""
+    nominal = {}
+    if passive_subscriptions:
+        nominal[PASSIVE_STEP] = max(sub.window for sub in passive_subscriptions)
+    for step in steps:
+        nominal[step] = nominal_window(library_name, step)
+    return CycleBudget(target, nominal)
+
+
+class CycleBudget:
+    def __init__(self, target, nominal):
+        """target: cycle time in seconds; nominal: {step: nominal window} in run order."""
+        self.target = target
+        self.nominal = dict(nominal)
+        self.pending = list(self.nominal)
+        self.start_time = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.pending = list(self.nominal)
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def remaining(self):
+        return max(0.0, self.target - self.elapsed())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    @property
+    def step(self):
+        return getattr(self._local, "step", None)
+
+    @property
+    def step_deadline(self):
+        return getattr(self._local, "deadline", None)
+
+    def begin_step(self, step, nominal=None):
+        """Allot the step its share of the remaining budget; returns the seconds allotted."""
+        with self._lock:
+            if step in self.pending:
+                self.pending.remove(step)
+            window = nominal if nominal is not None else self.nominal.get(step, DEFAULT_STEP_WINDOW)
+            if window:
+                still_to_run = window + sum(self.nominal[name] for name in self.pending)
+                allotted = self.remaining() * window / still_to_run
+            else:
+                # Served from the passive window; a retry listening live only gets spare time
+                allotted = self.slack()
+        self._local.step = step
+        self._local.deadline = time.monotonic() + allotted
+        return allotted
+
+    def window(self, nominal):
+        """A listen window of nominal seconds, cut short at the step and cycle deadlines."""
+        limits = [nominal, self.remaining()]
+        if self.step_deadline is not None:
+            limits.append(self.step_deadline - time.monotonic())
+        return max(0.0, min(limits))
+
+    def slack(self):
+        """Time not needed by the pending steps' nominal windows."""
+        pending = list(self.pending)
+        return max(0.0, self.remaining() - sum(self.nominal[name] for name in pending))
+
+    def retry_delay(self, nominal):
+        return min(nominal, self.slack())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Where a finished test cycle goes: the VIN log file and the process-params API.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import requests
+
+import can_filters
+import can_metrics
+import module_registry
+
+RESULT_URL = "http://10.121.2.107:3000/vehicles/processParams/updateProcessParams"
+
+
+def log_path(log_folder, vin_number):
+    os.makedirs(log_folder, exist_ok=True)
+    return os.path.join(log_folder, f"{vin_number}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.txt")
+
+
+def write_log(txt_path, vin_number, final_status, url, json_response, test_results, test_times,
+              start_cycle_time, session, filters, budget=None, metrics=None, supervisor=None, import_costs=None,
+              retries=None):
+    timestamp_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    total_cycle_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(txt_path, 'a', encoding='utf-8') as file:
+        file.write(f"VIN NUMBER      : {vin_number}\n")
+        file.write(f"TEST STATUS     : {final_status}\n")
+        file.write(f"DATE            : {timestamp_now}\n")
+        file.write("API Request:\n")
+        file.write(f"{url}\n")
+        file.write("API Response:\n")
+        file.write('\n')
+        if isinstance(json_response, dict):
+            file.write(json.dumps(json_response, indent=4))
+        else:
+            file.write(str(json_response))
+        for idx, raw_log in enumerate(test_results):
+            for line in raw_log.strip().split('\n'):
+                file.write(f"{line}\n")
+            file.write(f"Cycle Time: {test_times[idx][1]:.2f} sec\n")
+            file.write('\n')
+        file.write(f"START CYCLE TIME: {start_cycle_time}\n")
+        file.write(f"TOTAL CYCLE TIME: {total_cycle_time}\n")
+        file.write(f"CAN BUS SETUP TIME: {session.cycle_open_time:.2f} sec\n")
+        file.write(f"CAN BACKEND PROBE TIMES: {session.describe_probe_times()}\n")
+        if session.channel:
+            file.write(f"CAN CHANNEL: {session.interface}/{session.channel}\n")
+        file.write(f"CAN FILTERS: {can_filters.describe_filters(filters)}\n")
+        if budget is not None:
+            file.write(f"CYCLE BUDGET: {budget.target:.2f} sec, used {budget.elapsed():.2f} sec\n")
+        if supervisor is not None:
+            file.write(f"CAN BUS SUPERVISION: {supervisor.describe()}\n")
+        if import_costs is not None:
+            file.write(f"STEP IMPORT TIME: {module_registry.describe_costs(import_costs)}\n")
+        if retries:
+            file.write("RETRY DECISIONS:\n")
+            for line in retries:
+                file.write(f"  {line}\n")
+        if metrics is not None:
+            for line in can_metrics.describe(metrics):
+                file.write(f"{line}\n")
+
+
+def send_result(vin_number, active_library, final_status, url=RESULT_URL, timeout=None):
+    headers = {'Content-Type': 'application/json'}
+    payload = {
+        "VIN": vin_number,
+        "paramId": "CZ14106" if active_library == "3W_Diagnostics" else "CZ14104",
+        "opnNo": "0024" if active_library == "3W_Diagnostics" else "0022",
+        "identifier": vin_number,
+        "result": final_status
+    }
+
+    try:
+        print("Sending final result to API...")
+        print("Request URL:", url)
+        print("Payload:", json.dumps(payload, indent=4))
+        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=timeout)
+        print(f"API Response [{response.status_code}]: {response.text}")
+    except Exception as e:
+        print(f"Failed to send final result to API: {e}")
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Hardware-free stand-in for the vehicle ECUs on python-can's virtual interface.
+
+Broadcasts the frames the test modules listen for, answers the 0xAA pokes on
+0xCB/0xAB and the TPMS MAC writes on 0x7F3, serves UDS data identifiers over
+ISO-TP, and serves a matching flash-file API response so the MCU and TPMS
+steps can run without the plant network.
+
+The built-in frames carry GE190240's values; plan_frames() carries those of
+any SKU sheet (its versions and the middle of its LSL..USL), so every SKU
+runs as a passing vehicle.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import can
+
+import can_isotp
+import can_signals
+
+# Periodic frames per ECU; payloads decode to plausible GE190240 values
+ECU_FRAMES = {
+    "BMS": {
+        0x22: [0x00, 0x00, 0x02, 0x1C, 0x00, 0x00, 0x00, 0x00],  # 54.0 V
+        0x23: [0x00, 0x0A, 0x14, 0x28, 0x00, 0x00, 0x00, 0x00],  # 20.10.40
+        0x26: [0x00] * 8,
+        0x27: [0x00] * 8,
+        0x28: [0x00] * 8,
+        0x2D: [0x00] * 8,
+        0x2E: [0x00] * 8,
+        0x2F: [0x00] * 8,
+        0x775: [0x00, 0x00, 0x00, 0x32, 0x00, 0x00, 0x00, 0x00],  # SOC 50
+    },
+    "MCU": {
+        0x15: [0x00] * 8,
+        0xA0: [0x00] * 8,
+        0xAB: [0x0F, 0xA0, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],  # phase offset 40.00
+        0xAF: [0x00] * 8,
+        0xB0: [0x00] * 8,
+        0xB7: [0x00] * 8,
+        0xC7: [0x01, 0x00, 0x13, 0x00, 0x00, 0x00, 0x00, 0x00],  # 1.0.19
+        0xC8: [0x00] * 8,
+        0xCA: [0x00] * 8,
+        0xCB: [0x0F, 0xA0, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],  # vehicle ID 4000
+        0x668: [0x00] * 8,
+    },
+    "VCU": {
+        0x669: [0x00] * 8,
+        0x7C5: [0x02, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],  # 2.0
+    },
+    "Cluster": {
+        0x77A: [0x00] * 8,
+        0x77C: [0x00, 0x00, 0x00, 0x64, 0x00, 0x00, 0x00, 0x00],  # 100.0.0
+    },
+    "Telematics": {
+        0x701: [0x00] * 8,
+        0x702: [0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x02, 0x00],  # 0.1.2
+        0x703: [0x00] * 8,
+    },
+}
+
+# SKU sheet steps the simulated frames follow: (ECU, signals.dbc message, signals).
+# A tuple of signals takes the dotted Value in order; a single signal the
+# middle of LSL..USL.
+SHEET_SIGNALS = {
+    "Battery_Version": ("BMS", "BMS_SoftwareVersion", ("Major", "Minor", "Revision")),
+    "MCU_Version": ("MCU", "MCU_SoftwareVersion", ("Major", "Minor", "Patch")),
+    "VCU_Version": ("VCU", "VCU_SoftwareVersion", ("Major", "Minor")),
+    "Cluster_Version": ("Cluster", "Cluster_FirmwareVersion", ("Major", "Minor", "Patch")),
+    "Telematics_Version": ("Telematics", "Telematics_Version", ("Major", "Micro", "Minor")),
+    "Battery_SOC": ("BMS", "BMS_StateOfCharge", "SOC"),
+    "Battery_Voltage": ("BMS", "BMS_PackVoltage", "PackVoltage"),
+}
+
+# Request ID -> reply ID; MCU pokes carry 0xAA, the cluster acks every TPMS write
+REQUEST_REPLIES = {0xCB: 0xCB, 0xAB: 0xAB, 0x7F3: 0x7F1}
+POKE = 0xAA
+
+# UDS servers: physical request/response IDs and the DIDs they hold (example values)
+UDS_SERVERS = {
+    "VCU": {
+        "request_id": 0x7E0,
+        "response_id": 0x7E8,
+        "dids": {
+            0xF1A0: bytes.fromhex("1A2B3C4D"),  # CVN
+            0xF1A1: b"VCU-CAL-0002.000",  # CALID
+            0xF190: b"MD6EVM1D7S4E01133",  # VIN
+        },
+    },
+}
+
+API_VEHICLE_ID = "4000"
+API_PHASE_OFFSET = "40.0"
+API_FRONT_MAC = "C06380910000"
+API_REAR_MAC = "C06380920000"
+API_SKU = "GE190240"
+
+
+def plan_frames(plan):
+    """ECU_FRAMES with the payloads a passing vehicle of a compiled test_plan sends."""
+    frames = {ecu: {can_id: list(data) for can_id, data in payloads.items()} for ecu, payloads in ECU_FRAMES.items()}
+    for step in plan.steps:
+        if step.step not in SHEET_SIGNALS:
+            continue
+        ecu, name, signals = SHEET_SIGNALS[step.step]
+        message = can_signals.message(name)
+        if isinstance(signals, tuple):
+            fields = step.value.strip().split(".")
+            if len(fields) != len(signals) or not all(field.isdigit() for field in fields):
+                print(f"{step.step}: cannot simulate Value '{step.value}', keeping the default frame")
+                continue
+            values = dict(zip(signals, map(int, fields)))
+        elif isinstance(step.lsl, float) and isinstance(step.usl, float):
+            values = {signals: (step.lsl + step.usl) / 2}
+        else:
+            continue
+        frames[ecu][message.frame_id] = list(message.encode(values))
+    return frames
+
+
+class EcuSimulator:
+    """Simulated ECUs on one virtual channel.
+
+    period is the broadcast period in seconds (or a dict per ECU name),
+    jitter is the +/- spread added to each period, dropout is the chance a
+    single frame is skipped and latency is the delay before a reply. ECUs
+    listed in offline neither broadcast nor reply. frames defaults to
+    ECU_FRAMES; assigning plan_frames() of another SKU switches the payloads
+    while running.
+    """
+
+    def __init__(self, channel="nirix-sim", period=0.1, jitter=0.0, dropout=0.0, latency=0.005, offline=(), seed=None,
+                 frames=None):
+        self.channel = channel
+        self.frames = frames or ECU_FRAMES
+        self.period = period
+        self.jitter = jitter
+        self.dropout = dropout
+        self.latency = latency
+        self.offline = set(offline)
+        self.random = random.Random(seed)
+        self.bus = None
+        self.uds_buses = []
+        self.uds_block_size = 0
+        self.uds_st_min = 0.0
+        self.frames_sent = 0
+        self.replies_sent = 0
+        self._stop = threading.Event()
+        self._send_lock = threading.Lock()
+        self._threads = []
+
+    def ecu_period(self, ecu):
+        if isinstance(self.period, dict):
+            return self.period.get(ecu, 0.1)
+        return self.period
+
+    def start(self):
+        self.bus = can.interface.Bus(interface="virtual", channel=self.channel)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._broadcast, daemon=True),
+            threading.Thread(target=self._respond, daemon=True),
+        ]
+        for ecu, server in UDS_SERVERS.items():
+            if ecu in self.offline:
+                continue
+            # Own bus instance so ISO-TP reads do not compete with the responder
+            bus = can.interface.Bus(interface="virtual", channel=self.channel)
+            self.uds_buses.append(bus)
+            channel = can_isotp.IsoTpChannel(
+                bus, server["response_id"], server["request_id"],
+                block_size=self.uds_block_size, st_min=self.uds_st_min,
+            )
+            self._threads.append(threading.Thread(target=self._serve_uds, args=(channel, server["dids"]), daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        if self.bus is not None:
+            self.bus.shutdown()
+            self.bus = None
+        for bus in self.uds_buses:
+            bus.shutdown()
+        self.uds_buses = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _send(self, can_id, data):
+        with self._send_lock:
+            self.bus.send(can.Message(arbitration_id=can_id, data=data, is_extended_id=False))
+
+    def _broadcast(self):
+        now = time.monotonic()
+        schedule = []
+        for ecu, frames in self.frames.items():
+            if ecu in self.offline:
+                continue
+            for can_id in frames:
+                # Stagger first sends so every ECU does not burst at once
+                schedule.append([now + self.random.uniform(0, self.ecu_period(ecu)), ecu, can_id])
+        while schedule and not self._stop.is_set():
+            entry = min(schedule, key=lambda e: e[0])
+            delay = entry[0] - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            _, ecu, can_id = entry
+            if self.random.random() >= self.dropout:
+                self._send(can_id, self.frames[ecu][can_id])
+                self.frames_sent += 1
+            entry[0] += max(0.001, self.ecu_period(ecu) + self.random.uniform(-self.jitter, self.jitter))
+
+    def _respond(self):
+        while not self._stop.is_set():
+            msg = self.bus.recv(timeout=0.1)
+            if msg is None or msg.arbitration_id not in REQUEST_REPLIES:
+                continue
+            if msg.arbitration_id == 0x7F3:
+                if "Cluster" in self.offline:
+                    continue
+                reply = (REQUEST_REPLIES[0x7F3], [0x01] + list(msg.data[1:]))
+            else:
+                if "MCU" in self.offline or not msg.data or msg.data[0] != POKE:
+                    continue
+                reply = (REQUEST_REPLIES[msg.arbitration_id], self.frames["MCU"][msg.arbitration_id])
+            timer = threading.Timer(self.latency, self._reply, reply)
+            timer.daemon = True
+            timer.start()
+
+    def _serve_uds(self, channel, dids):
+        dids = dict(dids)
+        while not self._stop.is_set():
+            try:
+                request = channel.recv(timeout=0.1)
+                if not request:
+                    continue
+                time.sleep(self.latency)
+                channel.send(self._uds_response(request, dids))
+            except can_isotp.IsoTpError:
+                continue
+
+    @staticmethod
+    def _uds_response(request, dids):
+        service = request[0]
+        if service == 0x10 and len(request) == 2:
+            return bytes([0x50, request[1], 0x00, 0x32, 0x01, 0xF4])
+        if service == 0x22 and len(request) >= 3 and len(request) % 2 == 1:
+            response = bytearray([0x62])
+            for i in range(1, len(request), 2):
+                did = int.from_bytes(request[i:i + 2], "big")
+                if did not in dids:
+                    return bytes([0x7F, service, 0x31])
+                response += request[i:i + 2] + dids[did]
+            return bytes(response)
+        if service == 0x2E and len(request) > 3:
+            dids[int.from_bytes(request[1:3], "big")] = bytes(request[3:])
+            return bytes([0x6E]) + bytes(request[1:3])
+        return bytes([0x7F, service, 0x11])
+
+    def _reply(self, can_id, data):
+        if self._stop.is_set():
+            return
+        self._send(can_id, data)
+        self.replies_sent += 1
+
+
+def flash_file_response(sku=API_SKU):
+    """Flash-file API payload carrying the values the simulated ECUs report."""
+    return {
+        "data": {
+            "modules": [
+                {"module": "VCU", "configs": [
+                    {"refname": "VCU_SKU_WRITE", "messages": [{"refname": "SKU_WRITE", "txbytes": sku}]},
+                ]},
+                {"module": "MCU", "configs": [
+                    {"refname": "VEHICLE_ID", "messages": [{"txbytes": API_VEHICLE_ID}]},
+                    {"refname": "MCU_PHASE_ANGLE_WRITE", "messages": [{"txbytes": API_PHASE_OFFSET}]},
+                ]},
+                {"module": "IPC", "configs": [
+                    {"refname": "IPC_TPMSRR_WRITE", "messages": [{"txbytes": API_FRONT_MAC}]},
+                    {"refname": "IPC_TPMSFR_WRITE", "messages": [{"txbytes": API_REAR_MAC}]},
+                ]},
+            ]
+        }
+    }
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._reply(flash_file_response(self.server.sku))
+
+    def do_POST(self):
+        # Final cycle results, as the process-params API takes them
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.results.append(json.loads(self.rfile.read(length) or b"{}"))
+        self._reply({"status": "success"})
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApiStub:
+    """Local HTTP server answering every GET with flash_file_response() and
+    keeping every posted cycle result in results."""
+
+    def __init__(self, host="127.0.0.1", port=0, sku=API_SKU):
+        self.server = ThreadingHTTPServer((host, port), _ApiHandler)
+        self.server.sku = sku
+        self.server.results = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def results(self):
+        return self.server.results
+
+    @property
+    def sku(self):
+        return self.server.sku
+
+    @sku.setter
+    def sku(self, sku):
+        # The SKU the flash-file response names from now on
+        self.server.sku = sku
+
+    def url(self, vin_number):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/vehicles/flashFile/ejo/{vin_number}"
+
+    def result_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/vehicles/processParams/updateProcessParams"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    with EcuSimulator() as simulator:
+        print(f"Simulating ECUs on virtual/{simulator.channel}; Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Test several vehicles at once, one per fixture, each on its own CAN channel.
+
+A fixture is a [FIXTURE_<n>] section of station.ini naming the CAN backends
+it may open, tried in order like the station's own:
+
+    [FIXTURE_2]
+    backends = pcan:PCAN_USBBUS2, socketcan:can1
+
+Every fixture runs its cycles in its own thread on its own CanBusSession, so
+each has its own VIN, SKU plan, results, VIN log and CAN trace. Scanned VINs
+are read from stdin as "<fixture> <VIN>" lines. --simulate runs the fixtures
+on virtual channels, each against its own ECU simulator.
+
+    python fixture_station.py --api PRD
+    python fixture_station.py --simulate --vin 1:MD6EVM1D7S4E01133 --vin 2:MD6EVM1D7S4E01134
+"""
+
+import argparse
+import configparser
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+import bus_supervisor
+import can_async
+import can_filters
+import can_metrics
+import can_session
+import can_trace
+import cycle_budget
+import cycle_report
+import frame_fanout
+import retry_policy
+import sequencer
+import test_plan
+
+STATION_INI = r"D:\Python\TVS_NIRIX_V1.4\station.ini"
+API_INI = r"D:\Python\TVS_NIRIX_V1.4\api.ini"
+LOG_FOLDER = r"D:\Python\TVS_NIRIX_V1.4\test_results"
+DEFAULT_SKU = "GE190510"
+
+
+def parse_backends(text, bitrate=500000):
+    """Backend configs from "interface:channel, ..." as CanBusSession takes them."""
+    backends = []
+    for item in text.split(","):
+        interface, _, channel = item.strip().partition(":")
+        if not channel:
+            continue
+        config = {"interface": interface.strip(), "channel": channel.strip(), "bitrate": bitrate}
+        if config["interface"] == "pcan":
+            config["fd"] = False
+        backends.append(config)
+    return backends
+
+
+def load_fixtures(ini_path):
+    """{name: section} of every [FIXTURE_<n>] in station.ini, in file order."""
+    config = configparser.ConfigParser()
+    try:
+        config.read(ini_path)
+    except Exception as e:
+        print(f"Error reading fixtures from station.ini: {e}")
+        return {}
+    return {name: dict(config[name]) for name in config.sections() if name.startswith("FIXTURE_")}
+
+
+def load_cycle_budget(ini_path, sku):
+    """Target cycle time for a SKU from [CYCLE_BUDGET], as the station reads it."""
+    config = configparser.ConfigParser()
+    try:
+        config.read(ini_path)
+        if "CYCLE_BUDGET" not in config:
+            return None
+        section = config["CYCLE_BUDGET"]
+        value = section.get(sku, section.get("default"))
+        return float(value) if value else None
+    except Exception as e:
+        print(f"Error reading cycle budget from station.ini: {e}")
+        return None
+
+
+def api_url(ini_path, mode, vin):
+    config = configparser.ConfigParser()
+    config.read(ini_path)
+    base_url = config.get("API", mode.upper(), fallback="http://10.121.2.107:3000/vehicles/flashFile/prd")
+    return base_url.rstrip("/") + f"/{vin}"
+
+
+def fetch_sku(url, max_attempts=3):
+    """(sku, API response) for a VIN; sku is None when the VIN is not in the API mode."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            response = requests.get(url, timeout=5)
+            if response.status_code == 200:
+                json_data = response.json()
+                for module in json_data.get("data", {}).get("modules", []):
+                    for config in module.get("configs", []):
+                        if config.get("refname") != "VCU_SKU_WRITE":
+                            continue
+                        for msg in config.get("messages", []):
+                            if msg.get("refname") == "SKU_WRITE" and msg.get("txbytes"):
+                                return msg.get("txbytes"), json_data
+                return None, json_data
+            if response.status_code == 404:
+                return None, None
+            print(f"API returned unexpected status: {response.status_code}")
+        except requests.RequestException as e:
+            print(f"API attempt {attempt} failed: {e}")
+        time.sleep(1)
+    print(f"API call failed after {max_attempts} attempts. Using default SKU: {DEFAULT_SKU}")
+    return DEFAULT_SKU, None
+
+
+class FixtureListener(sequencer.Listener):
+    def __init__(self, name, vin):
+        self.name = name
+        self.vin = vin
+
+    def attempt_error(self, index, step, attempt, error):
+        print(f"[{self.name}] {self.vin}: {step} failed (Attempt {attempt}): {error}")
+
+    def step_finished(self, index, step, passed, actual_value, attempts, error):
+        print(f"[{self.name}] {self.vin}: {step} {'PASSED' if passed else 'FAILED'} ({actual_value})")
+
+
+class Fixture:
+    """One test position: a CAN channel and the cycles run on it, one VIN at a time."""
+
+    def __init__(self, name, backends, ini_path=None, active_library=None, log_folder=LOG_FOLDER,
+                 sku_dir="sku_files", trace_frames=can_trace.DEFAULT_CAPACITY, result_url=cycle_report.RESULT_URL):
+        self.name = name
+        self.ini_path = ini_path
+        self.active_library = active_library
+        self.log_folder = log_folder
+        self.sku_dir = sku_dir
+        self.result_url = result_url
+        # Pinned backend is kept in the fixture's own station_pin.ini section
+        self.session = can_session.CanBusSession(backends, ini_path=ini_path, ini_section=name)
+        self.trace = can_trace.TraceRecorder(trace_frames)
+        self.session.add_tap(self.trace)
+        self.metrics = can_metrics.BusMetrics().attach(self.session)
+        self.supervisor = bus_supervisor.BusSupervisor().attach(self.session)
+        self.results = []
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._serve, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, vin, url):
+        self.queue.put((vin, url))
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.supervisor.stop()
+        self.session.shutdown()
+
+    def _serve(self):
+        with can_session.use_session(self.session):
+            self.session.open()
+            while True:
+                job = self.queue.get()
+                if job is None:
+                    return
+                vin, url = job
+                start = time.perf_counter()
+                try:
+                    status, txt_path = self.run_cycle(vin, url)
+                except Exception as e:
+                    print(f"[{self.name}] {vin}: cycle failed: {e}")
+                    status, txt_path = "NOK", None
+                duration = time.perf_counter() - start
+                self.results.append((vin, status, duration, txt_path))
+                print(f"[{self.name}] {vin}: {status or 'not tested'} in {duration:.2f} sec")
+
+    def run_cycle(self, vin, url):
+        """Test one vehicle; returns (final status, VIN log path)."""
+        cycle_start_time = datetime.now()
+        sku, json_response = fetch_sku(url)
+        if sku is None:
+            print(f"[{self.name}] {vin}: VIN is not in the selected API mode")
+            return None, None
+        test_file = test_plan.sku_path(self.sku_dir, sku)
+        if not os.path.exists(test_file):
+            print(f"[{self.name}] {vin}: test file for SKU '{sku}' not found")
+            return None, None
+        plan = test_plan.load(test_file)
+        test_names = plan.names
+        library = plan.library
+        if library is None or (self.active_library and library != self.active_library):
+            print(f"[{self.name}] {vin}: SKU {sku} is not in the active library ({self.active_library})")
+            return None, None
+        print(f"[{self.name}] {vin}: SKU {sku} | Library: {library}")
+
+        filters = can_filters.plan_filters(can_filters.plan_subscriptions(library, test_names))
+        subscriptions = frame_fanout.plan_subscriptions(library, test_names)
+        if len(subscriptions) < 2:
+            subscriptions = []
+        budget = None
+        target = load_cycle_budget(self.ini_path, sku) if self.ini_path else None
+        if target:
+            budget = cycle_budget.for_plan(target, library, test_names, subscriptions)
+            budget.start()
+        self.session.begin_cycle(budget)
+        self.trace.clear()
+        self.metrics.clear()
+        self.supervisor.clear()
+        self.session.set_filters(filters)
+
+        policies = retry_policy.load(self.ini_path) if self.ini_path else None
+        sequence = sequencer.Sequencer(
+            plan, vin, url, self.session, budget, FixtureListener(self.name, vin), policies=policies
+        )
+        final_status = sequence.run(subscriptions)
+
+        txt_path = cycle_report.log_path(self.log_folder, vin)
+        try:
+            cycle_report.write_log(
+                txt_path, vin, final_status, url, json_response, sequence.test_results, sequence.test_times,
+                cycle_start_time.strftime("%Y-%m-%d %H:%M:%S"), self.session, filters, budget, self.metrics.snapshot(),
+                self.supervisor, sequence.import_costs, sequence.retry_log
+            )
+            self.trace.flush(os.path.splitext(txt_path)[0] + ".trace")
+            self.metrics.end_cycle()
+            self.metrics.write_rolling(os.path.join(self.log_folder, f"can_metrics_{self.name}.json"))
+        except Exception as e:
+            print(f"[{self.name}] {vin}: error saving log file: {e}")
+        cycle_report.send_result(vin, library, final_status, self.result_url, timeout=5)
+        self.session.end_cycle()
+        return final_status, txt_path
+
+def fixture_name(text):
+    return text if text.upper().startswith("FIXTURE_") else f"FIXTURE_{text}"
+
+
+def read_scans(fixtures, api_ini, mode):
+    """Hand each "<fixture> <VIN>" line from stdin to its fixture until EOF."""
+    for line in sys.stdin:
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        name, vin = fixture_name(parts[0]), parts[1].strip()
+        if name not in fixtures:
+            print(f"Unknown fixture {parts[0]}; have {', '.join(fixtures)}")
+            continue
+        if not (vin.startswith("MD6") and len(vin) == 17):
+            print(f"[{name}] Invalid VIN number {vin}")
+            continue
+        fixtures[name].submit(vin, api_url(api_ini, mode, vin))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ini", default=STATION_INI)
+    parser.add_argument("--api-ini", default=API_INI)
+    parser.add_argument("--api", default="PRD", help="API mode from api.ini (PRD or EJO)")
+    parser.add_argument("--log-folder", default=LOG_FOLDER)
+    parser.add_argument("--simulate", action="store_true", help="run the fixtures on virtual channels against ECU simulators")
+    parser.add_argument("--fixtures", type=int, default=2, help="number of simulated fixtures")
+    parser.add_argument("--vin", action="append", default=[], help="<fixture>:<VIN> to test (with --simulate)")
+    args = parser.parse_args()
+
+    # Several fixtures print at once; each step's output goes to its own log
+    can_async.route_output()
+    start = time.perf_counter()
+    if args.simulate:
+        from ecu_simulator import ApiStub, EcuSimulator
+        api = ApiStub().start()
+        simulators = [EcuSimulator(channel=f"fixture{n}").start() for n in range(1, args.fixtures + 1)]
+        fixtures = {}
+        for n, simulator in enumerate(simulators, 1):
+            backends = [{"interface": "virtual", "channel": simulator.channel, "bitrate": 500000}]
+            fixtures[f"FIXTURE_{n}"] = Fixture(f"FIXTURE_{n}", backends, log_folder=args.log_folder, result_url=api.result_url())
+        for fixture in fixtures.values():
+            fixture.start()
+        for item in args.vin:
+            name, _, vin = item.partition(":")
+            if fixture_name(name) in fixtures:
+                fixtures[fixture_name(name)].submit(vin, api.url(vin))
+        for fixture in fixtures.values():
+            fixture.stop()
+        for simulator in simulators:
+            simulator.stop()
+        api.stop()
+    else:
+        settings = load_fixtures(args.ini)
+        if not settings:
+            print("No [FIXTURE_<n>] sections in station.ini")
+            sys.exit(1)
+        config = configparser.ConfigParser()
+        config.read(args.ini)
+        active_library = config.get("SETTINGS", "active_library", fallback=None)
+        fixtures = {}
+        for name, section in settings.items():
+            fixtures[name] = Fixture(
+                name, parse_backends(section.get("backends", ""), int(section.get("bitrate", 500000))),
+                ini_path=args.ini, active_library=section.get("active_library", active_library),
+                log_folder=args.log_folder,
+                trace_frames=int(config.get("SETTINGS", "can_trace_frames", fallback=can_trace.DEFAULT_CAPACITY)),
+            ).start()
+        print(f"Fixtures ready: {', '.join(fixtures)}; enter '<fixture> <VIN>' per scan")
+        try:
+            read_scans(fixtures, args.api_ini, args.api)
+        except KeyboardInterrupt:
+            pass
+        for fixture in fixtures.values():
+            fixture.stop()
+
+    wall_time = time.perf_counter() - start
+    cycles = [result for fixture in fixtures.values() for result in fixture.results]
+    busy_time = sum(duration for _, _, duration, _ in cycles)
+    print(f"{len(cycles)} cycles on {len(fixtures)} fixtures: {busy_time:.2f} sec of testing in {wall_time:.2f} sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Listen windows that end the moment a completion predicate holds, and the
+single window shared by all passive (broadcast-only) tests.
+
+Request/response tests that declare a POKE_ID join the shared window too:
+their requests go out back-to-back as it opens and each reply is matched to
+its test by arbitration ID, so the pokes cost one ECU latency, not one each.
+"""
+
+import time
+
+import can
+
+import can_session
+import cycle_budget
+import module_registry
+
+# Longest single recv() so resolved subscribers are noticed promptly
+POLL_INTERVAL = 0.1
+
+
+def all_of(ids):
+    """Done once every one of the IDs has been seen."""
+    ids = frozenset(ids)
+    return lambda sub: len(ids.intersection(sub.frames)) == len(ids)
+
+
+def any_of(ids, count=1):
+    """Done once count different IDs out of ids have been seen."""
+    ids = frozenset(ids)
+    return lambda sub: len(ids.intersection(sub.frames)) >= count
+
+
+def samples(count):
+    """Done once count frames (repeats included) have been collected.
+
+    In the shared window a sample collector does not hold the window open: once
+    the other tests are done it keeps the samples it has, if any.
+    """
+    done = lambda sub: len(sub.samples) >= count
+    done.sampling = True
+    return done
+
+
+class Subscription:
+    """One test listening for its CAN IDs until its predicate holds or its window ends.
+
+    frames keeps the first frame per ID in arrival order, samples every frame.
+    The predicate defaults to all_of(ids). request, if set, is the frame the
+    test sends to make the ECU answer on ids.
+    """
+
+    def __init__(self, name, ids, window, until=None, request=None):
+        self.name = name
+        self.ids = frozenset(ids)
+        self.window = window
+        self.until = until or all_of(self.ids)
+        self.sampling = getattr(self.until, "sampling", False)
+        self.request = request
+        self.frames = {}
+        self.samples = []
+        self.resolved_at = None
+
+    @property
+    def resolved(self):
+        return self.resolved_at is not None
+
+    def offer(self, msg, elapsed):
+        if self.resolved:
+            return
+        self.samples.append(msg)
+        if msg.arbitration_id not in self.frames:
+            self.frames[msg.arbitration_id] = msg
+        if self.until(self):
+            self.resolved_at = elapsed
+
+
+def capture(bus, subscriptions):
+    """Listen once, dispatching every frame to all subscriptions that want it.
+
+    Each subscription stops at its own window; the capture returns as soon as
+    the slowest one has resolved or timed out, not counting sample collectors
+    that already have a sample. Returns the elapsed seconds.
+    """
+    routes = {}
+    for sub in subscriptions:
+        for can_id in sub.ids:
+            routes.setdefault(can_id, []).append(sub)
+
+    # Sample collectors alone (a live listen) keep the window until they are done
+    lead = any(not sub.sampling for sub in subscriptions)
+    start = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - start
+        waiting = [sub for sub in subscriptions if not sub.resolved and elapsed < sub.window]
+        if lead and all(sub.sampling and sub.samples for sub in waiting):
+            waiting = []
+        if not waiting:
+            return elapsed
+        msg = bus.recv(timeout=min(POLL_INTERVAL, min(sub.window for sub in waiting) - elapsed))
+        if msg is None:
+            continue
+        for sub in routes.get(msg.arbitration_id, ()):
+            sub.offer(msg, time.monotonic() - start)
+
+
+def listen(bus, ids, window, until=None):
+    """Listen on bus for ids until the predicate holds or window seconds pass.
+
+    Returns the Subscription; its frames are whatever arrived in time.
+    """
+    sub = Subscription(None, ids, can_session.get_session().window(window), until)
+    capture(bus, [sub])
+    return sub
+
+
+def poke_request(module):
+    return can.Message(arbitration_id=module.POKE_ID, data=module.POKE_DATA, is_extended_id=False)
+
+
+def plan_subscriptions(library_name, test_names):
+    """Subscriptions for the steps that declare a PASSIVE_WINDOW (and optionally
+    PASSIVE_UNTIL), or a POKE_ID answered within their STEP_WINDOW."""
+    subscriptions = []
+    for name in test_names:
+        try:
+            module = module_registry.load(f"{library_name}.{name}")
+        except Exception as e:
+            print(f"Skipping {name} in passive capture: {e}")
+            continue
+        window = getattr(module, "PASSIVE_WINDOW", None)
+        if window:
+            subscriptions.append(Subscription(name, module.RX_CAN_IDS, window, getattr(module, "PASSIVE_UNTIL", None)))
+        elif getattr(module, "POKE_ID", None) is not None:
+            subscriptions.append(Subscription(
+                name, module.RX_CAN_IDS, module.STEP_WINDOW, any_of(module.RX_CAN_IDS), poke_request(module)
+            ))
+    return subscriptions
+
+
+def send_requests(bus, subscriptions):
+    """Send the batched pokes; returns the names of the subscriptions whose poke failed."""
+    unsent = set()
+    for sub in subscriptions:
+        if sub.request is None:
+            continue
+        try:
+            bus.send(sub.request)
+        except Exception as e:
+            # Nothing to wait for; the step pokes live on its first attempt
+            print(f"Poke for {sub.name} failed: {e}")
+            sub.resolved_at = 0.0
+            unsent.add(sub.name)
+    return unsent
+
+
+def run_passive_block(subscriptions, session=None):
+    """Capture for all subscriptions at once and park the frames on the session."""
+    session = session or can_session.get_session()
+    bus = session.get_bus()
+    if bus is None:
+        return None
+    if session.budget is not None:
+        session.budget.begin_step(cycle_budget.PASSIVE_STEP)
+        for sub in subscriptions:
+            sub.window = session.window(sub.window)
+    start = time.time()
+    try:
+        unsent = send_requests(bus, subscriptions)
+        duration = capture(bus, subscriptions)
+    except Exception as e:
+        print(f"Passive capture failed: {e}")
+        return None
+    hit = session.supervisor is not None and session.supervisor.incidents_since(start)
+    for sub in subscriptions:
+        # A test still waiting when a bus error fell in the window, or whose poke
+        # never went out, listens live instead
+        if (hit and not sub.resolved) or sub.name in unsent:
+            continue
+        session.store_prefetched(sub.name, sub)
+    return duration
+
+
+def collect(name, bus, ids, window, until=None):
+    """First frame per CAN ID for one test.
+
+    Uses the frames captured by the shared passive window when one ran for this
+    test; otherwise (or on a retry) listens live on the bus.
+    """
+    sub = can_session.get_session().take_prefetched(name)
+    if sub is not None:
+        return sub.frames
+    return listen(bus, ids, window, until).frames
+
+
+def transact(name, bus, request, ids, window):
+    """The ECU's first reply on ids to request.
+
+    Taken from the shared window when the request was batched there;
+    otherwise (or on a retry) sent now and awaited live. None on no reply.
+    """
+    sub = can_session.get_session().take_prefetched(name)
+    if sub is None:
+        bus.send(request)
+        sub = listen(bus, ids, window, any_of(ids))
+    return next(iter(sub.frames.values()), None)
+
+
+async def transact_async(name, dispatcher, request, ids, window):
+    """transact() for the asyncio steps, awaiting the reply on the dispatcher."""
+    session = can_session.get_session()
+    sub = session.take_prefetched(name)
+    if sub is not None:
+        return next(iter(sub.frames.values()), None)
+    return await dispatcher.request(request, ids, timeout=session.window(window))
+
+
+def collect_samples(name, bus, ids, window, until=None):
+    """Every frame on the IDs within the window (or until the predicate holds), in arrival order."""
+    sub = can_session.get_session().take_prefetched(name)
+    if sub is not None:
+        return sub.samples
+    return listen(bus, ids, window, until).samples
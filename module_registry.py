@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Test step modules, imported once and reloaded only when their source changes.
+
+Every load() stats the module's source file; only when its mtime or size
+moved is the file hashed, and only a different hash reloads the module. A
+step edited on the line is picked up by the next attempt, while an unchanged
+step costs one stat per call instead of re-running `import can` and friends.
+The seconds spent importing are added to the caller's costs dict, so a cycle
+can log what it paid in import time per step.
+"""
+
+import hashlib
+import importlib
+import os
+import sys
+import threading
+import time
+
+
+class Entry:
+    __slots__ = ("module", "path", "mtime", "size", "digest", "loads", "seconds")
+
+    def __init__(self, module):
+        self.module = module
+        self.path = getattr(module, "__file__", None)
+        self.mtime, self.size, self.digest = source_state(self.path)
+        self.loads = 0
+        self.seconds = 0.0
+
+
+def source_state(path):
+    """(mtime_ns, size, sha1) of a source file; all None when it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+            stat = os.fstat(f.fileno())
+    except (OSError, TypeError):
+        return None, None, None
+    return stat.st_mtime_ns, stat.st_size, hashlib.sha1(data).hexdigest()
+
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def load(name, costs=None):
+    """The current module called name; seconds spent importing it are added to costs[name]."""
+    with _lock:
+        entry = _entries.get(name)
+        start = time.perf_counter()
+        if entry is None:
+            # Imported elsewhere before (e.g. by another tool in the process): adopt it as is
+            imported = name in sys.modules
+            entry = _entries[name] = Entry(importlib.import_module(name))
+            if imported:
+                return entry.module
+        elif not changed(entry):
+            return entry.module
+        else:
+            print(f"{name} changed on disk, reloading")
+            entry.module = importlib.reload(entry.module)
+            entry.mtime, entry.size, entry.digest = source_state(entry.path)
+        seconds = time.perf_counter() - start
+        entry.loads += 1
+        entry.seconds += seconds
+        if costs is not None:
+            costs[name] = costs.get(name, 0.0) + seconds
+        return entry.module
+
+
+def changed(entry):
+    try:
+        stat = os.stat(entry.path)
+    except (OSError, TypeError):
+        return False
+    if (stat.st_mtime_ns, stat.st_size) == (entry.mtime, entry.size):
+        return False
+    mtime, size, digest = source_state(entry.path)
+    if digest == entry.digest:
+        # Touched or saved unchanged: remember the new stat, keep the module
+        entry.mtime, entry.size = mtime, size
+        return False
+    return True
+
+
+def describe_costs(costs):
+    """Import seconds per step, most expensive first, for the cycle log."""
+    if not costs:
+        return "none"
+    ordered = sorted(costs.items(), key=lambda item: -item[1])
+    return ", ".join(f"{name.rsplit('.', 1)[-1]} {seconds * 1000:.1f} ms" for name, seconds in ordered)
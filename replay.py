@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Re-judge recorded vehicles against the current SKU limits without a bus.
+
+Each trace (.trace from can_trace, or a python-can .blf/.asc log) is fed
+through the test modules' own parse code and verdicts.evaluate, as fast as
+the CPU allows. Passive steps get the first frame of each of their IDs, as
+the shared passive window would have; request/response steps get the last
+reply on their ID and the API value recorded in the VIN's text log.
+
+    python replay.py test_results/ --csv replayed.csv
+"""
+
+import argparse
+import contextlib
+import csv
+import glob
+import importlib
+import io
+import os
+import re
+
+import can
+import numpy as np
+
+import can_session
+import can_trace
+import frame_fanout
+import test_plan
+import verdicts
+
+TRACE_EXTENSIONS = (".trace", ".blf", ".asc")
+
+# Step -> (module report function, API line in the VIN log, API value type)
+REQUEST_STEPS = {
+    "MCU_Vehicle_ID": ("report_vehicle_id", "API Vehicle ID", str),
+    "MCU_Phase_Offset": ("report_phase_offset", "API Phase Offset Angle", float),
+}
+
+
+class ReplayBus:
+    """Stands in for the bus; replayed steps are served from the trace, never live."""
+
+    def recv(self, timeout=None):
+        return None
+
+    def send(self, msg, timeout=None):
+        pass
+
+    def set_filters(self, filters=None):
+        pass
+
+
+def load_frames(path):
+    """FRAME_DTYPE array of a trace file, whatever its format."""
+    if path.endswith(".trace"):
+        return can_trace.load_trace(path)[0]
+    with can.LogReader(path) as reader:
+        messages = [msg for msg in reader if not msg.is_error_frame]
+    recorder = can_trace.TraceRecorder(max(1, len(messages)))
+    for msg in messages:
+        recorder(msg)
+    return recorder.snapshot()[0]
+
+
+def to_message(frame):
+    dlc = int(frame["dlc"])
+    return can.Message(
+        timestamp=float(frame["timestamp"]),
+        arbitration_id=int(frame["can_id"]),
+        is_extended_id=bool(frame["flags"] & can_trace.FLAG_EXTENDED),
+        data=bytes(frame["data"][:dlc]),
+    )
+
+
+def first_and_last(frames):
+    """Row index of the first and last frame of every CAN ID."""
+    ids = frames["can_id"]
+    unique, first = np.unique(ids, return_index=True)
+    _, last_reversed = np.unique(ids[::-1], return_index=True)
+    last = len(ids) - 1 - last_reversed
+    return dict(zip(unique.tolist(), first.tolist())), dict(zip(unique.tolist(), last.tolist()))
+
+
+def read_vin_log(trace_path):
+    """Text of the VIN log written alongside the trace, or ""."""
+    log_path = os.path.splitext(trace_path)[0] + ".txt"
+    if not os.path.exists(log_path):
+        return ""
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def logged_value(log_text, label):
+    match = re.search(rf"^{re.escape(label)}\s*: (.+)$", log_text, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def replay_step(library, step, module, frames, first, last, log_text):
+    """StepResult of a step served from the trace, or None when the trace cannot answer it."""
+    if getattr(module, "PASSIVE_WINDOW", None):
+        # Offer the step's frames in trace order until its predicate holds, as the window would
+        sub = frame_fanout.Subscription(step, module.RX_CAN_IDS, module.PASSIVE_WINDOW, getattr(module, "PASSIVE_UNTIL", None))
+        start = min(first[can_id] for can_id in sub.ids if can_id in first) if sub.ids & first.keys() else len(frames)
+        for i in np.flatnonzero(np.isin(frames["can_id"][start:], list(sub.ids))) + start:
+            sub.offer(to_message(frames[i]), 0.0)
+            if sub.resolved:
+                break
+        can_session.get_session().store_prefetched(step, sub)
+        return getattr(module, step)(bus=ReplayBus())
+    if step in REQUEST_STEPS:
+        report, label, value_type = REQUEST_STEPS[step]
+        api_value = logged_value(log_text, label)
+        if api_value is None or api_value == "None":
+            return None
+        can_id = module.RX_CAN_IDS[0]
+        response = to_message(frames[last[can_id]]) if can_id in last else None
+        return getattr(module, report)(response, value_type(api_value))
+    return None
+
+
+def replay_vehicle(trace_path, plan):
+    """(recorded status, replayed status, [(step, passed, actual, note)])."""
+    library = plan.library
+    frames = load_frames(trace_path)
+    first, last = first_and_last(frames)
+    log_text = read_vin_log(trace_path)
+    results = []
+    for plan_step in plan.steps:
+        step = plan_step.step
+        module = plan_step.module or importlib.import_module(f"{library}.{step}")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                output = replay_step(library, step, module, frames, first, last, log_text)
+            if output is None:
+                results.append((step, None, "", "not replayable from trace"))
+                continue
+            passed, actual_value, _, note = verdicts.evaluate(step, output, plan_step.value, plan_step.lsl, plan_step.usl)
+        except Exception as e:
+            # The station fails a step the same way when judging it raises
+            passed, actual_value, note = False, "Timeout/Error", str(e)
+        results.append((step, bool(passed), actual_value, note or ""))
+    replayed = "NOK" if any(passed is False for _, passed, _, _ in results) else "OK"
+    return logged_value(log_text, "TEST STATUS") or "?", replayed, results
+
+
+def find_sku(log_text, sku_names, default):
+    for sku in sku_names:
+        if sku in log_text:
+            return sku
+    return default
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", help="trace files or folders of them")
+    parser.add_argument("--sku", help="SKU to judge against when the VIN log does not name one")
+    parser.add_argument("--sku-dir", default="sku_files")
+    parser.add_argument("--csv", help="write every step verdict to this CSV file")
+    args = parser.parse_args()
+
+    traces = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            traces.extend(sorted(p for p in glob.glob(os.path.join(path, "*")) if p.endswith(TRACE_EXTENSIONS)))
+        else:
+            traces.append(path)
+
+    sku_names = [os.path.basename(p).split(" - ")[0] for p in glob.glob(os.path.join(args.sku_dir, "* - details.xlsx"))]
+    can_session.set_session(can_session.CanBusSession())
+    rows = []
+    changed = 0
+    for trace_path in traces:
+        vin = os.path.basename(trace_path).split("_")[0]
+        sku = find_sku(read_vin_log(trace_path), sku_names, args.sku)
+        if sku is None:
+            print(f"{vin}: SKU unknown, skipped (use --sku)")
+            continue
+        # Compiled once per SKU; later traces of the same SKU reuse it
+        plan = test_plan.load(test_plan.sku_path(args.sku_dir, sku))
+        if plan.library is None:
+            print(f"{vin}: no test library for SKU {sku}, skipped")
+            continue
+        try:
+            recorded, replayed, results = replay_vehicle(trace_path, plan)
+        except Exception as e:
+            print(f"{vin}: replay failed: {e}")
+            continue
+        if recorded != replayed:
+            changed += 1
+            failures = ", ".join(f"{step} ({actual})" for step, passed, actual, _ in results if passed is False)
+            print(f"{vin} [{sku}]: {recorded} -> {replayed} {failures}")
+        for step, passed, actual, note in results:
+            rows.append([vin, sku, step, "" if passed is None else ("PASSED" if passed else "FAILED"), actual, note])
+
+    print(f"Replayed {len(traces)} traces, {changed} verdicts changed")
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["VIN", "SKU", "Test Sequence", "Result", "Actual Value", "Note"])
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
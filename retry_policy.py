@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Retry policies of the test steps, by failure class.
+
+A failed attempt is classified (no frame, out-of-limit value, mismatch, API
+error, bus error, timeout, other error) and the policy for that class
+decides whether the step is tried again and after how long. A policy is
+"attempts, delay[, backoff[, jitter]]": up to attempts tries in all, the
+n-th retry waiting delay * backoff ** (n - 1) seconds, give or take
+jitter * 100 %. attempts = 1 fails fast.
+
+Policies come from the built-in defaults, [RETRY_POLICY] in station.ini
+and the optional "Retry Policy" column of the SKU sheet, the most specific
+one winning; fields it leaves out come from the less specific ones:
+
+    [RETRY_POLICY]
+    no_frame = 3, 1, 2, 0.2
+    TPMS.no_frame = 1
+    Battery_SOC.out_of_limits = 4, 0.5
+
+    Retry Policy column:  no_frame=2, 0.5; mismatch=1
+"""
+
+import configparser
+import random
+
+import step_result
+
+NO_FRAME = step_result.NO_FRAME
+OUT_OF_LIMITS = step_result.OUT_OF_LIMITS
+MISMATCH = step_result.MISMATCH
+API_ERROR = step_result.API_ERROR
+BUS_ERROR = step_result.BUS_ERROR
+TIMEOUT = step_result.TIMEOUT
+ERROR = step_result.ERROR
+FAILURES = step_result.FAILURES
+
+# Optional SKU sheet column overriding the policies for one step
+POLICY_COLUMN = "Retry Policy"
+SECTION = "RETRY_POLICY"
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2
+
+
+class Policy:
+    __slots__ = ("attempts", "delay", "backoff", "jitter")
+
+    def __init__(self, attempts=MAX_ATTEMPTS, delay=RETRY_DELAY, backoff=1.0, jitter=0.0):
+        self.attempts = max(1, int(attempts))
+        self.delay = max(0.0, float(delay))
+        self.backoff = float(backoff)
+        self.jitter = min(1.0, max(0.0, float(jitter)))
+
+    def wait(self, attempt):
+        """Seconds to wait after failed attempt number attempt (1-based)."""
+        delay = self.delay * self.backoff ** (attempt - 1)
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def __repr__(self):
+        return f"{self.attempts}, {self.delay:g}, {self.backoff:g}, {self.jitter:g}"
+
+
+# As the station always retried: three tries two seconds apart, except right
+# after a bus incident, which the supervisor has already recovered from
+DEFAULTS = {failure: Policy() for failure in FAILURES}
+DEFAULTS[BUS_ERROR] = Policy(delay=0)
+
+
+def parse_policy(text, base=None):
+    """Policy from "attempts, delay[, backoff[, jitter]]"; missing fields come from base."""
+    base = base or Policy()
+    fields = [field.strip() for field in str(text).split(",")]
+    values = [base.attempts, base.delay, base.backoff, base.jitter]
+    for i, field in enumerate(fields[:4]):
+        if field:
+            values[i] = float(field)
+    return Policy(*values)
+
+
+def parse_overrides(text):
+    """{failure class: policy text} from a Retry Policy cell, "no_frame=2, 0.5; mismatch=1"."""
+    overrides = {}
+    for item in str(text).split(";"):
+        if not item.strip():
+            continue
+        failure, _, policy = item.partition("=")
+        failure = failure.strip().lower()
+        if failure not in FAILURES or not policy.strip():
+            print(f"Ignoring retry policy '{item.strip()}': expected <{'|'.join(FAILURES)}>=attempts, delay[, backoff[, jitter]]")
+            continue
+        overrides[failure] = policy.strip()
+    return overrides
+
+
+class RetryPolicies:
+    """Policy lookup: sheet cell > step > library > failure class > defaults."""
+
+    def __init__(self, settings=None):
+        # configparser keys arrive lower-cased; so are the lookups
+        self.settings = {key.lower(): value for key, value in (settings or {}).items()}
+
+    def policy(self, library_name, step, failure, overrides=None):
+        policy = DEFAULTS[failure]
+        for key in (failure, f"{library_name}.{failure}", f"{step}.{failure}"):
+            if key.lower() in self.settings:
+                policy = parse_policy(self.settings[key.lower()], policy)
+        if overrides and failure in overrides:
+            policy = parse_policy(overrides[failure], policy)
+        return policy
+
+
+def load(ini_path):
+    """Policies from the [RETRY_POLICY] section of station.ini (defaults when absent)."""
+    config = configparser.ConfigParser()
+    try:
+        config.read(ini_path)
+        settings = dict(config[SECTION]) if SECTION in config else {}
+        policies = RetryPolicies(settings)
+        for key, value in policies.settings.items():
+            if key.rsplit(".", 1)[-1] not in FAILURES:
+                print(f"Unknown failure class in [{SECTION}]: {key}")
+            else:
+                parse_policy(value)
+        return policies
+    except Exception as e:
+        print(f"Error reading retry policies from station.ini: {e}")
+        return RetryPolicies()
+
+
+def classify(result, error=None, incidents=(), uses_api=False):
+    """Failure class of a failed attempt.
+
+    result: the step's StepResult; error: the exception that failed the
+    attempt, if one did; incidents: bus supervisor incidents inside the
+    attempt; uses_api: the step looks its expected value up from the API.
+    The failure class the step put in its result comes first. Incidents only
+    make a bus error of a step that heard nothing: steps running side by side
+    overlap the same incident, and those that read their frames failed on
+    their own account.
+    """
+    if isinstance(error, TimeoutError):
+        failure = TIMEOUT
+    elif error is not None or result is None:
+        failure = ERROR
+    elif result.failure is not None:
+        failure = result.failure
+    elif result.frames:
+        failure = OUT_OF_LIMITS if result.check == step_result.CHECK_LIMITS else MISMATCH
+    elif uses_api and result.expected is None:
+        failure = API_ERROR
+    else:
+        failure = NO_FRAME
+    if incidents and failure in (NO_FRAME, TIMEOUT, ERROR) and not (result is not None and result.frames):
+        return BUS_ERROR
+    return failure
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a test plan: the shared passive window, then each step with its
+retries, verdict and the cycle budget.
+
+The one engine behind the station GUI, which runs it on a QThread and turns
+the listener calls into Qt signals, and fixture_station, which runs it with
+no GUI at all. step_finished and over_budget are called on the thread that
+called run(), in sheet order; the per-attempt calls come from the step
+worker threads as they happen.
+"""
+
+import concurrent.futures
+import contextvars
+import io
+import threading
+import time
+
+import bus_supervisor
+import can_async
+import can_session
+import frame_fanout
+import module_registry
+import retry_policy
+import step_result
+import step_runner
+import verdicts
+
+# Longest step when no cycle budget cuts the listen windows
+STEP_TIMEOUT = 5
+# Steps run side by side at most
+MAX_WORKERS = 4
+
+
+class Listener:
+    """Progress of a sequence; every method is a no-op here."""
+
+    def passive_done(self, resolved, total, duration):
+        pass
+
+    def step_started(self, index, step, attempt):
+        pass
+
+    def attempt_result(self, index, step, attempt, passed, actual_value, api_expected, note):
+        pass
+
+    def attempt_error(self, index, step, attempt, error):
+        pass
+
+    def step_finished(self, index, step, passed, actual_value, attempts, error):
+        # error is the exception that failed the last attempt, if one did
+        pass
+
+    def over_budget(self, index, step):
+        pass
+
+
+class Sequencer:
+    """One cycle of a compiled test_plan.TestPlan for a VIN.
+
+    Steps whose dependencies have passed run side by side on up to workers
+    threads. Results are reported in sheet order and, as before, the cycle
+    stops at the first failed step: nothing after it in the sheet starts or
+    is reported.
+    """
+
+    def __init__(self, plan, vin, url, session=None, budget=None, listener=None,
+                 mac_ids=None, workers=MAX_WORKERS, policies=None):
+        self.plan = plan
+        self.library = plan.library
+        self.rows = plan.steps
+        self.vin = vin
+        self.url = url
+        self.session = session or can_session.get_session()
+        self.budget = budget
+        self.listener = listener or Listener()
+        self.mac_ids = {} if mac_ids is None else mac_ids
+        self.workers = max(1, workers)
+        self.policies = policies or retry_policy.RetryPolicies()
+        self.test_results = []
+        self.test_times = []
+        # {module: seconds} spent importing step modules during this cycle
+        self.import_costs = {}
+        # One line per retry decision, for the cycle log
+        self.retry_log = []
+        self.cumulative_time = 0.0
+        self.final_status = "OK"
+        self.stopped = False
+        # Rows after this one are not started, and running ones give up: a failure, or the budget running out
+        self.stop_row = len(self.rows)
+        # Notified when stop_row moves, so a retry delay of an abandoned step ends at once
+        self._stop_moved = threading.Condition()
+        self.start_time = None
+
+    def stop(self):
+        # Takes effect before the next attempt
+        self.stopped = True
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def run(self, subscriptions=()):
+        """Run the plan; returns the final status, "OK" or "NOK"."""
+        self.start_time = time.perf_counter()
+        if subscriptions:
+            duration = frame_fanout.run_passive_block(subscriptions, self.session)
+            if duration is not None:
+                self.listener.passive_done(sum(1 for sub in subscriptions if sub.resolved), len(subscriptions), duration)
+        waits = self.plan.waits
+        outcomes = {}
+        passed = set()
+        running = {}
+        self.stop_row = len(self.rows)
+        reported = 0
+        with concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="step") as pool:
+            while True:
+                for row in range(self.stop_row):
+                    if len(running) >= self.workers or self.stopped:
+                        break
+                    if row in outcomes or row in running.values() or not waits[row] <= passed:
+                        continue
+                    # Judging frames the passive window already caught costs nothing, so those steps still run
+                    if self.budget is not None and self.budget.expired and not self.session.has_prefetched(self.rows[row].step):
+                        outcomes[row] = None
+                        self.move_stop_row(row)
+                        break
+                    # Each step sees this thread's session and keeps its own captured output
+                    context = contextvars.copy_context()
+                    running[pool.submit(context.run, self.run_step, row)] = row
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    row = running.pop(future)
+                    outcomes[row] = future.result()
+                    if outcomes[row][0]:
+                        passed.add(row)
+                    else:
+                        self.move_stop_row(row)
+                reported = self.report(outcomes, reported)
+        self.report(outcomes, reported)
+        if self.stopped and self.final_status == "OK" and len(passed) < len(self.rows):
+            self.final_status = "NOK"
+        return self.final_status
+
+    def report(self, outcomes, row):
+        """Hand on finished steps in sheet order up to the first one still out; returns that row."""
+        while self.final_status == "OK" and row in outcomes:
+            step = self.rows[row].step
+            outcome = outcomes[row]
+            if outcome is None:
+                self.test_results.append(f"Test Sequence: {step}\nStatus: Not run, cycle time budget exceeded")
+                self.test_times.append((step, self.elapsed()))
+                self.final_status = "NOK"
+                self.listener.over_budget(row, step)
+            else:
+                passed, actual_value, attempts, error, logs, retries = outcome
+                for log_output, seconds in logs:
+                    self.test_results.append(log_output)
+                    self.test_times.append((step, seconds))
+                    self.cumulative_time = seconds
+                self.retry_log.extend(retries)
+                self.listener.step_finished(row, step, passed, actual_value, attempts, error)
+                if not passed:
+                    self.final_status = "NOK"
+            row += 1
+        return row
+
+    def run_step(self, row):
+        """Attempts of one step until it passes.
+
+        Returns (passed, actual value, attempts, error, [(step log, seconds into the cycle)],
+        [retry decisions]). A step left running past a failed row gives up before
+        its next attempt; its outcome is never reported.
+        """
+        plan_step = self.rows[row]
+        step, value, lsl, usl = plan_step.step, plan_step.value, plan_step.lsl, plan_step.usl
+        if self.library != "3W_Diagnostics":
+            value = lsl = usl = ""
+        passed, actual_value, error = False, "", None
+        uses_api = "api_url" in getattr(plan_step.function, "inputs", ())
+        logs = []
+        retries = []
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.stopped:
+                return False, "Stopped", attempt - 1, error, logs, retries
+            if self.abandoned(row):
+                return False, "Abandoned", attempt - 1, error, logs, retries
+            self.listener.step_started(row, step, attempt)
+            if self.budget is not None:
+                self.budget.begin_step(step)
+            step_start = time.time()
+            log_output, result, duration = self.call(plan_step)
+            logs.append((log_output, self.elapsed()))
+            error = None
+            try:
+                if self.budget is None and duration > STEP_TIMEOUT:
+                    raise TimeoutError(f"Test {step} exceeded {STEP_TIMEOUT} seconds")
+                passed, actual_value, api_expected, note = verdicts.evaluate(step, result, value, lsl, usl)
+                self.listener.attempt_result(row, step, attempt, passed, actual_value, api_expected, note)
+            except Exception as e:
+                error = e
+                passed, actual_value = False, "Timeout/Error"
+                self.listener.attempt_error(row, step, attempt, e)
+            if passed:
+                break
+            if self.abandoned(row):
+                break
+            if self.budget is not None and self.budget.expired:
+                retries.append(f"{step} attempt {attempt}: cycle time budget spent, give up")
+                print(f"{self.vin}: {retries[-1]}")
+                break
+            delay, decision = self.retry_delay(plan_step, attempt, result, error, step_start, uses_api)
+            retries.append(decision)
+            if delay is None:
+                break
+            with self._stop_moved:
+                self._stop_moved.wait_for(lambda: self.abandoned(row), delay)
+        return passed, actual_value, attempt, error, logs, retries
+
+    def move_stop_row(self, row):
+        with self._stop_moved:
+            self.stop_row = min(self.stop_row, row)
+            self._stop_moved.notify_all()
+
+    def abandoned(self, row):
+        # An earlier row failed or ran out of budget, so this one will never be reported
+        return row > self.stop_row
+
+    def call(self, plan_step):
+        """(step log, raw result, seconds) of one attempt; print() lands in the step log."""
+        step = plan_step.step
+        buffer = io.StringIO()
+        start = time.perf_counter()
+        with can_async.captured_output(buffer):
+            try:
+                # The registry reloads a step edited since the plan was compiled
+                module = module_registry.load(f"{self.library}.{step}", self.import_costs)
+                result = step_runner.call_step(module, step, self.vin, self.url, self.mac_ids)
+            except Exception as e:
+                print(f"Error in {self.library}.{step}: {e}")
+                result = step_result.failed(failure=step_result.ERROR)
+        return buffer.getvalue().strip(), result, time.perf_counter() - start
+
+    def retry_delay(self, plan_step, attempt, result, error, step_start, uses_api):
+        """(seconds to wait before the next attempt, or None to give up; the decision for the log)."""
+        supervisor = self.session.supervisor
+        incidents = supervisor.incidents_since(step_start) if supervisor is not None else []
+        failure = retry_policy.classify(result, error, incidents, uses_api)
+        policy = self.policies.policy(self.library, plan_step.step, failure, plan_step.retry)
+        delay = None
+        if attempt < policy.attempts:
+            delay = policy.wait(attempt)
+            if self.budget is not None:
+                delay = self.budget.retry_delay(delay)
+        decision = "give up" if delay is None else f"retry in {delay:.2f} sec"
+        cause = f" ({bus_supervisor.describe_incidents(incidents)})" if incidents else ""
+        line = f"{plan_step.step} attempt {attempt}/{policy.attempts}: {failure}{cause}, {decision} [policy {policy!r}]"
+        print(f"{self.vin}: {line}")
+        return delay, line
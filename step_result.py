@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Result contract of the test step functions.
+
+A step function is registered with @test_step, naming the inputs it takes
+(in the order it takes them) and how its verdict is judged, and returns a
+StepResult. step_runner builds the arguments from the declared inputs and
+verdicts.evaluate judges every result the same way, so a new test module
+needs no changes to the station.
+
+    @step_result.test_step(inputs=("bus",), check=step_result.CHECK_LIMITS)
+    def Battery_SOC(bus=None):
+        ...
+        return step_result.StepResult(data_detected, SOC, frames=frames)
+"""
+
+import functools
+import inspect
+import time
+
+# Inputs a step can declare; step_runner passes them positionally in the declared order.
+# "bus" is not passed: the step takes the session's bus unless given one (replay, adapters).
+INPUTS = ("vin", "api_url", "mac_ids", "bus")
+
+# The step's own passed flag is the verdict
+CHECK_PASSED = None
+# actual must equal the SKU sheet's Value
+CHECK_VALUE = "value"
+# actual must be a number within the SKU sheet's LSL..USL
+CHECK_LIMITS = "limits"
+
+# Failure classes (see retry_policy). A step that knows why it failed says so in
+# its result; otherwise the class is inferred from the frames it read.
+NO_FRAME = "no_frame"
+OUT_OF_LIMITS = "out_of_limits"
+MISMATCH = "mismatch"
+API_ERROR = "api_error"
+BUS_ERROR = "bus_error"
+TIMEOUT = "timeout"
+ERROR = "error"
+FAILURES = (NO_FRAME, OUT_OF_LIMITS, MISMATCH, API_ERROR, BUS_ERROR, TIMEOUT, ERROR)
+
+
+class StepResult:
+    """passed/actual as the step saw them; expected when the step looked it up itself
+    (e.g. from the API); frames the result was read from; seconds the call took;
+    outputs handed on to later steps (TPMS MAC IDs); failure, one of FAILURES,
+    when the step knows why it failed."""
+
+    __slots__ = ("passed", "actual", "expected", "frames", "seconds", "outputs", "check", "failure")
+
+    def __init__(self, passed, actual="", expected=None, frames=(), outputs=None, failure=None):
+        if failure is not None and failure not in FAILURES:
+            raise ValueError(f"Unknown failure class: {failure}")
+        self.passed = bool(passed)
+        self.actual = actual
+        self.expected = expected
+        self.frames = list(frames)
+        self.seconds = None
+        self.outputs = outputs or {}
+        self.check = CHECK_PASSED
+        self.failure = failure
+
+    def __repr__(self):
+        return f"StepResult(passed={self.passed}, actual={self.actual!r}, expected={self.expected!r})"
+
+
+def test_step(inputs=(), check=CHECK_PASSED):
+    """Register a step function (blocking or async): its inputs and verdict check.
+
+    The call is timed into the result's seconds and the result carries the check.
+    """
+    unknown = set(inputs) - set(INPUTS)
+    if unknown:
+        raise ValueError(f"Unknown step inputs: {', '.join(sorted(unknown))}")
+
+    def register(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def step(*args, **kwargs):
+                start = time.perf_counter()
+                return finish(await function(*args, **kwargs), start)
+        else:
+            @functools.wraps(function)
+            def step(*args, **kwargs):
+                start = time.perf_counter()
+                return finish(function(*args, **kwargs), start)
+
+        def finish(result, start):
+            if not isinstance(result, StepResult):
+                raise TypeError(f"{function.__name__} returned {type(result).__name__}, not a StepResult")
+            result.seconds = time.perf_counter() - start
+            result.check = check
+            return result
+
+        step.inputs = tuple(inputs)
+        step.check = check
+        return step
+    return register
+
+
+def failed(actual="Error", failure=None):
+    """Result of a step that could not run at all."""
+    return StepResult(False, actual, failure=failure)
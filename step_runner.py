@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Calls one test step with the arguments its library expects.
+"""
+
+import os
+
+import can_async
+
+LIBRARIES = ["3W_Diagnostics", "TPMS"]
+
+
+def find_library(steps):
+    """Test library that provides the first step of a plan."""
+    for library in LIBRARIES:
+        if steps and os.path.exists(os.path.join(library, f"{steps[0]}.py")):
+            return library
+    return None
+
+
+def call_step(module, function_name, vin_number, api_url, mac_ids):
+    """Run function_name from module with the inputs it registered (see step_result).
+
+    The async variant <function_name>_async runs instead when the module has
+    one. Outputs of a passed step (the TPMS MAC IDs of API_CALL) are stored
+    in mac_ids for the steps after it.
+    """
+    test_function = getattr(module, function_name)
+    values = {"vin": vin_number, "api_url": api_url, "mac_ids": mac_ids}
+    args = [values[name] for name in getattr(test_function, "inputs", ()) if name in values]
+    async_function = getattr(module, f"{function_name}_async", None)
+    if async_function is not None:
+        result = can_async.run_test(async_function, *args)
+    else:
+        result = test_function(*args)
+    if result.passed and result.outputs:
+        mac_ids.update(result.outputs)
+    return result
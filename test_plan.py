@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled test plans, one per SKU file, kept until the file changes.
+
+sku_files/<SKU> - details.xlsx is parsed once: each row becomes a PlanStep
+with its step name, the resolved test module and function, the expected
+value, LSL/USL as floats, what the step waits for and its retry policy
+overrides. The GUI table, the sequencer, the fixture station and replay all
+read the same plan, so a repeat SKU costs no Excel parsing; a newer file
+mtime compiles it again.
+"""
+
+import collections
+import os
+import threading
+
+import pandas as pd
+
+import module_registry
+import retry_policy
+import step_runner
+
+# Optional SKU sheet column: comma-separated steps a step must wait for
+DEPENDS_COLUMN = "Depends On"
+# Sheet columns shown in the station's table, in order
+TABLE_COLUMNS = ("S.No", "Test Sequence", "Parameter", "Value", "LSL", "USL")
+
+PlanStep = collections.namedtuple("PlanStep", "step module function value lsl usl depends retry cells")
+
+
+class TestPlan(collections.namedtuple("TestPlan", "path mtime library steps waits")):
+    """steps: PlanStep per sheet row; waits: for each row, the earlier rows it waits for."""
+
+    __slots__ = ()
+
+    @property
+    def names(self):
+        return [step.step for step in self.steps]
+
+
+def parse_limit(text):
+    # Blank or N/A is no limit; anything else unparsable stays text and fails its verdict as before
+    text = str(text).strip()
+    if not text or text == "N/A":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def resolve(library_name, step):
+    """(module, test function) of a step, or (None, None) when it cannot be imported."""
+    if library_name is None:
+        return None, None
+    try:
+        module = module_registry.load(f"{library_name}.{step}")
+    except Exception as e:
+        print(f"Cannot load step {library_name}.{step}: {e}")
+        return None, None
+    return module, getattr(module, step, None)
+
+
+def plan_dependencies(steps, modules, declared=None):
+    """For each row of the plan, the set of earlier rows it has to wait for.
+
+    Declared: the SKU sheet's Depends On column and a module's DEPENDS_ON,
+    naming steps earlier in the sheet. Inferred: request/response steps (those
+    not served by a PASSIVE_WINDOW) that listen on a common CAN ID keep sheet
+    order, since each would take the other's reply.
+    """
+    declared = declared or {}
+    waits = []
+    listens = []
+    for row, (step, module) in enumerate(zip(steps, modules)):
+        needs = set()
+        for name in list(declared.get(step, [])) + list(getattr(module, "DEPENDS_ON", [])):
+            earlier = [i for i in range(row) if steps[i] == name]
+            if earlier:
+                needs.add(earlier[-1])
+            else:
+                print(f"{step} depends on {name}, which does not come before it in the plan; ignored")
+        ids = set()
+        if module is not None and not getattr(module, "PASSIVE_WINDOW", None):
+            ids = set(getattr(module, "RX_CAN_IDS", []))
+        needs.update(i for i, other in enumerate(listens) if ids & other)
+        listens.append(ids)
+        waits.append(frozenset(needs))
+    return tuple(waits)
+
+
+def compile_plan(path, library_name=None, mtime=None):
+    df = pd.read_excel(path, engine="openpyxl", keep_default_na=False)
+    rows = []
+    for _, row in df.iterrows():
+        step = str(row.get("Test Sequence", "")).strip().replace(" ", "_")
+        if step:
+            rows.append((step, row))
+    names = [step for step, _ in rows]
+    library_name = library_name or step_runner.find_library(names)
+    steps = []
+    declared = {}
+    for step, row in rows:
+        module, function = resolve(library_name, step)
+        depends = ()
+        if DEPENDS_COLUMN in df.columns:
+            depends = tuple(name.strip().replace(" ", "_") for name in str(row[DEPENDS_COLUMN]).split(",") if name.strip())
+            declared[step] = depends
+        # {failure class: policy text} for this step only
+        retry = retry_policy.parse_overrides(row.get(retry_policy.POLICY_COLUMN, ""))
+        steps.append(PlanStep(
+            step, module, function, str(row.get("Value", "")), parse_limit(row.get("LSL", "")),
+            parse_limit(row.get("USL", "")), depends, retry, tuple(str(row.get(key, "")) for key in TABLE_COLUMNS)
+        ))
+    waits = plan_dependencies(names, [step.module for step in steps], declared)
+    return TestPlan(path, mtime, library_name, tuple(steps), waits)
+
+
+_plans = {}
+_lock = threading.Lock()
+
+
+def load(path, library_name=None):
+    """The compiled plan of a SKU file, from the cache unless the file changed since."""
+    mtime = os.stat(path).st_mtime_ns
+    key = (os.path.abspath(path), library_name)
+    with _lock:
+        plan = _plans.get(key)
+        if plan is None or plan.mtime != mtime:
+            plan = _plans[key] = compile_plan(path, library_name, mtime)
+        return plan
+
+
+def sku_path(sku_dir, sku):
+    return os.path.join(sku_dir, f"{sku} - details.xlsx")
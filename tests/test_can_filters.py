@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+import can_filters
+
+
+def accepts(filters, can_id):
+    return any(can_id & f["can_mask"] == f["can_id"] & f["can_mask"] for f in filters)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_filters_accept_exactly_the_plan_ids(seed):
+    rng = random.Random(seed)
+    ids = set(rng.sample(range(0x800), rng.randint(1, 40)))
+    filters = can_filters.compile_filters(ids)
+    assert [can_id for can_id in range(0x800) if accepts(filters, can_id)] == sorted(ids)
+
+
+def test_adjacent_ids_merge_into_one_filter():
+    assert can_filters.compile_filters([0x100, 0x101]) == [{"can_id": 0x100, "can_mask": 0x7FE, "extended": False}]
+    assert len(can_filters.compile_filters(range(0x700, 0x708))) == 1
+
+
+def test_single_id_keeps_full_mask():
+    assert can_filters.compile_filters([0x775]) == [{"can_id": 0x775, "can_mask": 0x7FF, "extended": False}]
+
+
+def test_extended_ids_use_29_bit_masks():
+    filters = can_filters.compile_filters([0x18FF0001, 0x18FF0003], extended=True)
+    assert all(f["extended"] for f in filters)
+    assert all(f["can_mask"] >> 11 for f in filters)
+    assert accepts(filters, 0x18FF0001) and accepts(filters, 0x18FF0003)
+    assert not accepts(filters, 0x18FF0002)
+
+
+def test_no_ids_no_filters():
+    assert can_filters.compile_filters([]) == []
+
+
+def test_plan_filters():
+    assert can_filters.plan_filters({"A": [0x22], "B": None}) is None
+    assert can_filters.plan_filters({"A": [], "B": []}) is None
+    filters = can_filters.plan_filters({"A": [0x22, 0x23], "B": [0x23, 0x775]})
+    assert [can_id for can_id in range(0x800) if accepts(filters, can_id)] == [0x22, 0x23, 0x775]
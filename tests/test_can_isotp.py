@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+
+import can
+import pytest
+
+import can_isotp
+import can_uds
+from ecu_simulator import UDS_SERVERS, EcuSimulator
+
+_channels = itertools.count()
+
+
+@pytest.fixture
+def channel_name():
+    return f"isotp-test-{next(_channels)}"
+
+
+@pytest.fixture
+def bus_pair(channel_name):
+    a = can.interface.Bus(interface="virtual", channel=channel_name)
+    b = can.interface.Bus(interface="virtual", channel=channel_name)
+    yield a, b
+    a.shutdown()
+    b.shutdown()
+
+
+@pytest.mark.parametrize("size", [0, 1, 7, 8, 13, 62, 200, can_isotp.MAX_PAYLOAD])
+@pytest.mark.parametrize("block_size", [0, 1, 3])
+def test_payload_round_trip(bus_pair, size, block_size):
+    tester = can_isotp.IsoTpChannel(bus_pair[0], 0x7E0, 0x7E8)
+    ecu = can_isotp.IsoTpChannel(bus_pair[1], 0x7E8, 0x7E0, block_size=block_size)
+    payload = bytes(i & 0xFF for i in range(size))
+    received = []
+    reader = threading.Thread(target=lambda: received.append(ecu.recv(timeout=5)))
+    reader.start()
+    tester.send(payload)
+    reader.join()
+    assert received == [payload]
+
+
+def test_oversized_payload_is_refused(bus_pair):
+    with pytest.raises(can_isotp.IsoTpError):
+        can_isotp.IsoTpChannel(bus_pair[0], 0x7E0, 0x7E8).send(bytes(can_isotp.MAX_PAYLOAD + 1))
+
+
+def test_overflow_flow_control_aborts_send(bus_pair):
+    tester = can_isotp.IsoTpChannel(bus_pair[0], 0x7E0, 0x7E8)
+    ecu = bus_pair[1]
+    threading.Timer(0.05, lambda: ecu.send(can.Message(
+        arbitration_id=0x7E8, data=[0x30 | can_isotp.FC_OVERFLOW, 0, 0], is_extended_id=False))).start()
+    with pytest.raises(can_isotp.IsoTpError, match="overflow"):
+        tester.send(bytes(20))
+
+
+def test_out_of_sequence_consecutive_frame(bus_pair):
+    tester = can_isotp.IsoTpChannel(bus_pair[0], 0x7E0, 0x7E8)
+    ecu = bus_pair[1]
+
+    def send_bad_transfer():
+        ecu.send(can.Message(arbitration_id=0x7E8, data=[0x10, 20, 1, 2, 3, 4, 5, 6], is_extended_id=False))
+        ecu.recv(timeout=1)  # our flow control
+        ecu.send(can.Message(arbitration_id=0x7E8, data=[0x22] + [0] * 7, is_extended_id=False))
+
+    threading.Thread(target=send_bad_transfer).start()
+    with pytest.raises(can_isotp.IsoTpError, match="out of sequence"):
+        tester.recv(timeout=1)
+
+
+@pytest.mark.parametrize("seconds, byte", [(0, 0x00), (0.005, 0x05), (0.127, 0x7F), (0.0003, 0xF3)])
+def test_st_min_encoding(seconds, byte):
+    assert can_isotp.encode_st_min(seconds) == byte
+    assert can_isotp.decode_st_min(byte) == pytest.approx(seconds)
+
+
+@pytest.fixture(params=[(0, 0.0), (2, 0.001)], ids=["no-flow-limit", "block-2-stmin-1ms"])
+def uds(request, channel_name):
+    simulator = EcuSimulator(channel=channel_name)
+    simulator.uds_block_size, simulator.uds_st_min = request.param
+    simulator.start()
+    bus = can.interface.Bus(interface="virtual", channel=channel_name)
+    server = UDS_SERVERS["VCU"]
+    yield can_uds.open_client(server["request_id"], server["response_id"], bus=bus, timeout=2)
+    bus.shutdown()
+    simulator.stop()
+
+
+def test_uds_reads_multi_frame_did(uds):
+    assert uds.read_did(0xF190) == b"MD6EVM1D7S4E01133"
+
+
+def test_uds_reads_several_dids_in_one_request(uds):
+    lengths = {0xF1A0: 4, 0xF1A1: 16, 0xF190: 17}
+    assert uds.read_dids(list(lengths), lengths) == {did: UDS_SERVERS["VCU"]["dids"][did] for did in lengths}
+
+
+def test_uds_writes_and_reads_back_a_long_did(uds):
+    data = bytes(range(40))
+    uds.write_did(0xF1A1, data)
+    assert uds.read_did(0xF1A1) == data
+
+
+def test_uds_negative_response(uds):
+    with pytest.raises(can_uds.UdsError) as error:
+        uds.read_did(0x1234)
+    assert error.value.nrc == 0x31
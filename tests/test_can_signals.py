@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import importlib
+import random
+
+import can
+import pytest
+
+import can_signals
+
+
+# The hand-written parsers the test modules had before signals.dbc
+def baseline_battery_version(data):
+    return f"{data[2]}.{data[1]}.{data[3]}"
+
+
+def baseline_mcu_version(data):
+    return f"{data[0]}.{data[1]}.{data[2]}"
+
+
+def baseline_vcu_version(data):
+    return f"{data[0]}.{data[1]}"
+
+
+def baseline_cluster_version(data):
+    return ".".join(str(byte) for byte in data[3:6])
+
+
+def baseline_telematics_version(data):
+    return f"{data[4]}.{data[5]}.{data[6]}"
+
+
+def baseline_battery_soc(data):
+    return data[3]
+
+
+def baseline_battery_voltage(data):
+    return int(format(data[2], "08b")[-2:] + format(data[3], "08b"), 2) * 0.1
+
+
+def baseline_vehicle_id(data):
+    return (data[0] << 8) | data[1]
+
+
+def baseline_phase_offset(data):
+    combined = (data[0] << 8) | data[1]
+    if combined & 0x8000:
+        combined -= 0x10000
+    return round(float(combined) / 100, 2)
+
+
+def step(name):
+    return importlib.import_module(f"3W_Diagnostics.{name}")
+
+
+PARSERS = [
+    ("Battery_Version", "parse_version", baseline_battery_version),
+    ("MCU_Version", "parse_version", baseline_mcu_version),
+    ("VCU_Version", "parse_version", baseline_vcu_version),
+    ("Cluster_Version", "parse_version", baseline_cluster_version),
+    ("Telematics_Version", "parse_telematics_version", baseline_telematics_version),
+    ("Battery_SOC", "parse_battery_soc", baseline_battery_soc),
+    ("Battery_Voltage", "parse_battery_voltage", baseline_battery_voltage),
+    ("MCU_Vehicle_ID", "parse_vehicle_id", baseline_vehicle_id),
+    ("MCU_Phase_Offset", "parse_phase_offset_angle", baseline_phase_offset),
+]
+
+
+def payloads(count=500, seed=7):
+    rng = random.Random(seed)
+    edges = [bytes(8), bytes([0xFF] * 8), bytes([0x80] + [0] * 7), bytes([0x7F, 0xFF] + [0] * 6)]
+    return edges + [bytes(rng.randrange(256) for _ in range(8)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("module, parser, baseline", PARSERS, ids=[p[0] for p in PARSERS])
+def test_decode_matches_baseline_parser(module, parser, baseline):
+    parse = getattr(step(module), parser)
+    for data in payloads():
+        assert parse(data) == pytest.approx(baseline(data)), data.hex()
+
+
+@pytest.mark.parametrize("name", ["BMS_SoftwareVersion", "Cluster_FirmwareVersion", "MCU_PhaseOffset", "BMS_PackVoltage"])
+def test_short_frame_decodes_to_none(name):
+    message = can_signals.message(name)
+    values = message.decode(bytes(1))
+    assert any(value is None for value in values.values())
+
+
+@pytest.mark.parametrize("name", sorted(can_signals.load()))
+def test_decode_samples_matches_decode(name):
+    message = can_signals.message(name)
+    frames = [can.Message(arbitration_id=message.frame_id, data=data) for data in payloads(50)]
+    frames.append(can.Message(arbitration_id=message.frame_id, data=bytes(1)))
+    buffer, lengths = can_signals.sample_buffer(frames)
+    for signal in message.signals:
+        expected = [message.decode(msg.data)[signal.name] for msg in frames]
+        expected = [value for value in expected if value is not None]
+        assert list(message.decode_samples(signal.name, buffer, lengths)) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("name, values", [
+    ("BMS_SoftwareVersion", {"Major": 20, "Minor": 10, "Revision": 50}),
+    ("Telematics_Version", {"Major": 0, "Micro": 18, "Minor": 1}),
+    ("BMS_PackVoltage", {"PackVoltage": 54.5}),
+    ("MCU_PhaseOffset", {"PhaseOffsetAngle": -12.34}),
+    ("MCU_VehicleId", {"VehicleId": 4000}),
+])
+def test_encode_round_trip(name, values):
+    message = can_signals.message(name)
+    assert message.decode(message.encode(values)) == pytest.approx(values)
+
+
+def test_parse_dbc_motorola_and_intel():
+    messages = can_signals.parse_dbc(
+        'BO_ 2147483904 Ext: 8 X\n'
+        ' SG_ Big : 7|12@0+ (1,0) [0|0] "" Y\n'
+        ' SG_ Little : 16|12@1- (0.5,-1) [0|0] "" Y\n'
+    )
+    message = messages["Ext"]
+    assert message.frame_id == 0x100
+    values = message.decode(bytes([0xAB, 0xC0, 0xFF, 0x0F, 0, 0, 0, 0]))
+    assert values["Big"] == 0xABC
+    assert values["Little"] == -1 * 0.5 - 1
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+import retry_policy
+import step_result
+
+
+def result(passed=False, frames=(), expected=None, check=step_result.CHECK_PASSED, failure=None):
+    res = step_result.StepResult(passed, "x", expected=expected, frames=frames, failure=failure)
+    res.check = check
+    return res
+
+
+INCIDENT = ["bus-off"]
+
+
+@pytest.mark.parametrize("res, error, incidents, uses_api, failure", [
+    # The step's own failure class comes first
+    (result(failure=retry_policy.API_ERROR), None, (), False, retry_policy.API_ERROR),
+    (result(frames=[1], failure=retry_policy.MISMATCH), None, INCIDENT, False, retry_policy.MISMATCH),
+    # ...but an exception outranks it
+    (result(failure=retry_policy.MISMATCH), TimeoutError(), (), False, retry_policy.TIMEOUT),
+    (result(failure=retry_policy.MISMATCH), ValueError(), (), False, retry_policy.ERROR),
+    (None, None, (), False, retry_policy.ERROR),
+    # Inferred from the frames read
+    (result(frames=[1], check=step_result.CHECK_LIMITS), None, (), False, retry_policy.OUT_OF_LIMITS),
+    (result(frames=[1], check=step_result.CHECK_VALUE), None, (), False, retry_policy.MISMATCH),
+    (result(), None, (), True, retry_policy.API_ERROR),
+    (result(expected="4000"), None, (), True, retry_policy.NO_FRAME),
+    (result(), None, (), False, retry_policy.NO_FRAME),
+    # A bus incident explains only a step that heard nothing
+    (result(), None, INCIDENT, False, retry_policy.BUS_ERROR),
+    (result(failure=retry_policy.NO_FRAME), None, INCIDENT, False, retry_policy.BUS_ERROR),
+    (None, TimeoutError(), INCIDENT, False, retry_policy.BUS_ERROR),
+    (result(frames=[1], check=step_result.CHECK_LIMITS), None, INCIDENT, False, retry_policy.OUT_OF_LIMITS),
+    (result(failure=retry_policy.API_ERROR), None, INCIDENT, True, retry_policy.API_ERROR),
+])
+def test_classify(res, error, incidents, uses_api, failure):
+    assert retry_policy.classify(res, error, incidents, uses_api) == failure
+
+
+def test_defaults_match_the_old_fixed_retries():
+    for failure in retry_policy.FAILURES:
+        policy = retry_policy.RetryPolicies().policy("3W_Diagnostics", "Battery_SOC", failure)
+        expected_delay = 0 if failure == retry_policy.BUS_ERROR else 2
+        assert (policy.attempts, policy.delay, policy.backoff, policy.jitter) == (3, expected_delay, 1, 0)
+
+
+def test_most_specific_policy_wins_and_inherits_missing_fields():
+    policies = retry_policy.RetryPolicies({
+        "no_frame": "4, 1, 2, 0.1",
+        "TPMS.no_frame": "2",
+        "WRITE_TPMS_FRONT.no_frame": ", 0.5",
+    })
+    lookup = lambda library, step, overrides=None: repr(policies.policy(library, step, "no_frame", overrides))
+    assert lookup("3W_Diagnostics", "VCU_Presence") == "4, 1, 2, 0.1"
+    assert lookup("TPMS", "WRITE_TPMS_REAR") == "2, 1, 2, 0.1"
+    assert lookup("TPMS", "WRITE_TPMS_FRONT") == "2, 0.5, 2, 0.1"
+    # The SKU sheet cell overrides them all
+    assert lookup("TPMS", "WRITE_TPMS_FRONT", {"no_frame": "1"}) == "1, 0.5, 2, 0.1"
+    # Other classes keep the defaults
+    assert repr(policies.policy("TPMS", "WRITE_TPMS_FRONT", "mismatch")) == "3, 2, 1, 0"
+
+
+def test_parse_overrides_skips_unknown_classes():
+    assert retry_policy.parse_overrides("no_frame=2, 0.5; bogus=1; mismatch=1;;") == {
+        "no_frame": "2, 0.5", "mismatch": "1",
+    }
+    assert retry_policy.parse_overrides("") == {}
+
+
+def test_policy_bounds_and_backoff():
+    policy = retry_policy.Policy(attempts=0, delay=-1, backoff=2, jitter=5)
+    assert policy.attempts == 1 and policy.delay == 0 and policy.jitter == 1
+    policy = retry_policy.Policy(delay=0.5, backoff=2)
+    assert [policy.wait(n) for n in (1, 2, 3)] == [0.5, 1.0, 2.0]
+    jittered = retry_policy.Policy(delay=1, jitter=0.2)
+    assert all(0.8 <= jittered.wait(1) <= 1.2 for _ in range(100))
+
+
+def test_load_reads_the_section_case_insensitively(tmp_path):
+    ini = tmp_path / "station.ini"
+    ini.write_text(
+        "[SETTINGS]\nactive_library = TPMS\n\n"
+        "[RETRY_POLICY]\n; comment\nTPMS.No_Frame = 1\nmystery = 2\n"
+    )
+    policies = retry_policy.load(str(ini))
+    assert policies.policy("TPMS", "API_CALL", "no_frame").attempts == 1
+    assert retry_policy.load(str(tmp_path / "missing.ini")).settings == {}
+
+
+def test_shipped_station_ini_keeps_the_defaults():
+    policies = retry_policy.load(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "station.ini"))
+    assert policies.settings == {}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Pass/fail verdict of one test step from its StepResult and the SKU limits.
+
+Shared by the station and the offline replay so both judge a result the
+same way.
+"""
+
+import step_result
+
+
+def evaluate(test_name, result, expected_value="", lsl="", usl=""):
+    """Judge one step_result.StepResult by the check its step registered.
+
+    Returns (passed, actual_value, api_expected, note). api_expected is the
+    expected value the step looked up itself (e.g. from the API), else None;
+    note is an operator message for the instruction box (else None).
+    """
+    if not isinstance(result, step_result.StepResult):
+        raise TypeError(f"{test_name} returned {type(result).__name__}, not a StepResult")
+    passed = result.passed
+    actual_value = result.actual
+    api_expected = None if result.expected is None else str(result.expected)
+    note = None
+    if result.check == step_result.CHECK_VALUE:
+        passed = passed and str(actual_value) == expected_value
+    elif result.check == step_result.CHECK_LIMITS:
+        try:
+            actual_value_float = float(actual_value)
+            lsl_float = float(lsl) if lsl not in (None, "", "N/A") else float('-inf')
+            usl_float = float(usl) if usl not in (None, "", "N/A") else float('inf')
+            passed = passed and (lsl_float <= actual_value_float <= usl_float)
+            if not passed:
+                note = f"{test_name} failed: Actual value {actual_value} is outside limits (LSL: {lsl}, USL: {usl})"
+        except (TypeError, ValueError):
+            note = f"{test_name} failed: Invalid value format (Actual: {actual_value}, LSL: {lsl}, USL: {usl})"
+            actual_value = "Error"
+            passed = False
+    return passed, actual_value, api_expected, note